@@ -0,0 +1,145 @@
+"""对话上下文压缩 — 控制长运行中每次请求的 prompt 大小
+
+每一步都把完整的工具结果（动辄数千行的表格或大段 JSON）追加到 messages，prompt 随步数
+二次增长。ContextCompactor 在每次请求前生成发送用的视图，messages 本身（对话日志）不变:
+    - 只保留最近 keep_raw 个工具结果的原文
+    - 更早且超过 digest_chars 的结果替换为摘要：JSON 保留结构，长列表与多行文本
+      （DataFrame 等表格）只留表头、前几行样本与末行，并注明省略了多少
+    - 估算总 token 数仍超过 budget 时，从最早的工具结果开始替换为一行占位，
+      最后才截断最近的结果
+
+同一条消息的摘要只计算一次且结果确定，已压缩的前缀在后续步骤中保持不变，不影响前缀缓存。
+
+环境变量: LLM_CONTEXT_KEEP_RAW（默认 3）、LLM_CONTEXT_DIGEST_CHARS（默认 2000）、
+LLM_CONTEXT_BUDGET（估算 token 数，默认 100000，0 表示不限）。
+"""
+
+import json
+import os
+
+from llm.ratelimit import message_tokens
+
+KEEP_RAW = int(os.getenv("LLM_CONTEXT_KEEP_RAW", "3"))
+DIGEST_CHARS = int(os.getenv("LLM_CONTEXT_DIGEST_CHARS", "2000"))
+TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_BUDGET", "100000"))
+
+HEAD_LINES = 8
+TAIL_LINES = 2
+HEAD_ITEMS = 5
+MAX_STRING = 500
+
+# 工具结果的前缀（text 模式中以 user 消息返回）
+_RESULT_PREFIXES = ("Tool result:\n", "工具执行结果:\n")
+
+
+def digest_text(text: str) -> str:
+    """把一段多行文本压缩为表头 + 前几行 + 末行，并注明省略的行数。"""
+    lines = text.splitlines()
+    if len(lines) <= HEAD_LINES + TAIL_LINES + 1:
+        if len(text) <= MAX_STRING * 4:
+            return text
+        return f"{text[:MAX_STRING * 2]}\n[... {len(text) - MAX_STRING * 3} chars omitted ...]\n{text[-MAX_STRING:]}"
+    omitted = len(lines) - HEAD_LINES - TAIL_LINES
+    return "\n".join([
+        *lines[:HEAD_LINES],
+        f"[... {omitted} of {len(lines)} lines omitted ...]",
+        *lines[-TAIL_LINES:],
+    ])
+
+
+def _digest_value(value):
+    if isinstance(value, str):
+        return digest_text(value) if len(value) > MAX_STRING else value
+    if isinstance(value, dict):
+        return {k: _digest_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if len(value) <= HEAD_ITEMS + 1:
+            return [_digest_value(v) for v in value]
+        return [
+            *(_digest_value(v) for v in value[:HEAD_ITEMS]),
+            f"[... {len(value) - HEAD_ITEMS - 1} of {len(value)} items omitted ...]",
+            _digest_value(value[-1]),
+        ]
+    return value
+
+
+def digest_result(content: str) -> str:
+    """工具结果的摘要：JSON 按结构压缩（保留所有键），其他文本按行压缩。"""
+    prefix = next((p for p in _RESULT_PREFIXES if content.startswith(p)), "")
+    body = content[len(prefix):]
+    try:
+        value = json.loads(body)
+    except ValueError:
+        digest = digest_text(body)
+    else:
+        digest = json.dumps(_digest_value(value), ensure_ascii=False, default=str)
+    return f"{prefix}[digest of an earlier {len(body)}-char result]\n{digest}"
+
+
+def _stub(content: str) -> str:
+    prefix = next((p for p in _RESULT_PREFIXES if content.startswith(p)), "")
+    first = content[len(prefix):].lstrip().split("\n", 1)[0][:120]
+    return f"{prefix}[earlier result omitted to fit the context budget; it began: {first}]"
+
+
+def _truncate(content: str, tokens: int) -> str:
+    """把内容截到约 tokens 个 token（保留开头与结尾）。"""
+    keep = max(tokens, 50) * 3  # 按较保守的 3 字符 / token 换算
+    if len(content) <= keep:
+        return content
+    head = keep * 3 // 4
+    return f"{content[:head]}\n[... {len(content) - keep} chars truncated to fit the context budget ...]\n{content[-(keep - head):]}"
+
+
+class ContextCompactor:
+    """一次智能体运行的上下文视图；每次请求前调用 compact(messages)。
+
+    messages[0] 为 system、messages[1] 为任务描述，之后的 user / tool 消息都是工具结果。
+    """
+
+    def __init__(self, keep_raw: int = KEEP_RAW, digest_chars: int = DIGEST_CHARS, budget: int = TOKEN_BUDGET):
+        self.keep_raw = keep_raw
+        self.digest_chars = digest_chars
+        self.budget = budget
+        self._digests: dict[int, str] = {}  # 消息下标 → 摘要
+        self.compacted = 0  # 最近一次 compact 中被替换的消息数
+
+    def _digest(self, index: int, content: str) -> str:
+        digest = self._digests.get(index)
+        if digest is None:
+            digest = self._digests[index] = digest_result(content)
+        return digest
+
+    def compact(self, messages: list[dict]) -> list[dict]:
+        """返回发送用的消息列表；未改动的消息与原列表共享同一个 dict。"""
+        results = [
+            i for i in range(2, len(messages))
+            if messages[i]["role"] in ("user", "tool") and isinstance(messages[i].get("content"), str)
+        ]
+        view = list(messages)
+        old = results[:-self.keep_raw] if self.keep_raw > 0 else results
+        for i in old:
+            content = messages[i]["content"]
+            if len(content) > self.digest_chars:
+                view[i] = {**messages[i], "content": self._digest(i, content)}
+
+        if self.budget > 0:
+            self._fit_budget(view, messages, results)
+        self.compacted = sum(1 for sent, original in zip(view, messages) if sent is not original)
+        return view
+
+    def _fit_budget(self, view: list[dict], messages: list[dict], results: list[int]) -> None:
+        """估算总量超出预算时，从最早的工具结果开始替换为占位，最后截断最近的结果。"""
+        sizes = [message_tokens(m) for m in view]
+        total = sum(sizes)
+        for i in results:
+            if total <= self.budget:
+                return
+            if i == results[-1]:
+                content = _truncate(view[i]["content"], sizes[i] - (total - self.budget))
+            else:
+                content = _stub(view[i]["content"])
+            view[i] = {**messages[i], "content": content}
+            size = message_tokens(view[i])
+            total += size - sizes[i]
+            sizes[i] = size
@@ -1,14 +1,36 @@
-"""ExcelAgent 核心 — 智能体主循环"""
+"""ExcelAgent 核心 — 智能体主循环
 
+run / run_benchmark 为同步版本；run_async / run_benchmark_async 等待 LLM 时不占用线程，
+工具在线程池中执行，一个进程即可驱动大量并发会话。
+
+两种工具调用模式（tool_mode 参数，默认取环境变量 LLM_TOOL_MODE）:
+    - text: 工具列表写在 system prompt 中，从回复的 ```tool_call``` 块解析调用，每步一个工具
+    - native: 通过 OpenAI tools 接口传 JSON Schema，一轮可返回多个调用，
+      操作不同文件的调用并发执行；参数 JSON 无效时把错误作为该调用的结果返回给模型
+"""
+
+import asyncio
+import functools
 import json
 import os
+import random
 import re
 import time
 
 from openai import APIError, APITimeoutError, RateLimitError
 
-from llm.client import chat, DEFAULT_MODEL
-from agent.dispatcher import dispatch, get_tools_description
+from llm.client import achat, achat_stream, achat_with_tools, chat, chat_stream, chat_with_tools, DEFAULT_MODEL
+from agent.context import ContextCompactor
+from agent.serialize import render_result
+from agent.dispatcher import (
+    adispatch,
+    adispatch_many,
+    dispatch,
+    dispatch_many,
+    get_tool_schemas,
+    get_tools_description,
+)
+from tools.session import workbook_session
 
 SYSTEM_PROMPT = """你是 ExcelAgent，一个专业的 Excel 操作智能体。
 
@@ -30,7 +52,25 @@ SYSTEM_PROMPT = """你是 ExcelAgent，一个专业的 Excel 操作智能体。
 4. 完成后说明：操作完成后告知用户结果
 """
 
+SYSTEM_PROMPT_NATIVE = """你是 ExcelAgent，一个专业的 Excel 操作智能体。
+
+你可以通过调用工具来读取、创建、编辑和分析 Excel 文件。
+
+## 规则
+1. 公式优先：始终使用 Excel 公式，不硬编码计算结果
+2. 先读取再修改：修改文件前先读取了解结构
+3. 互不依赖的工具调用可以在同一轮中一起发出（例如同时读取多个文件），依赖前一步结果的调用等结果返回后再发
+4. 完成后说明：操作完成后告知用户结果
+"""
+
 TOOL_CALL_PATTERN = re.compile(r"```tool_call\s*\n(.+?)\n```", re.DOTALL)
+TOOL_CALL_OPEN = "```tool_call"
+TOOL_CALL_CLOSE = "\n```"
+
+# 流式接收回复，第一个 tool_call 块闭合即取消生成（规则 3：每步只调用一个工具）
+STREAM_RESPONSES = os.getenv("LLM_STREAM", "1") != "0"
+
+TOOL_MODE = os.getenv("LLM_TOOL_MODE", "text")
 
 
 def parse_tool_call(text: str) -> dict | None:
@@ -44,8 +84,56 @@ def parse_tool_call(text: str) -> dict | None:
         return None
 
 
+def extract_tool_calls(message: dict) -> list[dict]:
+    """从一条 assistant 消息中取出全部工具调用 [{"tool", "args"}]，两种模式通用。
+
+    native 模式下参数 JSON 无效的调用，args 为原始字符串。
+    """
+    if message.get("tool_calls"):
+        calls = []
+        for call in message["tool_calls"]:
+            try:
+                args = json.loads(call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError:
+                args = call["function"]["arguments"]
+            calls.append({"tool": call["function"]["name"], "args": args})
+        return calls
+    tool_call = parse_tool_call(message.get("content") or "")
+    return [tool_call] if tool_call else []
+
+
+class _ToolCallCutter:
+    """逐段累积流式回复，检测到第一个完整的 tool_call 块时把 text 截断到块末尾。
+
+    只在新到达的片段附近查找开闭标记，长回复下每个片段的开销与片段长度成正比。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._open = -1
+
+    def feed(self, piece: str) -> bool:
+        """追加片段；tool_call 块已完整时返回 True。"""
+        tail = max(0, len(self.text) - len(TOOL_CALL_OPEN))
+        self.text += piece
+        if self._open < 0:
+            self._open = self.text.find(TOOL_CALL_OPEN, tail)
+            if self._open < 0:
+                return False
+            tail = self._open + len(TOOL_CALL_OPEN)
+        pos = max(tail - len(TOOL_CALL_CLOSE), self._open + len(TOOL_CALL_OPEN))
+        while (close := self.text.find(TOOL_CALL_CLOSE, pos)) >= 0:
+            end = close + len(TOOL_CALL_CLOSE)
+            if TOOL_CALL_PATTERN.fullmatch(self.text, self._open, end):
+                self.text = self.text[:end]
+                return True
+            pos = close + 1
+        return False
+
+
+@functools.cache
 def load_xlsx_skill() -> str:
-    """加载完整的 xlsx SKILL.md 内容。"""
+    """加载完整的 xlsx SKILL.md 内容（每个进程只读一次）。"""
     skill_path = os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
         "skills",
@@ -56,7 +144,29 @@ def load_xlsx_skill() -> str:
         return f.read()
 
 
-def run(user_input: str, file_path: str | None = None, max_steps: int = 10, model: str | None = None) -> str:
+@functools.cache
+def _system_prompt(native: bool) -> str:
+    return SYSTEM_PROMPT_NATIVE if native else SYSTEM_PROMPT.format(tools=get_tools_description())
+
+
+def _initial_messages(user_input: str, file_path: str | None, native: bool = False) -> list[dict]:
+    messages = [{"role": "system", "content": _system_prompt(native)}]
+
+    # 构建初始用户消息
+    content = user_input
+    if file_path:
+        content += f"\n\n目标文件: {file_path}"
+    messages.append({"role": "user", "content": content})
+    return messages
+
+
+def run(
+    user_input: str,
+    file_path: str | None = None,
+    max_steps: int = 10,
+    model: str | None = None,
+    tool_mode: str | None = None,
+) -> str:
     """运行智能体处理用户请求。
 
     Args:
@@ -64,49 +174,42 @@ def run(user_input: str, file_path: str | None = None, max_steps: int = 10, mode
         file_path: 关联的 Excel 文件路径（可选）
         max_steps: 最大工具调用轮次
         model: LLM 模型ID
+        tool_mode: "text" 或 "native"，默认取 LLM_TOOL_MODE
 
     Returns:
         最终回复文本
     """
-    system = SYSTEM_PROMPT.format(tools=get_tools_description())
+    if _is_native(tool_mode):
+        messages = _initial_messages(user_input, file_path, native=True)
+        return _run_native(messages, max_steps, model, verbose=True)[0]
 
-    messages = [{"role": "system", "content": system}]
+    messages = _initial_messages(user_input, file_path)
 
-    # 构建初始用户消息
-    content = user_input
-    if file_path:
-        content += f"\n\n目标文件: {file_path}"
-    messages.append({"role": "user", "content": content})
+    context = ContextCompactor()
+    # 同一次运行内的工具调用共享已加载的工作簿，结束时统一写回
+    with workbook_session():
+        for step in range(max_steps):
+            response = _chat_with_retry(context.compact(messages), model=model)
+            messages.append({"role": "assistant", "content": response})
 
-    for step in range(max_steps):
-        response = chat(messages, model=model)
-        messages.append({"role": "assistant", "content": response})
+            # 尝试解析工具调用
+            tool_call = parse_tool_call(response)
+            if not tool_call:
+                # 没有工具调用，智能体已完成
+                return response
 
-        # 尝试解析工具调用
-        tool_call = parse_tool_call(response)
-        if not tool_call:
-            # 没有工具调用，智能体已完成
-            return response
+            # 执行工具
+            tool_name = tool_call["tool"]
+            args = tool_call.get("args", {})
 
-        # 执行工具
-        tool_name = tool_call["tool"]
-        args = tool_call.get("args", {})
+            print(f"[Step {step + 1}] 调用工具: {tool_name}({args})")
 
-        print(f"[Step {step + 1}] 调用工具: {tool_name}({args})")
+            try:
+                result_str = _result_to_str(dispatch(tool_name, **args))
+            except Exception as e:
+                result_str = f"错误: {e}"
 
-        try:
-            result = dispatch(tool_name, **args)
-            # 将结果转为字符串
-            if hasattr(result, "to_string"):
-                result_str = result.to_string()
-            elif isinstance(result, dict):
-                result_str = json.dumps(result, ensure_ascii=False, default=str, indent=2)
-            else:
-                result_str = str(result)
-        except Exception as e:
-            result_str = f"错误: {e}"
-
-        messages.append({"role": "user", "content": f"工具执行结果:\n{result_str}"})
+            messages.append({"role": "user", "content": f"工具执行结果:\n{result_str}"})
 
     return messages[-1]["content"] if messages else "达到最大步数限制"
 
@@ -141,30 +244,108 @@ When you need to use a tool, output the following JSON block:
 6. When finished, state that the task is complete (do NOT output a tool_call block).
 """
 
+BENCHMARK_NATIVE_SYSTEM_PROMPT = """You are ExcelAgent, a professional Excel manipulation agent.
+
+You manipulate Excel files by calling tools. You will receive a spreadsheet manipulation task.
+
+# xlsx SKILL - Professional Excel Guidelines
+
+{xlsx_skill}
+
+## Additional Benchmark Rules
+1. Read the file first to understand its structure (use read_excel or get_summary).
+2. Use Excel formulas when appropriate (write them as strings starting with =).
+3. Focus on writing correct values/formulas to the answer_position cells.
+4. Independent tool calls may be issued together in one turn; calls that depend on an earlier result must wait for it.
+5. For complex operations that predefined tools cannot handle, use run_python to execute arbitrary Python code.
+6. When finished, state that the task is complete without calling any tool.
+"""
+
 MAX_RETRIES = 3
+MAX_RATE_LIMIT_RETRIES = 8  # 429 的重试由限流器排队，代价小，允许更多次
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """429 由 llm.ratelimit.LIMITER 按 Retry-After 暂停该模型，这里立即重新排队；
+    其余 API 错误按指数退避并加全量抖动，避免并发会话同时重试。"""
+    if isinstance(error, RateLimitError):
+        return 0.0
+    return random.uniform(0, 2 ** (attempt + 1))
+
+
+def _max_attempts(error: Exception) -> int:
+    return MAX_RATE_LIMIT_RETRIES if isinstance(error, RateLimitError) else MAX_RETRIES
+
+
+def _stream_until_tool_call(messages: list[dict], model: str | None = None) -> str:
+    """流式获取回复，tool_call 块一闭合就关闭流，省去其后的生成时间与输出 token。"""
+    cutter = _ToolCallCutter()
+    chunks = chat_stream(messages, model=model)
+    try:
+        for piece in chunks:
+            if cutter.feed(piece):
+                break
+    finally:
+        chunks.close()
+    if not cutter.text:
+        raise ValueError("LLM returned None content")
+    return cutter.text
 
 
 def _chat_with_retry(messages: list[dict], model: str | None = None) -> str:
     """调用 LLM 并在遇到 API 错误时自动重试。"""
-    for attempt in range(MAX_RETRIES):
+    complete = _stream_until_tool_call if STREAM_RESPONSES else chat
+    return _call_with_retry(complete, messages, model=model)
+
+
+def _call_with_retry(complete, *args, **kwargs):
+    attempt = 0
+    while True:
         try:
-            return chat(messages, model=model)
+            return complete(*args, **kwargs)
         except (APIError, APITimeoutError, RateLimitError) as e:
-            if attempt < MAX_RETRIES - 1:
-                wait = 2 ** (attempt + 1)
-                print(f"  API error (attempt {attempt + 1}/{MAX_RETRIES}), retrying in {wait}s: {e}")
-                time.sleep(wait)
-            else:
+            attempt += 1
+            if attempt >= _max_attempts(e):
                 raise
+            wait = _retry_delay(e, attempt - 1)
+            print(f"  API error (attempt {attempt}/{_max_attempts(e)}), retrying in {wait:.1f}s: {e}")
+            time.sleep(wait)
 
 
 def _result_to_str(result) -> str:
-    """将工具返回值转为字符串。"""
-    if hasattr(result, "to_string"):
-        return result.to_string()
-    if isinstance(result, dict):
-        return json.dumps(result, ensure_ascii=False, default=str, indent=2)
-    return str(result)
+    """将工具返回值转为字符串（大表只保留摘要与首尾行，见 agent.serialize）。"""
+    return render_result(result)
+
+
+@functools.cache
+def _benchmark_system_prompt(native: bool) -> str:
+    """每个进程只构建一次；各任务、各步发送完全相同的字符串，服务端的前缀缓存才能命中。"""
+    if native:
+        return BENCHMARK_NATIVE_SYSTEM_PROMPT.format(xlsx_skill=load_xlsx_skill())
+    return BENCHMARK_SYSTEM_PROMPT.format(
+        tools=get_tools_description(),
+        xlsx_skill=load_xlsx_skill()
+    )
+
+
+def _benchmark_messages(
+    instruction: str,
+    file_path: str,
+    instruction_type: str,
+    answer_position: str,
+    native: bool = False,
+) -> list[dict]:
+    messages: list[dict] = [{"role": "system", "content": _benchmark_system_prompt(native)}]
+
+    user_content = (
+        f"## Task\n\n"
+        f"### instruction\n{instruction}\n\n"
+        f"### file_path (modify this file in place)\n{file_path}\n\n"
+        f"### instruction_type\n{instruction_type}\n\n"
+        f"### answer_position\n{answer_position}\n"
+    )
+    messages.append({"role": "user", "content": user_content})
+    return messages
 
 
 def run_benchmark(
@@ -174,6 +355,8 @@ def run_benchmark(
     answer_position: str,
     max_steps: int = 15,
     model: str | None = None,
+    verbose: bool = True,
+    tool_mode: str | None = None,
 ) -> tuple[str, list[dict]]:
     """在 SpreadsheetBench 任务上运行智能体。
 
@@ -184,43 +367,292 @@ def run_benchmark(
         answer_position: 答案所在单元格范围
         max_steps: 最大工具调用轮次
         model: LLM 模型 ID
+        verbose: 是否打印每一步的工具调用（并发运行时关闭，避免输出交错）
+        tool_mode: "text" 或 "native"，默认取 LLM_TOOL_MODE
 
     Returns:
         (final_response, full_messages) 元组
     """
-    system = BENCHMARK_SYSTEM_PROMPT.format(
-        tools=get_tools_description(),
-        xlsx_skill=load_xlsx_skill()
-    )
-    messages: list[dict] = [{"role": "system", "content": system}]
+    native = _is_native(tool_mode)
+    messages = _benchmark_messages(instruction, file_path, instruction_type, answer_position, native)
+    if native:
+        return _run_native(messages, max_steps, model, verbose)
+
+    context = ContextCompactor()
+    # 同一次运行内的工具调用共享已加载的工作簿，结束时统一写回
+    with workbook_session():
+        for step in range(max_steps):
+            response = _chat_with_retry(context.compact(messages), model=model)
+            messages.append({"role": "assistant", "content": response})
+
+            tool_call = parse_tool_call(response)
+            if not tool_call:
+                return response, messages
+
+            tool_name = tool_call["tool"]
+            args = tool_call.get("args", {})
+            if verbose:
+                print(f"  [Step {step + 1}] {tool_name}({args})")
+
+            try:
+                result = dispatch(tool_name, **args)
+                result_str = _result_to_str(result)
+            except Exception as e:
+                result_str = f"Error: {e}"
+
+            messages.append({"role": "user", "content": f"Tool result:\n{result_str}"})
 
-    user_content = (
-        f"## Task\n\n"
-        f"### instruction\n{instruction}\n\n"
-        f"### file_path (modify this file in place)\n{file_path}\n\n"
-        f"### instruction_type\n{instruction_type}\n\n"
-        f"### answer_position\n{answer_position}\n"
-    )
-    messages.append({"role": "user", "content": user_content})
+    return messages[-1]["content"], messages
+
+
+# ---------------------------------------------------------------------------
+# 原生 function calling 模式
+# ---------------------------------------------------------------------------
 
-    for step in range(max_steps):
-        response = _chat_with_retry(messages, model=model)
-        messages.append({"role": "assistant", "content": response})
 
-        tool_call = parse_tool_call(response)
-        if not tool_call:
-            return response, messages
+def _is_native(tool_mode: str | None) -> bool:
+    mode = tool_mode or TOOL_MODE
+    if mode not in ("text", "native"):
+        raise ValueError(f"未知的 tool_mode: {mode}，可用: text, native")
+    return mode == "native"
 
-        tool_name = tool_call["tool"]
-        args = tool_call.get("args", {})
+
+def _assistant_message(message) -> dict:
+    """把 SDK 返回的 assistant 消息转为可回传、可写入日志的 dict。"""
+    entry = {"role": "assistant", "content": message.content}
+    tool_calls = [
+        {
+            "id": call.id,
+            "type": "function",
+            "function": {"name": call.function.name, "arguments": call.function.arguments},
+        }
+        for call in message.tool_calls or ()
+        if getattr(call, "function", None) is not None
+    ]
+    if tool_calls:
+        entry["tool_calls"] = tool_calls
+    return entry
+
+
+def _decode_calls(tool_calls: list[dict]) -> tuple[list, list[tuple[str, dict]]]:
+    """解析各调用的参数 JSON。
+
+    Returns:
+        (outcomes, runnable)：参数无效的调用在 outcomes 中直接填入异常，其余位置为 None，
+        按顺序对应 runnable 中待执行的 (tool_name, kwargs)
+    """
+    outcomes: list = []
+    runnable: list[tuple[str, dict]] = []
+    for call in tool_calls:
+        name = call["function"]["name"]
+        try:
+            args = json.loads(call["function"]["arguments"] or "{}")
+            if not isinstance(args, dict):
+                raise ValueError("arguments must be a JSON object")
+        except ValueError as e:
+            outcomes.append(ValueError(f"invalid arguments for {name}: {e}"))
+            continue
+        outcomes.append(None)
+        runnable.append((name, args))
+    return outcomes, runnable
+
+
+def _tool_messages(tool_calls: list[dict], outcomes: list, results: list) -> list[dict]:
+    results = iter(results)
+    messages = []
+    for call, outcome in zip(tool_calls, outcomes):
+        if outcome is None:
+            outcome = next(results)
+        content = f"Error: {outcome}" if isinstance(outcome, Exception) else _result_to_str(outcome)
+        messages.append({"role": "tool", "tool_call_id": call["id"], "content": content})
+    return messages
+
+
+def _log_calls(step: int, runnable: list[tuple[str, dict]]) -> None:
+    for tool_name, args in runnable:
         print(f"  [Step {step + 1}] {tool_name}({args})")
 
+
+def _run_native(
+    messages: list[dict],
+    max_steps: int,
+    model: str | None,
+    verbose: bool,
+) -> tuple[str, list[dict]]:
+    """native 模式的主循环；每一轮执行模型返回的全部工具调用。"""
+    tools = get_tool_schemas()
+    context = ContextCompactor()
+    with workbook_session():
+        for step in range(max_steps):
+            message = _call_with_retry(chat_with_tools, context.compact(messages), tools, model=model)
+            entry = _assistant_message(message)
+            messages.append(entry)
+
+            tool_calls = entry.get("tool_calls")
+            if not tool_calls:
+                return entry["content"] or "", messages
+
+            outcomes, runnable = _decode_calls(tool_calls)
+            if verbose:
+                _log_calls(step, runnable)
+            messages.extend(_tool_messages(tool_calls, outcomes, dispatch_many(runnable)))
+
+    return messages[-1]["content"], messages
+
+
+# ---------------------------------------------------------------------------
+# 异步版本
+# ---------------------------------------------------------------------------
+
+
+async def _astream_until_tool_call(messages: list[dict], model: str | None = None) -> str:
+    """_stream_until_tool_call 的异步版本。"""
+    cutter = _ToolCallCutter()
+    chunks = achat_stream(messages, model=model)
+    try:
+        async for piece in chunks:
+            if cutter.feed(piece):
+                break
+    finally:
+        await chunks.aclose()
+    if not cutter.text:
+        raise ValueError("LLM returned None content")
+    return cutter.text
+
+
+async def _achat_with_retry(messages: list[dict], model: str | None = None) -> str:
+    """_chat_with_retry 的异步版本，退避期间让出事件循环。"""
+    complete = _astream_until_tool_call if STREAM_RESPONSES else achat
+    return await _acall_with_retry(complete, messages, model=model)
+
+
+async def _acall_with_retry(complete, *args, **kwargs):
+    attempt = 0
+    while True:
         try:
-            result = dispatch(tool_name, **args)
-            result_str = _result_to_str(result)
-        except Exception as e:
-            result_str = f"Error: {e}"
+            return await complete(*args, **kwargs)
+        except (APIError, APITimeoutError, RateLimitError) as e:
+            attempt += 1
+            if attempt >= _max_attempts(e):
+                raise
+            wait = _retry_delay(e, attempt - 1)
+            print(f"  API error (attempt {attempt}/{_max_attempts(e)}), retrying in {wait:.1f}s: {e}")
+            await asyncio.sleep(wait)
+
+
+async def run_async(
+    user_input: str,
+    file_path: str | None = None,
+    max_steps: int = 10,
+    model: str | None = None,
+    tool_mode: str | None = None,
+) -> str:
+    """run() 的异步版本。"""
+    if _is_native(tool_mode):
+        messages = _initial_messages(user_input, file_path, native=True)
+        return (await _arun_native(messages, max_steps, model, verbose=True))[0]
+
+    messages = _initial_messages(user_input, file_path)
+
+    context = ContextCompactor()
+    # 每个 asyncio 任务有独立的上下文，会话互不共享
+    with workbook_session() as session:
+        for step in range(max_steps):
+            response = await _achat_with_retry(context.compact(messages), model=model)
+            messages.append({"role": "assistant", "content": response})
+
+            tool_call = parse_tool_call(response)
+            if not tool_call:
+                await asyncio.to_thread(session.checkpoint)
+                return response
+
+            tool_name = tool_call["tool"]
+            args = tool_call.get("args", {})
+
+            print(f"[Step {step + 1}] 调用工具: {tool_name}({args})")
+
+            try:
+                result_str = _result_to_str(await adispatch(tool_name, **args))
+            except Exception as e:
+                result_str = f"错误: {e}"
+
+            messages.append({"role": "user", "content": f"工具执行结果:\n{result_str}"})
+
+        # 写回放到线程池，退出会话时只剩关闭工作簿
+        await asyncio.to_thread(session.checkpoint)
+
+    return messages[-1]["content"] if messages else "达到最大步数限制"
+
 
-        messages.append({"role": "user", "content": f"Tool result:\n{result_str}"})
+async def run_benchmark_async(
+    instruction: str,
+    file_path: str,
+    instruction_type: str,
+    answer_position: str,
+    max_steps: int = 15,
+    model: str | None = None,
+    verbose: bool = True,
+    tool_mode: str | None = None,
+) -> tuple[str, list[dict]]:
+    """run_benchmark() 的异步版本。"""
+    native = _is_native(tool_mode)
+    messages = _benchmark_messages(instruction, file_path, instruction_type, answer_position, native)
+    if native:
+        return await _arun_native(messages, max_steps, model, verbose)
+
+    context = ContextCompactor()
+    with workbook_session() as session:
+        for step in range(max_steps):
+            response = await _achat_with_retry(context.compact(messages), model=model)
+            messages.append({"role": "assistant", "content": response})
+
+            tool_call = parse_tool_call(response)
+            if not tool_call:
+                await asyncio.to_thread(session.checkpoint)
+                return response, messages
+
+            tool_name = tool_call["tool"]
+            args = tool_call.get("args", {})
+            if verbose:
+                print(f"  [Step {step + 1}] {tool_name}({args})")
+
+            try:
+                result_str = _result_to_str(await adispatch(tool_name, **args))
+            except Exception as e:
+                result_str = f"Error: {e}"
+
+            messages.append({"role": "user", "content": f"Tool result:\n{result_str}"})
+
+        await asyncio.to_thread(session.checkpoint)
+
+    return messages[-1]["content"], messages
+
+
+async def _arun_native(
+    messages: list[dict],
+    max_steps: int,
+    model: str | None,
+    verbose: bool,
+) -> tuple[str, list[dict]]:
+    """_run_native() 的异步版本。"""
+    tools = get_tool_schemas()
+    context = ContextCompactor()
+    with workbook_session() as session:
+        for step in range(max_steps):
+            message = await _acall_with_retry(achat_with_tools, context.compact(messages), tools, model=model)
+            entry = _assistant_message(message)
+            messages.append(entry)
+
+            tool_calls = entry.get("tool_calls")
+            if not tool_calls:
+                await asyncio.to_thread(session.checkpoint)
+                return entry["content"] or "", messages
+
+            outcomes, runnable = _decode_calls(tool_calls)
+            if verbose:
+                _log_calls(step, runnable)
+            messages.extend(_tool_messages(tool_calls, outcomes, await adispatch_many(runnable)))
+
+        await asyncio.to_thread(session.checkpoint)
 
     return messages[-1]["content"], messages
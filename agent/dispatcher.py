@@ -1,6 +1,16 @@
 """Skill 调度器 — 根据用户意图分发到对应工具函数"""
 
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import types
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
 from tools import reader, writer, formatter, analyzer, code_executor
+from tools.session import checkpoint, discard
 
 
 # 注册可用的工具函数
@@ -15,10 +25,16 @@ TOOL_REGISTRY = {
         "description": "读取Excel中的公式",
         "params": ["file_path", "sheet_name"],
     },
+    "read_range": {
+        "fn": reader.read_range,
+        "description": "分页读取指定 A1 区域的单元格值（如 cell_range=\"A22:F121\"）；大表结果被截断时按提示读取后续行，"
+                       "单次最多 2000 个单元格，返回 next_range 用于继续读取",
+        "params": ["file_path", "sheet_name", "cell_range"],
+    },
     "get_summary": {
         "fn": reader.get_summary,
-        "description": "生成Excel文件摘要",
-        "params": ["file_path"],
+        "description": "生成Excel文件摘要（大文件或指定 row_budget 时流式统计）",
+        "params": ["file_path", "row_budget"],
     },
     "create_workbook": {
         "fn": writer.create_workbook,
@@ -27,9 +43,21 @@ TOOL_REGISTRY = {
     },
     "write_cells": {
         "fn": writer.write_cells,
-        "description": "写入单元格数据",
+        "description": "写入单元格数据。cells 每项可为 {cell, value}、{range, values}（二维数组或列向量）"
+                       "或 {range, formula}（公式模板按相对引用向下/向右填充），一次调用可写入整块区域",
         "params": ["file_path", "sheet_name", "cells"],
     },
+    "fill_formula": {
+        "fn": writer.fill_formula,
+        "description": "像Excel填充柄一样把一个公式填充到整个区域（相对引用自动平移，$绝对引用不变），"
+                       "例如 target_range=\"D2:D500\", formula=\"=B2*C2\"；无需逐个单元格写公式",
+        "params": ["file_path", "sheet_name", "target_range", "formula", "anchor"],
+    },
+    "calculate_cells": {
+        "fn": reader.calculate_cells,
+        "description": "写入公式后立即查看区域的计算结果（原生公式引擎增量重算，毫秒级，无需 LibreOffice）",
+        "params": ["file_path", "sheet_name", "cell_range"],
+    },
     "apply_number_format": {
         "fn": writer.apply_number_format,
         "description": "应用数字格式",
@@ -68,8 +96,16 @@ TOOL_REGISTRY = {
 }
 
 
+# 通过 tools.session 修改工作簿的工具；执行前写回此前的修改，失败时只撤销本次调用
+WRITE_TOOLS = frozenset({
+    "create_workbook", "write_cells", "fill_formula", "apply_number_format",
+    "auto_fit", "apply_header_style", "add_borders",
+})
+
+
+@functools.cache
 def get_tools_description() -> str:
-    """生成工具列表描述，用于 LLM system prompt。"""
+    """生成工具列表描述，用于 LLM system prompt（TOOL_REGISTRY 在导入后不变，只生成一次）。"""
     lines = ["可用工具:"]
     for name, info in TOOL_REGISTRY.items():
         params = ", ".join(info["params"])
@@ -77,10 +113,146 @@ def get_tools_description() -> str:
     return "\n".join(lines)
 
 
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", list: "array", dict: "object"}
+
+
+def _annotation_schema(annotation) -> dict:
+    """把函数参数的类型注解转换为 JSON Schema（X | None 视为 X，可省略由 required 表达）。"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType):
+        options = [a for a in args if a is not type(None)]
+        return _annotation_schema(options[0]) if len(options) == 1 else {}
+    if origin is list:
+        return {"type": "array", "items": _annotation_schema(args[0])} if args else {"type": "array"}
+    if origin is dict:
+        if len(args) == 2:
+            return {"type": "object", "additionalProperties": _annotation_schema(args[1])}
+        return {"type": "object"}
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+    return {}
+
+
+def _tool_schema(name: str, info: dict) -> dict:
+    signature = inspect.signature(info["fn"])
+    hints = typing.get_type_hints(info["fn"])
+    properties = {}
+    required = []
+    for param in info["params"]:
+        properties[param] = _annotation_schema(hints.get(param, inspect.Parameter.empty))
+        if signature.parameters[param].default is inspect.Parameter.empty:
+            required.append(param)
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": info["description"],
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+@functools.cache
+def get_tool_schemas() -> list[dict]:
+    """生成 OpenAI tools 接口所需的工具定义，参数名与类型取自 TOOL_REGISTRY 中的函数签名。"""
+    return [_tool_schema(name, info) for name, info in TOOL_REGISTRY.items()]
+
+
 def dispatch(tool_name: str, **kwargs):
     """执行指定工具。"""
     if tool_name not in TOOL_REGISTRY:
         raise ValueError(f"未知工具: {tool_name}，可用: {list(TOOL_REGISTRY.keys())}")
 
     fn = TOOL_REGISTRY[tool_name]["fn"]
-    return fn(**kwargs)
+    if tool_name not in WRITE_TOOLS or not isinstance(kwargs.get("file_path"), str):
+        return fn(**kwargs)
+    # 先写回此前调用的修改，失败时丢弃缓存项只撤销本次调用执行了一半的修改
+    checkpoint(kwargs["file_path"])
+    try:
+        return fn(**kwargs)
+    except Exception:
+        discard(kwargs["file_path"])
+        raise
+
+
+async def adispatch(tool_name: str, **kwargs):
+    """异步执行指定工具：openpyxl 等阻塞操作放到线程池中运行。
+
+    asyncio.to_thread 会复制当前上下文，工具仍在调用方的 workbook_session 内执行。
+    """
+    return await asyncio.to_thread(dispatch, tool_name, **kwargs)
+
+
+def _batches(calls: list[tuple[str, dict]]) -> list[list[list[int]]]:
+    """把一轮中的多个工具调用分成依次执行的批次，每批内按文件分组。
+
+    同一文件的调用按原顺序放在同一组中串行执行，不同文件的组可以并发；
+    没有 file_path 参数的调用（如 run_python 可能读写任意文件）单独成批，前后都不并发。
+    返回 [批次[组[调用下标]]]。
+    """
+    batches: list[list[list[int]]] = []
+    groups: dict[str, list[int]] = {}
+    for i, (_, kwargs) in enumerate(calls):
+        file_path = kwargs.get("file_path")
+        if not isinstance(file_path, str):
+            if groups:
+                batches.append(list(groups.values()))
+                groups = {}
+            batches.append([[i]])
+            continue
+        groups.setdefault(os.path.abspath(file_path), []).append(i)
+    if groups:
+        batches.append(list(groups.values()))
+    return batches
+
+
+def _run_group(calls: list[tuple[str, dict]], group: list[int], results: list) -> None:
+    for i in group:
+        tool_name, kwargs = calls[i]
+        try:
+            results[i] = dispatch(tool_name, **kwargs)
+        except Exception as e:
+            results[i] = e
+
+
+def dispatch_many(calls: list[tuple[str, dict]]) -> list:
+    """执行同一轮中的多个工具调用，操作不同文件的调用并发执行。
+
+    Args:
+        calls: [(tool_name, kwargs)]
+
+    Returns:
+        与 calls 一一对应的结果；执行失败的位置为异常对象
+    """
+    results: list = [None] * len(calls)
+    for batch in _batches(calls):
+        if len(batch) == 1:
+            _run_group(calls, batch[0], results)
+            continue
+        with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+            # 每个线程在调用方上下文的副本中运行，共享同一个 workbook_session
+            futures = [
+                pool.submit(contextvars.copy_context().run, _run_group, calls, group, results)
+                for group in batch
+            ]
+            for future in futures:
+                future.result()
+    return results
+
+
+async def adispatch_many(calls: list[tuple[str, dict]]) -> list:
+    """dispatch_many() 的异步版本。"""
+    results: list = [None] * len(calls)
+
+    async def run_group(group: list[int]) -> None:
+        for i in group:
+            tool_name, kwargs = calls[i]
+            try:
+                results[i] = await adispatch(tool_name, **kwargs)
+            except Exception as e:
+                results[i] = e
+
+    for batch in _batches(calls):
+        await asyncio.gather(*(run_group(group) for group in batch))
+    return results
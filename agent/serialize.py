@@ -0,0 +1,147 @@
+"""工具结果序列化 — 在字符预算内把返回值渲染为发给 LLM 的文本
+
+DataFrame 不再整表 to_string()：超出预算时输出形状、列类型、逐列统计与首尾若干行，
+并给出可直接调用的 read_range 区域提示；其余结构按 JSON 输出（顶层每个键一行），
+超长文本保留首尾并注明截断。渲染只读取需要展示的行，耗时与内存与表大小基本无关。
+
+环境变量: LLM_RESULT_MAX_CHARS（默认 12000）。
+"""
+
+import json
+import os
+
+import pandas as pd
+from openpyxl.utils.cell import get_column_letter
+
+RESULT_MAX_CHARS = int(os.getenv("LLM_RESULT_MAX_CHARS", "12000"))
+HEAD_ROWS = 20
+TAIL_ROWS = 5
+FULL_ROWS = 200  # 行数不超过此值时先尝试整表输出
+PAGE_ROWS = 100  # 提示中建议每次读取的行数
+MAX_COLUMNS = 30
+
+
+def render_result(result, max_chars: int = RESULT_MAX_CHARS) -> str:
+    """把工具返回值渲染为不超过约 max_chars 个字符的文本。"""
+    if isinstance(result, pd.DataFrame):
+        return render_dataframe(result, max_chars)
+    if hasattr(result, "to_string"):
+        return _clip(result.to_string(), max_chars)
+    if isinstance(result, dict):
+        return _render_dict(result, max_chars)
+    return _clip(str(result), max_chars)
+
+
+def render_dataframe(df: pd.DataFrame, max_chars: int = RESULT_MAX_CHARS, sheet: str | None = None) -> str:
+    """DataFrame 放得下时原样输出，否则输出摘要与首尾行。
+
+    sheet 给出时截断提示中的区域按 read_excel 的布局换算（表头在第 1 行，数据从第 2 行开始）。
+    """
+    if len(df) <= FULL_ROWS:
+        full = df.to_string()
+        if len(full) <= max_chars:
+            return full
+
+    rows, cols = df.shape
+    lines = [f"[{rows} rows x {cols} columns]"]
+    shown = df.iloc[:, :MAX_COLUMNS] if cols > MAX_COLUMNS else df
+    if cols > MAX_COLUMNS:
+        lines.append(f"[only the first {MAX_COLUMNS} columns are shown]")
+    lines.append("dtypes: " + ", ".join(f"{c}={t}" for c, t in shown.dtypes.items()))
+    lines.append("stats:")
+    lines.extend(f"  {c}: {_column_stats(shown[c])}" for c in shown.columns)
+    header = "\n".join(lines)
+
+    # 行数逐步减半直到放进预算
+    head, tail = min(HEAD_ROWS, rows), min(TAIL_ROWS, max(0, rows - HEAD_ROWS))
+    while True:
+        body = _head_tail(shown, head, tail)
+        text = f"{header}\n{body}\n{_hint(df, head, tail, sheet)}"
+        if len(text) <= max_chars or head <= 1:
+            return _clip(text, max_chars)
+        head, tail = max(1, head // 2), tail // 2
+
+
+def _head_tail(df: pd.DataFrame, head: int, tail: int) -> str:
+    if head + tail >= len(df):
+        return df.to_string()
+    parts = [f"first {head} rows:", df.head(head).to_string()]
+    if tail:
+        parts += [f"last {tail} rows:", df.tail(tail).to_string()]
+    return "\n".join(parts)
+
+
+def _hint(df: pd.DataFrame, head: int, tail: int, sheet: str | None) -> str:
+    hidden = len(df) - head - tail
+    if hidden <= 0:
+        return ""
+    if sheet is None:
+        return f"[truncated: {hidden} rows not shown]"
+    first = head + 2  # 表头占第 1 行
+    last = min(len(df) - tail + 1, first + PAGE_ROWS - 1)
+    area = f"A{first}:{get_column_letter(max(1, df.shape[1]))}{last}"
+    return (f"[truncated: {hidden} rows not shown; "
+            f"use read_range(sheet_name={json.dumps(sheet, ensure_ascii=False)}, cell_range=\"{area}\") to see more]")
+
+
+def _column_stats(series: pd.Series) -> str:
+    non_null = series.dropna()
+    missing = len(series) - len(non_null)
+    stats = []
+    if len(non_null) and (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)):
+        stats += [f"min={non_null.min():.6g}", f"max={non_null.max():.6g}", f"mean={non_null.mean():.6g}"]
+    elif len(non_null) and pd.api.types.is_datetime64_any_dtype(series):
+        stats += [f"min={non_null.min()}", f"max={non_null.max()}"]
+    elif len(non_null):
+        counts = non_null.astype(str).value_counts()
+        stats += [f"unique={len(counts)}", f"top={_short(counts.index[0])}({counts.iloc[0]})"]
+    if missing:
+        stats.append(f"missing={missing}")
+    return ", ".join(stats) or "empty"
+
+
+def _short(text: str, limit: int = 40) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _render_dict(result: dict, max_chars: int) -> str:
+    """顶层每个键一行；值中的 DataFrame（如 read_excel 的 data）单独渲染在后面并平分预算。"""
+    frames: list[tuple[str, str | None, pd.DataFrame]] = []
+
+    def extract(value, label: str, sheet: str | None):
+        if isinstance(value, pd.DataFrame):
+            frames.append((label, sheet, value))
+            return f"<DataFrame {value.shape[0]}x{value.shape[1]}, shown below>"
+        if isinstance(value, dict):
+            # read_excel 的 data 为 {sheet 名: DataFrame}
+            return {
+                k: extract(v, f"{label}[{json.dumps(k, ensure_ascii=False)}]", str(k) if label == "data" else None)
+                for k, v in value.items()
+            }
+        return value
+
+    plain = {k: extract(v, str(k), None) for k, v in result.items()}
+    lines = [
+        f"  {json.dumps(k, ensure_ascii=False)}: {json.dumps(v, ensure_ascii=False, default=str)}"
+        for k, v in plain.items()
+    ]
+    text = "{\n" + ",\n".join(lines) + "\n}"
+    if not frames:
+        return _clip(text, max_chars)
+
+    text = _clip(text, max_chars // (len(frames) + 1))
+    share = (max_chars - len(text)) // len(frames)
+    sections = [text]
+    for label, sheet, df in frames:
+        sections.append(f"--- {label} ---\n{render_dataframe(df, share, sheet)}")
+    return "\n".join(sections)
+
+
+def _clip(text: str, max_chars: int) -> str:
+    """超出预算时保留开头约 2/3 与结尾约 1/3。"""
+    if len(text) <= max_chars:
+        return text
+    keep = max(0, max_chars - 60)  # 留出截断说明的位置
+    marker = f"\n[truncated: {len(text) - keep} of {len(text)} chars omitted]\n"
+    head = keep * 2 // 3
+    return text[:head] + marker + text[len(text) - (keep - head):]
@@ -0,0 +1,76 @@
+"""评测账本 — 重新评测时只比较新增或改动过的输出文件
+
+每个 test case 的判定结果按 (输出文件内容哈希, 标准答案文件内容哈希, instruction_type,
+answer_position, 比较方式) 记入 SQLite；键中还包含 LEDGER_VERSION 与 openpyxl 版本，
+比较逻辑或其依赖变化后旧判定不再命中，不会被当作新结果报告。用 --task_ids / --resume 部分重跑 benchmark 后再评测，
+未改动的输出直接取账本中的结果，只有新的或被覆盖的输出文件才重新比较，最后与其余结果
+一起写回完整的 eval_{setting}_{model}.json。
+
+环境变量: EVAL_LEDGER_PATH（默认项目根目录下 .cache/eval_ledger.sqlite）。
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import openpyxl
+
+DEFAULT_PATH = os.getenv("EVAL_LEDGER_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "eval_ledger.sqlite"
+)
+
+# 判定逻辑（benchmark/fast_compare.py、tools/sheet_xml.py、evaluate._compare_case）变化时递增
+LEDGER_VERSION = 2
+
+
+class EvalLedger:
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "key TEXT PRIMARY KEY, task_id TEXT, result INTEGER NOT NULL, created REAL)"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def key(output_digest: str, gt_digest: str, instruction_type: str, answer_position: str, comparator: str) -> str:
+        """comparator 为比较方式及其版本标识（如 "fast:<SpreadsheetBench evaluation.py 的哈希>"）。"""
+        blob = "\0".join((
+            str(LEDGER_VERSION), openpyxl.__version__,
+            output_digest, gt_digest, instruction_type, answer_position, comparator,
+        ))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> int | None:
+        row = self._connection().execute("SELECT result FROM verdicts WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, key: str, task_id: str, result: int) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, task_id, result, created) VALUES (?, ?, ?, ?)",
+            (key, task_id, result, time.time()),
+        )
+        conn.commit()
+
+    def count_since(self, since: float) -> int:
+        """since 之后新记入的判定数（即本次实际比较过的 test case 数）。"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM verdicts WHERE created >= ?", (since,)
+        ).fetchone()[0]
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
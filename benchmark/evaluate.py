@@ -5,13 +5,30 @@ Usage:
     python benchmark/evaluate.py \
         --dataset sample_data_200 \
         --model <model-name> \
-        --setting agent
+        --setting agent \
+        [--jobs 8] [--timeout 120] [--comparator upstream] [--no_gt_cache] [--no_ledger]
+
+--jobs N 时用 N 个进程并行比较（任务分块提交，结果按数据集顺序输出，与串行完全一致）；
+--timeout 为每个任务（3 个 test case）的时间上限，超时的 test case 记为失败，不会拖住整次评测。
+
+默认用 benchmark/fast_compare.py 只流式读取 answer_position 涉及的单元格，判定规则与
+compare_workbooks 相同（--comparator upstream 时直接调用 compare_workbooks）。标准答案区域
+缓存在 benchmark/gt_cache.py 的 SQLite 库中（按文件内容哈希），第一次评测后只需读取模型输出
+文件；--no_gt_cache 时每次重新读取标准答案。
+
+每个 test case 的判定结果记入 benchmark/eval_ledger.py 的评测账本（按输出文件与标准答案的内容
+哈希，以及比较逻辑的版本：SpreadsheetBench 的 evaluation.py 内容变化或 LEDGER_VERSION 递增后
+旧结果失效）。部分重跑 benchmark（--task_ids / --resume）后再评测时只比较新的或改动过的输出，其余
+直接沿用账本中的结果，仍写出完整的 eval_{setting}_{model}.json；--no_ledger 时全部重新比较。
 """
 
 import os
 import sys
 import json
+import signal
+import time
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from collections import defaultdict
 
@@ -23,8 +40,15 @@ EVAL_DIR = os.path.join(
 )
 sys.path.insert(0, EVAL_DIR)
 
+import evaluation  # noqa: E402
 from evaluation import compare_workbooks  # noqa: E402
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.fast_compare import compare_fast, compare_with_answers, extract_answers  # noqa: E402
+from benchmark.eval_ledger import DEFAULT_PATH as LEDGER_PATH, EvalLedger  # noqa: E402
+from benchmark.gt_cache import DEFAULT_PATH as GT_CACHE_PATH, AnswerStore, file_digest  # noqa: E402
+
 BENCH_DATA_ROOT = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
     "SpreadsheetBench-NoDocker",
@@ -32,33 +56,68 @@ BENCH_DATA_ROOT = os.path.join(
 )
 
 
-def evaluate(dataset_name: str, setting: str, model: str):
-    """比较输出文件与标准答案，计算 soft/hard accuracy。"""
-    dataset_path = os.path.join(BENCH_DATA_ROOT, dataset_name)
-    if not os.path.exists(dataset_path):
-        print(f"Dataset path not found: {dataset_path}")
-        return
+DEFAULT_TIMEOUT = 300
 
-    with open(os.path.join(dataset_path, "dataset.json"), "r", encoding="utf-8") as f:
-        dataset = json.load(f)
+# 两种比较方式都依赖 SpreadsheetBench 的判定函数，其源码变化时账本中的旧结果失效
+UPSTREAM_DIGEST = file_digest(evaluation.__file__)[:16]
 
-    safe_model = model.replace("/", "_")
-    output_dir = os.path.join(dataset_path, "outputs", f"{setting}_{safe_model}")
 
-    if not os.path.exists(output_dir):
-        print(f"Output directory not found: {output_dir}")
-        print("Have you run benchmark/run_benchmark.py first?")
-        return
+class TaskTimeout(BaseException):
+    """继承 BaseException：compare_workbooks 内部的 except Exception 不会吞掉超时。"""
 
-    eval_results = []
-    stats = defaultdict(lambda: {"total": 0, "soft_sum": 0.0, "hard_sum": 0})
 
-    for data in tqdm(dataset, desc="Evaluating"):
-        task_id = str(data["id"])
-        instruction_type = data["instruction_type"]
-        answer_position = data["answer_position"]
+def _on_alarm(signum, frame):
+    raise TaskTimeout()
+
+
+def _compare_case(
+    gt_path: str,
+    proc_path: str,
+    instruction_type: str,
+    answer_position: str,
+    store: AnswerStore | None,
+    comparator: str,
+    gt_digest: str | None = None,
+) -> bool:
+    if comparator == "upstream":
+        result, _ = compare_workbooks(gt_path, proc_path, instruction_type, answer_position)
+    elif store is None:
+        result, _ = compare_fast(gt_path, proc_path, instruction_type, answer_position)
+    elif not os.path.exists(proc_path):
+        result = False
+    else:
+        answers = store.load(gt_path, answer_position, extract_answers, gt_digest)
+        result, _ = compare_with_answers(answers, gt_path, proc_path, instruction_type, answer_position)
+    return result
+
 
-        test_case_results = []
+def evaluate_task(
+    data: dict,
+    dataset_path: str,
+    output_dir: str,
+    timeout: float | None = DEFAULT_TIMEOUT,
+    store: AnswerStore | None = None,
+    comparator: str = "fast",
+    ledger: EvalLedger | None = None,
+) -> dict:
+    """比较一个任务的 3 个 test case。
+
+    timeout 秒后（用 SIGALRM 打断，仅 Unix）尚未比较的 test case 记为 0，结果中带 "timed_out"。
+    comparator 为 "fast" 时用 fast_compare 只读取答案区域，给出 store 时标准答案区域从缓存读取
+    （未缓存时解析一次并写入）；为 "upstream" 时调用 compare_workbooks。
+    给出 ledger 时输出文件与标准答案都没有变化的 test case 直接取账本中的结果，新比较的结果写入账本。
+    """
+    task_id = str(data["id"])
+    instruction_type = data["instruction_type"]
+    answer_position = data["answer_position"]
+
+    test_case_results = [0, 0, 0]
+    timed_out = False
+    use_alarm = bool(timeout) and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
         for tc_idx in range(1, 4):
             gt_path = os.path.join(
                 dataset_path, "spreadsheet", task_id, f"{tc_idx}_{task_id}_answer.xlsx"
@@ -66,33 +125,164 @@ def evaluate(dataset_name: str, setting: str, model: str):
             proc_path = os.path.join(output_dir, f"{tc_idx}_{task_id}_output.xlsx")
 
             try:
-                result, _ = compare_workbooks(
-                    gt_path, proc_path, instruction_type, answer_position
-                )
+                if ledger is None or not os.path.exists(proc_path):
+                    result = _compare_case(
+                        gt_path, proc_path, instruction_type, answer_position, store, comparator
+                    )
+                else:
+                    gt_digest = file_digest(gt_path)
+                    key = ledger.key(
+                        file_digest(proc_path), gt_digest, instruction_type, answer_position,
+                        f"{comparator}:{UPSTREAM_DIGEST}",
+                    )
+                    result = ledger.get(key)
+                    if result is None:
+                        result = int(_compare_case(
+                            gt_path, proc_path, instruction_type, answer_position, store, comparator, gt_digest
+                        ))
+                        ledger.put(key, task_id, result)
+            except TaskTimeout:
+                raise
             except Exception:
                 result = False
 
-            test_case_results.append(int(result))
+            test_case_results[tc_idx - 1] = int(result)
+    except TaskTimeout:
+        timed_out = True
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
 
-        soft = test_case_results.count(1) / len(test_case_results) if test_case_results else 0
-        hard = 0 if 0 in test_case_results else 1
+    soft = test_case_results.count(1) / len(test_case_results)
+    hard = 0 if 0 in test_case_results else 1
 
-        eval_results.append(
-            {
-                "id": task_id,
-                "instruction_type": instruction_type,
-                "test_case_results": test_case_results,
-                "soft_restriction": soft,
-                "hard_restriction": hard,
-            }
-        )
+    result = {
+        "id": task_id,
+        "instruction_type": instruction_type,
+        "test_case_results": test_case_results,
+        "soft_restriction": soft,
+        "hard_restriction": hard,
+    }
+    if timed_out:
+        result["timed_out"] = True
+    return result
+
+
+def _evaluate_chunk(args: tuple) -> list[dict]:
+    """进程池中的工作函数：依次比较一块任务。"""
+    tasks, dataset_path, output_dir, timeout, gt_cache, comparator, ledger_path = args
+    store = AnswerStore(gt_cache) if gt_cache and comparator == "fast" else None
+    ledger = EvalLedger(ledger_path) if ledger_path else None
+    try:
+        return [
+            evaluate_task(data, dataset_path, output_dir, timeout, store, comparator, ledger)
+            for data in tasks
+        ]
+    finally:
+        if store is not None:
+            store.close()
+        if ledger is not None:
+            ledger.close()
+
+
+def evaluate_all(
+    dataset: list[dict],
+    dataset_path: str,
+    output_dir: str,
+    jobs: int = 1,
+    timeout: float | None = DEFAULT_TIMEOUT,
+    chunk_size: int | None = None,
+    gt_cache: str | None = GT_CACHE_PATH,
+    comparator: str = "fast",
+    ledger: str | None = LEDGER_PATH,
+) -> list[dict]:
+    """比较所有任务，结果与 dataset 顺序一致。
 
-        stats[instruction_type]["total"] += 1
-        stats[instruction_type]["soft_sum"] += soft
-        stats[instruction_type]["hard_sum"] += hard
-        stats["overall"]["total"] += 1
-        stats["overall"]["soft_sum"] += soft
-        stats["overall"]["hard_sum"] += hard
+    gt_cache 为标准答案区域缓存库的路径（None 时每次都重新读取标准答案文件）；
+    comparator 见 evaluate_task（"upstream" 时不使用缓存）；ledger 为评测账本的路径（None 时全部重新比较）。
+
+    jobs > 1 时把任务切成小块提交到进程池（默认每块约为 任务数 / (jobs * 4)，
+    兼顾调度开销与负载均衡），按提交顺序收集结果。
+    """
+    if jobs <= 1:
+        return _evaluate_chunk((tqdm(dataset, desc="Evaluating"), dataset_path, output_dir, timeout, gt_cache, comparator, ledger))
+
+    chunk_size = chunk_size or max(1, len(dataset) // (jobs * 4))
+    chunks = [dataset[i:i + chunk_size] for i in range(0, len(dataset), chunk_size)]
+    eval_results: list[dict] = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool, \
+            tqdm(total=len(dataset), desc=f"Evaluating ({jobs} jobs)") as bar:
+        # map 按提交顺序返回，结果顺序与串行一致
+        for results in pool.map(_evaluate_chunk, [(c, dataset_path, output_dir, timeout, gt_cache, comparator, ledger) for c in chunks]):
+            eval_results.extend(results)
+            bar.update(len(results))
+    return eval_results
+
+
+def aggregate(eval_results: list[dict]) -> dict[str, dict]:
+    """按 instruction_type 与 overall 汇总 soft/hard 之和。"""
+    stats = defaultdict(lambda: {"total": 0, "soft_sum": 0.0, "hard_sum": 0})
+    for r in eval_results:
+        for category in (r["instruction_type"], "overall"):
+            stats[category]["total"] += 1
+            stats[category]["soft_sum"] += r["soft_restriction"]
+            stats[category]["hard_sum"] += r["hard_restriction"]
+    return stats
+
+
+def _cached_regions(path: str) -> int:
+    store = AnswerStore(path)
+    try:
+        return store.count()
+    finally:
+        store.close()
+
+
+def _scored_since(path: str, since: float) -> int:
+    ledger = EvalLedger(path)
+    try:
+        return ledger.count_since(since)
+    finally:
+        ledger.close()
+
+
+def evaluate(
+    dataset_name: str,
+    setting: str,
+    model: str,
+    jobs: int = 1,
+    timeout: float | None = DEFAULT_TIMEOUT,
+    gt_cache: str | None = GT_CACHE_PATH,
+    comparator: str = "fast",
+    ledger: str | None = LEDGER_PATH,
+):
+    """比较输出文件与标准答案，计算 soft/hard accuracy。"""
+    dataset_path = os.path.join(BENCH_DATA_ROOT, dataset_name)
+    if not os.path.exists(dataset_path):
+        print(f"Dataset path not found: {dataset_path}")
+        return
+
+    with open(os.path.join(dataset_path, "dataset.json"), "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    safe_model = model.replace("/", "_")
+    output_dir = os.path.join(dataset_path, "outputs", f"{setting}_{safe_model}")
+
+    if not os.path.exists(output_dir):
+        print(f"Output directory not found: {output_dir}")
+        print("Have you run benchmark/run_benchmark.py first?")
+        return
+
+    if comparator == "upstream":
+        gt_cache = None
+    cached_before = _cached_regions(gt_cache) if gt_cache else 0
+    started = time.time()
+    eval_results = evaluate_all(
+        dataset, dataset_path, output_dir, jobs, timeout,
+        gt_cache=gt_cache, comparator=comparator, ledger=ledger,
+    )
+    stats = aggregate(eval_results)
 
     # 保存详细结果
     log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
@@ -113,6 +303,19 @@ def evaluate(dataset_name: str, setting: str, model: str):
         soft_avg = s["soft_sum"] / n if n > 0 else 0
         hard_avg = s["hard_sum"] / n if n > 0 else 0
         print(f"  {category:30s}  n={n:4d}  soft={soft_avg:.4f}  hard={hard_avg:.4f}")
+    timed_out = sum(1 for r in eval_results if r.get("timed_out"))
+    if timed_out:
+        print(f"  Timed out: {timed_out} tasks (> {timeout}s)")
+    if gt_cache:
+        cached = _cached_regions(gt_cache)
+        print(f"  GT cache: {cached} answer regions ({cached - cached_before} new), {gt_cache}")
+    if ledger:
+        outputs = sum(
+            os.path.exists(os.path.join(output_dir, f"{tc_idx}_{data['id']}_output.xlsx"))
+            for data in dataset for tc_idx in range(1, 4)
+        )
+        scored = _scored_since(ledger, started)
+        print(f"  Ledger: {scored} outputs scored, {max(0, outputs - scored)} verdicts reused, {ledger}")
     print("=" * 60)
     print(f"  Detailed results: {result_path}")
     print()
@@ -123,9 +326,20 @@ def main():
     parser.add_argument("--dataset", type=str, default="sample_data_200")
     parser.add_argument("--model", type=str, required=True, help="Model name")
     parser.add_argument("--setting", type=str, default="agent")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes (1 = serial)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="Per-task time limit in seconds (0 = none)")
+    parser.add_argument("--comparator", choices=["fast", "upstream"], default="fast",
+                        help="fast: read only answer_position cells; upstream: SpreadsheetBench compare_workbooks")
+    parser.add_argument("--no_ledger", action="store_true",
+                        help="Re-score every output instead of reusing verdicts for unchanged files")
+    parser.add_argument("--no_gt_cache", action="store_true",
+                        help="Parse ground-truth files on every run instead of using the answer-region cache")
     args = parser.parse_args()
 
-    evaluate(args.dataset, args.setting, args.model)
+    evaluate(args.dataset, args.setting, args.model, jobs=args.jobs, timeout=args.timeout or None,
+             gt_cache=None if args.no_gt_cache else GT_CACHE_PATH, comparator=args.comparator,
+             ledger=None if args.no_ledger else LEDGER_PATH)
 
 
 if __name__ == "__main__":
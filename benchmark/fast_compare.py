@@ -0,0 +1,247 @@
+"""
+答案区域快速比较 — 只流式读取 answer_position 涉及的 sheet 与行。
+
+compare_workbooks 用 openpyxl 完整加载两个工作簿（所有 sheet、所有单元格），而判定只与
+answer_position 中的单元格有关。这里用 tools.sheet_xml 直接读取 xlsx 包:
+    - 只打开 answer_position 涉及的 sheet 部件，逐行解析，读过区域的最后一行即停止
+    - 共享字符串按需解析到被引用的最大下标为止
+    - 合并区域中非左上角的单元格按 openpyxl 的规则视为空值、默认样式
+单元格的值、填充与字体按 openpyxl(data_only=True) 的方式还原，再交给 SpreadsheetBench 自身的
+compare_cell_value / compare_fill_color / compare_font_color，判定规则与 compare_workbooks 相同。
+xlsx 包无法按此方式读取时（损坏、缺少部件等）退回 compare_workbooks。
+
+Usage（在整个数据集上与 compare_workbooks 逐个对照判定结果并计时）:
+    python benchmark/fast_compare.py \
+        --dataset sample_data_200 \
+        --model <model-name> \
+        --setting agent
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.fills import DEFAULT_EMPTY_FILL, DEFAULT_GRAY_FILL
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from tqdm import tqdm
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 将 SpreadsheetBench 的 evaluation 目录与项目根目录加入 path
+EVAL_DIR = os.path.join(PROJECT_ROOT, "SpreadsheetBench-NoDocker", "evaluation")
+sys.path.insert(0, EVAL_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+from evaluation import (  # noqa: E402
+    compare_cell_value,
+    compare_fill_color,
+    compare_font_color,
+    compare_workbooks,
+    generate_cell_names,
+)
+
+from tools.sheet_xml import WorkbookXml  # noqa: E402
+
+BENCH_DATA_ROOT = os.path.join(PROJECT_ROOT, "SpreadsheetBench-NoDocker", "data")
+
+Region = tuple[str, str, list | None]  # (sheet 名, 区域, [(坐标, 值, 填充, 字体), ...] 或 None)
+
+
+def answer_ranges(answer_position: str, default_sheet: str) -> list[tuple[str, str]]:
+    """按 compare_workbooks 的规则把 answer_position 拆成 (sheet 名, 区域) 列表。"""
+    ranges = []
+    for sheet_cell_range in answer_position.split(","):
+        if "!" in sheet_cell_range:
+            sheet_name, cell_range = sheet_cell_range.split("!")
+            sheet_name = sheet_name.lstrip("'").rstrip("'")
+        else:
+            sheet_name = default_sheet
+            cell_range = sheet_cell_range
+        ranges.append((sheet_name, cell_range.lstrip("'").rstrip("'")))
+    return ranges
+
+
+def _style_tables(book: WorkbookXml) -> tuple[list, list, list]:
+    """(fonts, fills, cell_styles)，与 openpyxl 加载工作簿时 apply_stylesheet 的结果一致。"""
+    stylesheet = book.stylesheet
+    if stylesheet is not None and stylesheet.cell_styles:
+        return list(stylesheet.fonts), list(stylesheet.fills), stylesheet.cell_styles
+    return [DEFAULT_FONT], [DEFAULT_EMPTY_FILL, DEFAULT_GRAY_FILL], [StyleArray()]
+
+
+def _merged_followers(book: WorkbookXml, sheet_name: str, coords: set[tuple[int, int]]) -> set[tuple[int, int]]:
+    """coords 中位于合并区域内、但不是区域左上角的单元格（openpyxl 中为 MergedCell）。"""
+    followers = set()
+    for ref in book.merged_cells(sheet_name):
+        min_col, min_row, max_col, max_row = range_boundaries(ref)
+        for row, col in coords:
+            if min_row <= row <= max_row and min_col <= col <= max_col and (row, col) != (min_row, min_col):
+                followers.add((row, col))
+    return followers
+
+
+def read_regions(book: WorkbookXml, ranges: list[tuple[str, str]]) -> list[Region]:
+    """读取各 (sheet, 区域) 的单元格 (坐标, 值, 填充, 字体)；工作簿中没有的 sheet 记为 None。
+
+    每个 sheet 只扫描一遍，读到所需的最后一行即停止。
+    """
+    fonts, fills, cell_styles = _style_tables(book)
+    names: list[list[tuple[str, tuple[int, int]]] | None] = []
+    wanted: dict[str, set[tuple[int, int]]] = {}
+    for sheet_name, cell_range in ranges:
+        if sheet_name not in book.sheets:
+            names.append(None)
+            continue
+        cell_names = [(n, coordinate_to_tuple(n)) for n in generate_cell_names(cell_range)]
+        names.append(cell_names)
+        wanted.setdefault(sheet_name, set()).update(coord for _, coord in cell_names)
+
+    styled: dict[str, dict[tuple[int, int], tuple[object, int]]] = {}
+    for sheet_name, coords in wanted.items():
+        last_row = max((row for row, _ in coords), default=0)
+        cells = {}
+        for row, col, value, _, _, style in book.iter_styled_cells(sheet_name, keep_styled=True):
+            if row > last_row:
+                break
+            if (row, col) in coords:
+                cells[row, col] = (value, style)
+        for coord in _merged_followers(book, sheet_name, coords):
+            cells.pop(coord, None)
+        styled[sheet_name] = cells
+
+    regions = []
+    for (sheet_name, cell_range), cell_names in zip(ranges, names):
+        if cell_names is None:
+            regions.append((sheet_name, cell_range, None))
+            continue
+        cells = styled[sheet_name]
+        region = []
+        for name, coord in cell_names:
+            value, style = cells.get(coord, (None, 0))
+            xf = cell_styles[style]
+            region.append((name, value, fills[xf.fillId], fonts[xf.fontId]))
+        regions.append((sheet_name, cell_range, region))
+    return regions
+
+
+def extract_answers(gt_file: str, answer_position: str) -> dict:
+    """读取标准答案文件中 answer_position 各区域的单元格，供比较或缓存。
+
+    无法读取时返回 {"error": ...}，比较时退回 compare_workbooks。
+    """
+    try:
+        with WorkbookXml(gt_file) as book:
+            ranges = answer_ranges(answer_position, book.sheetnames[0])
+            return {"regions": read_regions(book, ranges)}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def compare_regions(gt_regions: list[Region], proc_regions: list[Region]) -> tuple[bool, str]:
+    """逐个单元格比较值、填充色与字体颜色（cell_level_compare 的判定顺序）。"""
+    for (sheet_name, _, gt_cells), (_, _, proc_cells) in zip(gt_regions, proc_regions):
+        if proc_cells is None:
+            return False, "worksheet not found"
+        if gt_cells is None:
+            return False, f"worksheet {sheet_name} not found in ground truth"
+        for (cell_name, value, fill, font), (_, proc_value, proc_fill, proc_font) in zip(gt_cells, proc_cells):
+            if not compare_cell_value(value, proc_value):
+                return False, f"Value difference at cell {cell_name}: ws_gt has {value}, ws_proc has {proc_value}"
+            if not compare_fill_color(fill, proc_fill):
+                return False, f"Fill color difference at cell {cell_name}"
+            if not compare_font_color(font, proc_font):
+                return False, f"Font color difference at cell {cell_name}"
+    return True, ""
+
+
+def compare_with_answers(
+    answers: dict, gt_file: str, proc_file: str, instruction_type: str, answer_position: str
+) -> tuple[bool, str]:
+    """用（可能来自缓存的）标准答案区域比较输出文件；任一方无法流式读取时退回 compare_workbooks。"""
+    if not os.path.exists(proc_file):
+        return False, "File not exist"
+    if "error" in answers:
+        return compare_workbooks(gt_file, proc_file, instruction_type, answer_position)
+    try:
+        with WorkbookXml(proc_file) as book:
+            proc_regions = read_regions(book, [(sheet, cell_range) for sheet, cell_range, _ in answers["regions"]])
+    except Exception:
+        return compare_workbooks(gt_file, proc_file, instruction_type, answer_position)
+    return compare_regions(answers["regions"], proc_regions)
+
+
+def compare_fast(gt_file: str, proc_file: str, instruction_type: str, answer_position: str) -> tuple[bool, str]:
+    """与 compare_workbooks 参数、返回值相同的快速版本。"""
+    if not os.path.exists(proc_file):
+        return False, "File not exist"
+    return compare_with_answers(
+        extract_answers(gt_file, answer_position), gt_file, proc_file, instruction_type, answer_position
+    )
+
+
+def _timed(compare, *args) -> tuple[bool, float]:
+    t0 = time.perf_counter()
+    try:
+        result, _ = compare(*args)
+    except Exception:
+        result = False
+    return bool(result), time.perf_counter() - t0
+
+
+def verify(dataset_name: str, setting: str, model: str, top: int = 5) -> int:
+    """对数据集中每个 test case 分别用两种方式比较，返回判定不一致的数量。"""
+    dataset_path = os.path.join(BENCH_DATA_ROOT, dataset_name)
+    with open(os.path.join(dataset_path, "dataset.json"), "r", encoding="utf-8") as f:
+        dataset = json.load(f)
+    output_dir = os.path.join(dataset_path, "outputs", f"{setting}_{model.replace('/', '_')}")
+
+    mismatches = []
+    timings = []  # (文件大小, 用例, compare_workbooks 耗时, 快速比较耗时)
+    for data in tqdm(dataset, desc="Verifying"):
+        task_id = str(data["id"])
+        for tc_idx in range(1, 4):
+            gt_path = os.path.join(dataset_path, "spreadsheet", task_id, f"{tc_idx}_{task_id}_answer.xlsx")
+            proc_path = os.path.join(output_dir, f"{tc_idx}_{task_id}_output.xlsx")
+            if not os.path.exists(proc_path):
+                continue
+            args = (gt_path, proc_path, data["instruction_type"], data["answer_position"])
+            expected, slow = _timed(compare_workbooks, *args)
+            actual, fast = _timed(compare_fast, *args)
+            case = f"{tc_idx}_{task_id}"
+            if actual != expected:
+                mismatches.append((case, expected, actual))
+            size = os.path.getsize(gt_path) + os.path.getsize(proc_path)
+            timings.append((size, case, slow, fast))
+
+    slow_total = sum(t[2] for t in timings)
+    fast_total = sum(t[3] for t in timings)
+    print()
+    print("=" * 60)
+    print(f"  Compared: {len(timings)} test cases, mismatched verdicts: {len(mismatches)}")
+    for case, expected, actual in mismatches:
+        print(f"    {case}: compare_workbooks={expected}, fast={actual}")
+    print(f"  compare_workbooks: {slow_total:.2f}s   fast: {fast_total:.2f}s   "
+          f"speedup: {slow_total / fast_total if fast_total else 0:.1f}x")
+    print(f"  Largest files:")
+    for size, case, slow, fast in sorted(timings, reverse=True)[:top]:
+        print(f"    {case:20s} {size / 1e6:7.2f} MB  {slow:7.3f}s -> {fast:7.3f}s")
+    print("=" * 60)
+    return len(mismatches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the fast comparator against compare_workbooks")
+    parser.add_argument("--dataset", type=str, default="sample_data_200")
+    parser.add_argument("--model", type=str, required=True, help="Model name")
+    parser.add_argument("--setting", type=str, default="agent")
+    args = parser.parse_args()
+
+    sys.exit(1 if verify(args.dataset, args.setting, args.model) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""标准答案区域缓存 — 评测时不再重复解析 {tc}_{id}_answer.xlsx
+
+标准答案文件在不同模型、不同 setting 的评测之间不会变化，却在每次评测中被完整加载一遍。
+AnswerStore 把每个答案文件中 answer_position 区域的单元格（值、填充、字体）存入 SQLite，
+键为 (文件内容 SHA-256, answer_position, openpyxl 版本) 的哈希：文件内容变了自动失效，同一文件
+被多个 setting 共享。条目中的填充、字体是 pickle 后的 openpyxl 对象，升级 openpyxl 后旧条目
+不再命中，无法反序列化的条目按未缓存处理。条目在第一次评测时生成，之后的评测只需解析模型输出文件。
+
+多个评测进程可以同时读写同一个库（WAL 模式）；连接按进程懒创建，进程池 fork 后互不共享。
+
+环境变量: EVAL_GT_CACHE_PATH（默认项目根目录下 .cache/gt_answers.sqlite）。
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+
+import openpyxl
+
+DEFAULT_PATH = os.getenv("EVAL_GT_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "gt_answers.sqlite"
+)
+
+# 条目格式或答案区域的读取方式（tools.sheet_xml、fast_compare）变化时递增，旧条目自然失效
+FORMAT_VERSION = 3
+
+
+def file_digest(path: str) -> str:
+    """文件内容的 SHA-256（只读字节，不解析 xlsx）。"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class AnswerStore:
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, payload BLOB NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    @staticmethod
+    def key(gt_path: str, answer_position: str, digest: str | None = None) -> str:
+        """digest 为已算好的文件内容哈希（省去重复读取）。"""
+        blob = f"{FORMAT_VERSION}\0{openpyxl.__version__}\0{digest or file_digest(gt_path)}\0{answer_position}"
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        row = self._connection().execute("SELECT payload FROM answers WHERE key = ?", (key,)).fetchone()
+        payload = None
+        if row is not None:
+            try:
+                payload = pickle.loads(row[0])
+            except Exception:
+                payload = None  # 损坏或与当前类定义不兼容，重新生成
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return payload
+
+    def put(self, key: str, payload) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO answers (key, payload) VALUES (?, ?)",
+            (key, pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)),
+        )
+        conn.commit()
+
+    def load(self, gt_path: str, answer_position: str, extract, digest: str | None = None):
+        """返回答案区域；未缓存时调用 extract(gt_path, answer_position) 生成并写入。"""
+        key = self.key(gt_path, answer_position, digest)
+        payload = self.get(key)
+        if payload is None:
+            payload = extract(gt_path, answer_position)
+            self.put(key, payload)
+        return payload
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self) -> None:
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
@@ -0,0 +1,427 @@
+"""
+ExcelAgent 工具层性能基准（合成数据，无需 SpreadsheetBench 数据集）。
+
+Usage:
+    python benchmark/perf.py read [--sheets 1,5,10,30] [--rows 2000] [--cols 8]
+    python benchmark/perf.py xml [--rows 50000] [--cols 10]
+    python benchmark/perf.py columnar [--rows 50000] [--cols 9]
+    python benchmark/perf.py write [--rows 20000] [--cols 5]
+    python benchmark/perf.py recalc [--rows 20000] [--cols 5]
+    python benchmark/perf.py incremental [--rows 20000] [--cols 5]
+    python benchmark/perf.py soffice [--files 24] [--workers 1,4] [--rows 2000]
+    python benchmark/perf.py run_python [--calls 20] [--gap 0.2]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+# 将项目根目录加入 sys.path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+import openpyxl
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+from tools import reader, writer
+from tools.columnar import ColumnarWorkbook
+from tools.formula import Evaluator, recalc_file
+from tools.session import workbook_session
+
+
+# ---------------------------------------------------------------------------
+# 工具函数
+# ---------------------------------------------------------------------------
+
+
+def make_workbook(path: str, sheets: int, rows: int, cols: int) -> str:
+    """生成 sheets 个数据表，每个 rows 行 x cols 列（首行为表头）。"""
+    wb = openpyxl.Workbook(write_only=True)
+    for s in range(sheets):
+        ws = wb.create_sheet(title=f"Sheet{s + 1}")
+        ws.append([f"col{c + 1}" for c in range(cols)])
+        for r in range(rows):
+            ws.append([r * cols + c if c % 2 == 0 else f"text{r}_{c}" for c in range(cols)])
+    wb.save(path)
+    return path
+
+
+def timeit(fn, repeat: int = 3) -> float:
+    """返回 repeat 次运行中的最短耗时（秒）。"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def peak_memory(fn) -> float:
+    """运行一次 fn，返回 Python 堆内存峰值（MB）。"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def parse_int_list(text: str) -> list[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+# ---------------------------------------------------------------------------
+# read: read_excel 解析耗时 vs sheet 数量
+# ---------------------------------------------------------------------------
+
+
+def _read_excel_per_sheet(file_path: str) -> dict:
+    """旧实现：先加载一次取 sheet 名，再对每个 sheet 调用 pd.read_excel。"""
+    wb = openpyxl.load_workbook(file_path, data_only=True)
+    data = {
+        name: pd.read_excel(file_path, sheet_name=name, engine="openpyxl")
+        for name in wb.sheetnames
+    }
+    wb.close()
+    return data
+
+
+def bench_read(args):
+    print(f"{'sheets':>6}  {'per-sheet (s)':>14}  {'single-pass (s)':>16}  {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in parse_int_list(args.sheets):
+            path = make_workbook(os.path.join(tmp, f"read_{n}.xlsx"), n, args.rows, args.cols)
+            old = timeit(lambda: _read_excel_per_sheet(path), args.repeat)
+            new = timeit(lambda: reader.read_excel(path), args.repeat)
+            print(f"{n:>6}  {old:>14.3f}  {new:>16.3f}  {old / new:>7.1f}x")
+
+
+# ---------------------------------------------------------------------------
+# xml: sheet_xml 流式后端 vs openpyxl
+# ---------------------------------------------------------------------------
+
+
+def make_formula_workbook(path: str, rows: int, cols: int) -> str:
+    """单个 sheet：cols 列数据，外加一列逐行公式。"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title="Data")
+    ws.append([f"col{c + 1}" for c in range(cols)] + ["total"])
+    for r in range(2, rows + 2):
+        ws.append([r * c for c in range(cols)] + [f"=SUM(A{r}:{get_column_letter(cols)}{r})"])
+    wb.save(path)
+    return path
+
+
+def bench_xml(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_formula_workbook(os.path.join(tmp, "xml.xlsx"), args.rows, args.cols)
+        print(f"{args.rows} rows x {args.cols + 1} cols, {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        print(f"{'operation':<22}  {'backend':<9}  {'time (s)':>9}  {'peak MB':>8}")
+        for label, fn in (("read_excel", reader.read_excel), ("read_excel_formulas", reader.read_excel_formulas)):
+            for backend in ("openpyxl", "xml"):
+                call = lambda: fn(path, backend=backend)
+                t = timeit(call, args.repeat)
+                mem = peak_memory(call)
+                print(f"{label:<22}  {backend:<9}  {t:>9.3f}  {mem:>8.1f}")
+
+
+# ---------------------------------------------------------------------------
+# columnar: 列式模型 vs openpyxl Workbook 的常驻内存
+# ---------------------------------------------------------------------------
+
+
+def retained_memory(load) -> tuple[object, float]:
+    """返回 (load() 的结果, 结果常驻的 Python 堆内存 MB)。"""
+    tracemalloc.start()
+    try:
+        obj = load()
+        return obj, tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_columnar(args):
+    cells = args.rows * (args.cols + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_formula_workbook(os.path.join(tmp, "columnar.xlsx"), args.rows, args.cols)
+        print(f"{cells} cells ({args.rows} rows x {args.cols + 1} cols)")
+        print(f"{'model':<26}  {'load (s)':>8}  {'retained MB':>11}  {'bytes/cell':>10}")
+        loaders = (
+            ("openpyxl (formulas)", lambda: openpyxl.load_workbook(path)),
+            ("openpyxl (data_only)", lambda: openpyxl.load_workbook(path, data_only=True)),
+            ("ColumnarWorkbook", lambda: ColumnarWorkbook.from_xlsx(path)),
+        )
+        for label, load in loaders:
+            t = timeit(load, 1)
+            obj, mb = retained_memory(load)
+            print(f"{label:<26}  {t:>8.2f}  {mb:>11.1f}  {mb * 1024 * 1024 / cells:>10.1f}")
+            del obj
+
+
+# ---------------------------------------------------------------------------
+# write: 逐单元格 write_cells vs 区域批量写入
+# ---------------------------------------------------------------------------
+
+
+def bench_write(args):
+    rows, cols = args.rows, args.cols
+    last_col = get_column_letter(cols)
+    formula_col = get_column_letter(cols + 1)
+    values = [[r * cols + c for c in range(cols)] for r in range(rows)]
+
+    per_cell = [
+        {"cell": f"{get_column_letter(c + 1)}{r + 2}", "value": values[r][c]}
+        for r in range(rows) for c in range(cols)
+    ] + [
+        {"cell": f"{formula_col}{r + 2}", "value": f"=SUM(A{r + 2}:{last_col}{r + 2})"}
+        for r in range(rows)
+    ]
+    batched = [
+        {"range": f"A2:{last_col}{rows + 1}", "values": values},
+        {"range": f"{formula_col}2:{formula_col}{rows + 1}", "formula": f"=SUM(A2:{last_col}2)"},
+    ]
+
+    print(f"{rows * (cols + 1)} cells")
+    print(f"{'items':<16}  {'JSON items':>10}  {'write+save (s)':>14}  {'in session (s)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, items in (("per-cell dicts", per_cell), ("range + fill", batched)):
+            path = os.path.join(tmp, "write.xlsx")
+            writer.create_workbook(path, {"Data": [[f"col{c + 1}" for c in range(cols + 1)]]})
+            full = timeit(lambda: writer.write_cells(path, "Data", items), 1)
+            # 会话内保存被推迟，只计写入本身
+            with workbook_session():
+                writer.write_cells(path, "Data", [])
+                cached = timeit(lambda: writer.write_cells(path, "Data", items), 1)
+            print(f"{label:<16}  {len(items):>10}  {full:>14.3f}  {cached:>14.3f}")
+
+
+# ---------------------------------------------------------------------------
+# recalc: 原生公式引擎各阶段耗时
+# ---------------------------------------------------------------------------
+
+
+def make_lookup_workbook(path: str, rows: int, cols: int) -> str:
+    """数据表 + 逐行公式列 + 汇总表（SUMIF/COUNTIF/VLOOKUP/INDEX-MATCH）。"""
+    make_formula_workbook(path, rows, cols)
+    wb = openpyxl.load_workbook(path)
+    total = get_column_letter(cols + 1)
+    ws = wb.create_sheet("Summary")
+    for r in range(1, 101):
+        key = r * 7
+        ws.append([
+            key,
+            f"=SUMIF(Data!B:B,\">\"&A{r},Data!{total}:{total})",
+            f"=COUNTIF(Data!B2:B{rows + 1},\"<\"&A{r})",
+            f"=IFERROR(VLOOKUP(A{r}*2,Data!C2:{total}{rows + 1},{cols - 1},FALSE),\"\")",
+            f"=INDEX(Data!{total}2:{total}{rows + 1},MATCH(A{r},Data!B2:B{rows + 1},0))",
+        ])
+    wb.save(path)
+    return path
+
+
+def bench_recalc(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_lookup_workbook(os.path.join(tmp, "recalc.xlsx"), args.rows, args.cols)
+        t0 = time.perf_counter()
+        book = ColumnarWorkbook.from_xlsx(path)
+        t1 = time.perf_counter()
+        evaluator = Evaluator(book)
+        evaluator.compile()
+        t2 = time.perf_counter()
+        evaluator.evaluate()
+        t3 = time.perf_counter()
+        total = timeit(lambda: recalc_file(path), 1)
+        print(f"{len(evaluator.asts)} formulas ({args.rows} rows x {args.cols + 1} cols + 500 lookups)")
+        print(f"{'phase':<22}  {'time (s)':>9}")
+        for label, seconds in (("load (columnar)", t1 - t0), ("parse + check", t2 - t1),
+                               ("evaluate", t3 - t2), ("recalc_file total", total)):
+            print(f"{label:<22}  {seconds:>9.3f}")
+
+
+def bench_incremental(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_lookup_workbook(os.path.join(tmp, "incremental.xlsx"), args.rows, args.cols)
+        evaluator = Evaluator(ColumnarWorkbook.from_xlsx(path))
+        full = timeit(evaluator.evaluate, 1)
+        total = get_column_letter(args.cols + 1)
+        mid = args.rows // 2
+
+        def new_formula():
+            evaluator.set_formula("Summary", 1, 8, f"=SUM(Data!B2:B{args.rows + 1})/COUNT(Data!B:B)")
+            return evaluator.recalculate()
+
+        def edit_row_input():
+            evaluator.set_value("Data", mid, 3, 1.5)
+            return evaluator.recalculate()
+
+        def edit_lookup_key():
+            evaluator.set_value("Summary", 50, 1, 77)
+            return evaluator.recalculate()
+
+        def edit_column_input():
+            evaluator.set_value("Data", mid, 2, 123.0)
+            return evaluator.recalculate()
+
+        print(f"{len(evaluator.asts)} formulas, full evaluate {full * 1000:.1f} ms")
+        print(f"{'edit':<34}  {'cells':>6}  {'time (ms)':>10}")
+        for label, fn in (("new formula (Summary!H1)", new_formula),
+                          (f"row input (Data!C{mid})", edit_row_input),
+                          ("lookup key (Summary!A50)", edit_lookup_key),
+                          (f"criteria column (Data!B{mid})", edit_column_input)):
+            t0 = time.perf_counter()
+            changed = fn()
+            print(f"{label:<34}  {len(changed):>6}  {(time.perf_counter() - t0) * 1000:>10.1f}")
+        print(f"(Data!{total} feeds every SUMIF in Summary!B)")
+
+
+# ---------------------------------------------------------------------------
+# soffice: LibreOffice 常驻实例池吞吐（files/min，1 vs N 个实例）
+# ---------------------------------------------------------------------------
+
+
+def bench_soffice(args):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, "skills", "xlsx", "scripts"))
+    from office import pool as office_pool
+    from recalc import recalc_libreoffice
+
+    if shutil.which("soffice") is None or office_pool.uno is None:
+        print("需要 soffice 与 LibreOffice Python 绑定（uno），跳过")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_formula_workbook(os.path.join(tmp, "source.xlsx"), args.rows, 5)
+        paths = []
+        for i in range(args.files):
+            paths.append(os.path.join(tmp, f"file{i}.xlsx"))
+            shutil.copy(source, paths[-1])
+
+        print(f"{args.files} files x {args.rows} formulas")
+        print(f"{'mode':<28}  {'time (s)':>9}  {'files/min':>10}  {'errors':>6}")
+
+        def report(label, seconds, results):
+            errors = sum(1 for r in results if r)
+            print(f"{label:<28}  {seconds:>9.2f}  {len(results) * 60 / seconds:>10.1f}  {errors:>6}")
+
+        # 基线：每个文件启动一次 soffice（只测前几个文件，避免过久）
+        sample = paths[:min(len(paths), 4)]
+        t0 = time.perf_counter()
+        results = [recalc_libreoffice(p).get("error") for p in sample]
+        report("soffice per file", time.perf_counter() - t0, results)
+
+        for n in parse_int_list(args.workers):
+            with office_pool.SofficePool(workers=n) as pool:
+                pool.map(paths[:n])  # 预热：启动全部实例
+                t0 = time.perf_counter()
+                results = pool.map(paths)
+                report(f"pool, {n} worker(s)", time.perf_counter() - t0, results)
+
+
+# ---------------------------------------------------------------------------
+# run_python: 每次启动解释器 vs 常驻 worker 池的单次调用延迟
+# ---------------------------------------------------------------------------
+
+
+RUN_PYTHON_SNIPPET = """\
+import numpy as np
+import openpyxl
+import pandas as pd
+print(pd.DataFrame({"a": np.arange(10)})["a"].sum())
+"""
+
+
+def bench_run_python(args):
+    from tools import code_executor
+
+    def measure(pool) -> list[float]:
+        code_executor.POOL = pool
+        latencies = []
+        for _ in range(args.calls):
+            t0 = time.perf_counter()
+            output = code_executor.run_python(RUN_PYTHON_SNIPPET)
+            latencies.append(time.perf_counter() - t0)
+            assert output.strip() == "45", output
+            time.sleep(args.gap)  # 模拟两次工具调用之间的 LLM 请求
+        return latencies
+
+    def report(label, latencies):
+        ordered = sorted(latencies)
+        p50 = ordered[len(ordered) // 2]
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        mean = sum(latencies) / len(latencies)
+        print(f"{label:<24}  {latencies[0] * 1000:>9.1f}  {mean * 1000:>9.1f}  {p50 * 1000:>9.1f}  {p95 * 1000:>9.1f}")
+
+    pool = code_executor.POOL or code_executor.WorkerPool()
+    pool.warm()  # 与 run_benchmark 一样在开始时启动，测基线期间完成预导入
+    print(f"{args.calls} calls, snippet imports numpy/pandas/openpyxl, {args.gap}s between calls")
+    print(f"{'mode':<24}  {'first ms':>9}  {'mean ms':>9}  {'p50 ms':>9}  {'p95 ms':>9}")
+    try:
+        report("subprocess per call", measure(None))
+        report("warm worker pool", measure(pool))
+    finally:
+        pool.close()
+
+
+# ---------------------------------------------------------------------------
+# 主入口
+# ---------------------------------------------------------------------------
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ExcelAgent tool-layer performance benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("read", help="read_excel parse time vs. sheet count")
+    p.add_argument("--sheets", type=str, default="1,5,10,30")
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=8)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_read)
+
+    p = sub.add_parser("xml", help="sheet_xml streaming backend vs. openpyxl")
+    p.add_argument("--rows", type=int, default=50000)
+    p.add_argument("--cols", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=1)
+    p.set_defaults(func=bench_xml)
+
+    p = sub.add_parser("columnar", help="columnar model vs. openpyxl retained memory")
+    p.add_argument("--rows", type=int, default=50000)
+    p.add_argument("--cols", type=int, default=9)
+    p.set_defaults(func=bench_columnar)
+
+    p = sub.add_parser("write", help="per-cell write_cells vs. batched range writes")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--cols", type=int, default=5)
+    p.set_defaults(func=bench_write)
+
+    p = sub.add_parser("recalc", help="native formula engine phase timings")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--cols", type=int, default=5)
+    p.set_defaults(func=bench_recalc)
+
+    p = sub.add_parser("incremental", help="dirty-cone recalculation after single edits")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--cols", type=int, default=5)
+    p.set_defaults(func=bench_incremental)
+
+    p = sub.add_parser("soffice", help="LibreOffice worker pool throughput, 1 vs N workers")
+    p.add_argument("--files", type=int, default=24)
+    p.add_argument("--workers", type=str, default="1,4")
+    p.add_argument("--rows", type=int, default=2000)
+    p.set_defaults(func=bench_soffice)
+
+    p = sub.add_parser("run_python", help="run_python latency, fresh interpreter vs. warm worker pool")
+    p.add_argument("--calls", type=int, default=20)
+    p.add_argument("--gap", type=float, default=0.2)
+    p.set_defaults(func=bench_run_python)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
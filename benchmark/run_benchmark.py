@@ -7,7 +7,21 @@ Usage:
         --model <model-name> \
         --max_steps 15 \
         [--resume] \
-        [--task_ids id1,id2]
+        [--task_ids id1,id2] \
+        [--workers 8] \
+        [--tool_mode native]
+
+--workers N 时任务与任务内的 3 个 test case 都作为独立单元并发运行（线程池，
+LLM 等待期间互不阻塞）；每个 test case 写各自的输出文件，run_python 使用各自的
+临时目录，任务的 3 个 test case 全部完成后才整体追加一行 JSONL。
+加 --async 时改用 asyncio 驱动（N 为同时运行的 test case 上限），并发数可远大于线程数。
+
+--tool_mode 选择工具调用方式（text: ```tool_call``` 文本块；native: OpenAI tools 接口，
+一轮可并发执行多个调用）。每个任务记录 3 个 test case 合计的 LLM 轮数、工具调用数与 token 用量，
+结束时打印每任务均值，用同一数据集分别以两种模式运行即可对比。
+
+--llm_cache rw 把 LLM 回复写入 llm.cache 的 SQLite 缓存；之后以 --llm_cache replay 重跑同一批任务
+时完全离线、无需 API Key，可在几秒内复现整次运行并继续走评测流程。
 """
 
 import os
@@ -15,7 +29,11 @@ import sys
 import json
 import shutil
 import argparse
+import asyncio
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from tqdm import tqdm
 
@@ -26,7 +44,12 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from agent.core import run_benchmark, parse_tool_call
+from agent.core import TOOL_MODE, extract_tool_calls, run_benchmark, run_benchmark_async
+from llm import usage
+from llm.cache import CACHE as LLM_CACHE
+from llm.latency import STATS as LLM_LATENCY
+from llm.ratelimit import LIMITER
+from tools.code_executor import POOL as PYTHON_POOL, scratch_directory
 
 # ---------------------------------------------------------------------------
 # 路径工具
@@ -68,6 +91,28 @@ def get_file_paths(task_id: str, dataset_path: str, test_case_idx: int, output_d
 # ---------------------------------------------------------------------------
 
 
+class ResultLog:
+    """JSONL 结果日志，多线程追加时按行加锁。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.efficiency: list[dict] = []  # 本次运行写入的各任务 efficiency，用于结束时汇总
+        # 上次运行被中断时最后一行可能不完整，补一个换行，避免与新记录粘连
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def append(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            if "efficiency" in record:
+                self.efficiency.append(record["efficiency"])
+
+
 def load_completed_ids(log_path: str) -> set:
     """从 JSONL 日志中读取已完成的任务 ID。"""
     completed = set()
@@ -81,7 +126,8 @@ def load_completed_ids(log_path: str) -> set:
                     record = json.loads(line)
                     if record.get("status") == "success":
                         completed.add(str(record["id"]))
-                except json.JSONDecodeError:
+                except (json.JSONDecodeError, KeyError):
+                    # 被中断的运行可能留下不完整的行
                     continue
     return completed
 
@@ -91,96 +137,269 @@ def load_completed_ids(log_path: str) -> set:
 # ---------------------------------------------------------------------------
 
 
-def run_single_task(
+def run_test_case(
     data: dict,
+    tc_idx: int,
     dataset_path: str,
     output_dir: str,
     model: str | None,
     max_steps: int,
+    verbose: bool = True,
+    tool_mode: str | None = None,
 ) -> dict:
-    """对一个 benchmark 任务运行 ExcelAgent（3 个 test case）。"""
+    """运行一个 test case（输入复制到输出后运行 agent）；test case 1 额外返回对话记录。"""
     task_id = str(data["id"])
-    instruction = data["instruction"]
-    instruction_type = data["instruction_type"]
-    answer_position = data["answer_position"]
+    input_path, output_path = get_file_paths(task_id, dataset_path, tc_idx, output_dir)
+    if not os.path.exists(input_path):
+        return {"error": f"Input not found: {input_path}"}
+
+    shutil.copy2(input_path, output_path)
+    scratch = tempfile.mkdtemp(prefix=f"excelagent_{tc_idx}_{task_id}_")
+
+    t0 = time.time()
+    try:
+        with scratch_directory(scratch), usage.track() as tokens:
+            _, messages = run_benchmark(
+                instruction=data["instruction"],
+                file_path=output_path,
+                instruction_type=data["instruction_type"],
+                answer_position=data["answer_position"],
+                max_steps=max_steps,
+                model=model,
+                verbose=verbose,
+                tool_mode=tool_mode,
+            )
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return _case_result(tc_idx, output_path, t0, messages, tokens)
 
-    result = {
-        "id": task_id,
-        "instruction_type": instruction_type,
-        "status": "pending",
-        "test_cases": {},
-        "timestamp": datetime.now().isoformat(),
-    }
 
-    # ---- Test case 1: 完整 agent 运行 ----
-    input_path, output_path = get_file_paths(task_id, dataset_path, 1, output_dir)
+async def run_test_case_async(
+    data: dict,
+    tc_idx: int,
+    dataset_path: str,
+    output_dir: str,
+    model: str | None,
+    max_steps: int,
+    tool_mode: str | None = None,
+) -> dict:
+    """run_test_case 的异步版本（不打印每一步）。"""
+    task_id = str(data["id"])
+    input_path, output_path = get_file_paths(task_id, dataset_path, tc_idx, output_dir)
     if not os.path.exists(input_path):
-        result["status"] = "error"
-        result["error"] = f"Input not found: {input_path}"
-        return result
+        return {"error": f"Input not found: {input_path}"}
 
     shutil.copy2(input_path, output_path)
+    scratch = tempfile.mkdtemp(prefix=f"excelagent_{tc_idx}_{task_id}_")
 
     t0 = time.time()
     try:
-        final_response, messages = run_benchmark(
-            instruction=instruction,
-            file_path=output_path,
-            instruction_type=instruction_type,
-            answer_position=answer_position,
-            max_steps=max_steps,
-            model=model,
-        )
-        elapsed = round(time.time() - t0, 2)
-
-        # 提取工具调用链
-        tool_calls = []
-        for msg in messages:
-            if msg["role"] == "assistant":
-                tc = parse_tool_call(msg["content"])
-                if tc:
-                    tool_calls.append(tc)
-
-        result["test_cases"]["1"] = {
-            "output_exists": os.path.exists(output_path),
-            "elapsed_seconds": elapsed,
-        }
-        result["conversation"] = messages
-        result["tool_calls"] = tool_calls
-        result["num_steps"] = len(tool_calls)
-
+        with scratch_directory(scratch), usage.track() as tokens:
+            _, messages = await run_benchmark_async(
+                instruction=data["instruction"],
+                file_path=output_path,
+                instruction_type=data["instruction_type"],
+                answer_position=data["answer_position"],
+                max_steps=max_steps,
+                model=model,
+                verbose=False,
+                tool_mode=tool_mode,
+            )
     except Exception as e:
+        return {"error": str(e)}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return _case_result(tc_idx, output_path, t0, messages, tokens)
+
+
+def _case_result(tc_idx: int, output_path: str, t0: float, messages: list[dict], tokens: usage.TokenUsage) -> dict:
+    assistant = [m for m in messages if m["role"] == "assistant"]
+    case = {
+        "output_exists": os.path.exists(output_path),
+        "elapsed_seconds": round(time.time() - t0, 2),
+        "turns": len(assistant),
+        "tool_calls": sum(len(extract_tool_calls(m)) for m in assistant),
+        "usage": tokens.as_dict(),
+    }
+    if tc_idx == 1:
+        case["conversation"] = messages
+    return case
+
+
+def assemble_result(data: dict, cases: dict[int, dict], timestamp: str) -> dict:
+    """把 3 个 test case 的结果合成一条日志记录；test case 1 失败时整个任务记为 error。"""
+    result = {
+        "id": str(data["id"]),
+        "instruction_type": data["instruction_type"],
+        "status": "pending",
+        "test_cases": {},
+        "timestamp": timestamp,
+    }
+
+    first = dict(cases[1])
+    if "error" in first:
         result["status"] = "error"
-        result["error"] = str(e)
+        result["error"] = first["error"]
         return result
 
-    # ---- Test cases 2 & 3: 重新运行 agent ----
-    for tc_idx in [2, 3]:
-        inp, out = get_file_paths(task_id, dataset_path, tc_idx, output_dir)
-        if not os.path.exists(inp):
-            result["test_cases"][str(tc_idx)] = {"error": "input not found"}
-            continue
+    messages = first.pop("conversation")
+    tool_calls = []
+    for msg in messages:
+        if msg["role"] == "assistant":
+            tool_calls.extend(extract_tool_calls(msg))
 
-        shutil.copy2(inp, out)
-        try:
-            run_benchmark(
-                instruction=instruction,
-                file_path=out,
-                instruction_type=instruction_type,
-                answer_position=answer_position,
-                max_steps=max_steps,
-                model=model,
-            )
-            result["test_cases"][str(tc_idx)] = {
-                "output_exists": os.path.exists(out),
-            }
-        except Exception as e:
-            result["test_cases"][str(tc_idx)] = {"error": str(e)}
+    result["test_cases"]["1"] = first
+    result["conversation"] = messages
+    result["tool_calls"] = tool_calls
+    result["num_steps"] = len(tool_calls)
+
+    for tc_idx in (2, 3):
+        result["test_cases"][str(tc_idx)] = cases.get(tc_idx, {"error": "not run"})
 
+    result["efficiency"] = task_efficiency(result["test_cases"].values())
     result["status"] = "success"
     return result
 
 
+USAGE_KEYS = ("prompt_tokens", "cached_tokens", "completion_tokens", "total_tokens")
+EFFICIENCY_KEYS = ("turns", "tool_calls", *USAGE_KEYS)
+
+
+def task_efficiency(cases) -> dict:
+    """一个任务内已完成 test case 的 LLM 轮数、工具调用数与 token 用量之和。"""
+    totals = dict.fromkeys(EFFICIENCY_KEYS, 0)
+    totals["test_cases"] = 0
+    for case in cases:
+        if "error" in case:
+            continue
+        totals["test_cases"] += 1
+        totals["turns"] += case["turns"]
+        totals["tool_calls"] += case["tool_calls"]
+        for key in USAGE_KEYS:
+            totals[key] += case["usage"][key]
+    return totals
+
+
+def summarize_efficiency(records: list[dict]) -> dict:
+    """各任务 efficiency 的均值（每任务 = 其 test case 之和）。"""
+    if not records:
+        return {"tasks": 0}
+    summary = {"tasks": len(records)}
+    for key in EFFICIENCY_KEYS:
+        summary[f"{key}_per_task"] = round(sum(r[key] for r in records) / len(records), 1)
+    return summary
+
+
+def run_single_task(
+    data: dict,
+    dataset_path: str,
+    output_dir: str,
+    model: str | None,
+    max_steps: int,
+    tool_mode: str | None = None,
+) -> dict:
+    """对一个 benchmark 任务运行 ExcelAgent（3 个 test case，依次执行）。"""
+    timestamp = datetime.now().isoformat()
+    cases = {1: run_test_case(data, 1, dataset_path, output_dir, model, max_steps, tool_mode=tool_mode)}
+    if "error" not in cases[1]:
+        for tc_idx in (2, 3):
+            cases[tc_idx] = run_test_case(data, tc_idx, dataset_path, output_dir, model, max_steps,
+                                          tool_mode=tool_mode)
+    return assemble_result(data, cases, timestamp)
+
+
+def run_tasks_parallel(
+    tasks: list[dict],
+    workers: int,
+    dataset_path: str,
+    output_dir: str,
+    model: str | None,
+    max_steps: int,
+    log: ResultLog,
+    tool_mode: str | None = None,
+) -> tuple[int, int]:
+    """以 (任务, test case) 为单位并发运行；某任务的 3 个 test case 都完成后立即写日志。
+
+    Returns:
+        (success_count, error_count)
+    """
+    success_count = error_count = 0
+    timestamps: dict[int, str] = {}
+    cases: dict[int, dict[int, dict]] = {}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench") as pool:
+        futures = {}
+        for i, data in enumerate(tasks):
+            timestamps[i] = datetime.now().isoformat()
+            cases[i] = {}
+            for tc_idx in (1, 2, 3):
+                future = pool.submit(
+                    run_test_case, data, tc_idx, dataset_path, output_dir, model, max_steps, False, tool_mode
+                )
+                futures[future] = (i, tc_idx)
+
+        with tqdm(total=len(tasks), desc=f"ExcelAgent Benchmark ({workers} workers)") as bar:
+            for future in as_completed(futures):
+                i, tc_idx = futures[future]
+                try:
+                    cases[i][tc_idx] = future.result()
+                except Exception as e:
+                    cases[i][tc_idx] = {"error": str(e)}
+                if len(cases[i]) < 3:
+                    continue
+
+                result = assemble_result(tasks[i], cases.pop(i), timestamps[i])
+                log.append(result)
+                if result["status"] == "success":
+                    success_count += 1
+                else:
+                    error_count += 1
+                bar.update(1)
+
+    return success_count, error_count
+
+
+async def run_tasks_async(
+    tasks: list[dict],
+    concurrency: int,
+    dataset_path: str,
+    output_dir: str,
+    model: str | None,
+    max_steps: int,
+    log: ResultLog,
+    tool_mode: str | None = None,
+) -> tuple[int, int]:
+    """run_tasks_parallel 的 asyncio 版本：最多 concurrency 个 test case 同时运行。
+
+    Returns:
+        (success_count, error_count)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_case(data: dict, tc_idx: int) -> dict:
+        async with semaphore:
+            return await run_test_case_async(data, tc_idx, dataset_path, output_dir, model, max_steps, tool_mode)
+
+    async def run_task(data: dict, bar: tqdm) -> bool:
+        timestamp = datetime.now().isoformat()
+        outcomes = await asyncio.gather(*(run_case(data, i) for i in (1, 2, 3)), return_exceptions=True)
+        cases = {
+            tc_idx: {"error": str(r)} if isinstance(r, BaseException) else r
+            for tc_idx, r in zip((1, 2, 3), outcomes)
+        }
+        result = assemble_result(data, cases, timestamp)
+        log.append(result)
+        bar.update(1)
+        return result["status"] == "success"
+
+    with tqdm(total=len(tasks), desc=f"ExcelAgent Benchmark (async, {concurrency} concurrent)") as bar:
+        succeeded = await asyncio.gather(*(run_task(data, bar) for data in tasks))
+    success_count = sum(succeeded)
+    return success_count, len(succeeded) - success_count
+
+
 # ---------------------------------------------------------------------------
 # 主入口
 # ---------------------------------------------------------------------------
@@ -194,7 +413,22 @@ def main():
     parser.add_argument("--resume", action="store_true", help="Skip already completed tasks")
     parser.add_argument("--task_ids", type=str, default=None, help="Comma-separated task IDs to run")
     parser.add_argument("--setting", type=str, default="agent", help="Setting name for output dir")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of test cases to run concurrently (1 = sequential)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Drive agent sessions with asyncio instead of threads")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests/min limit per model (default: LLM_RPM)")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens/min limit per model (default: LLM_TPM)")
+    parser.add_argument("--llm_cache", choices=("off", "rw", "replay"), default=None,
+                        help="LLM response cache: rw = read-write, replay = offline read-only (default: LLM_CACHE)")
+    parser.add_argument("--tool_mode", choices=("text", "native"), default=None,
+                        help="text: ```tool_call``` blocks; native: OpenAI tools API (default: LLM_TOOL_MODE)")
     args = parser.parse_args()
+    LIMITER.configure(rpm=args.rpm, tpm=args.tpm)
+    LLM_CACHE.configure(mode=args.llm_cache)
+    if PYTHON_POOL is not None:
+        # run_python 的 worker 在第一次 LLM 请求期间完成预导入
+        PYTHON_POOL.warm(min(args.workers, PYTHON_POOL.size))
 
     dataset_path = find_dataset_path(args.dataset)
     with open(os.path.join(dataset_path, "dataset.json"), "r", encoding="utf-8") as f:
@@ -229,32 +463,46 @@ def main():
     print(f"Log file: {conv_log_path}")
     print()
 
-    success_count = 0
-    error_count = 0
+    log = ResultLog(conv_log_path)
+    tasks = [d for d in tasks if str(d["id"]) not in completed_ids]
 
-    for data in tqdm(tasks, desc="ExcelAgent Benchmark"):
-        if str(data["id"]) in completed_ids:
-            continue
-
-        try:
-            result = run_single_task(data, dataset_path, output_dir, args.model, args.max_steps)
-        except Exception as e:
-            result = {
-                "id": data["id"],
-                "status": "error",
-                "error": str(e),
-                "timestamp": datetime.now().isoformat(),
-            }
-
-        if result["status"] == "success":
-            success_count += 1
-        else:
-            error_count += 1
-
-        with open(conv_log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    if args.use_async:
+        success_count, error_count = asyncio.run(run_tasks_async(
+            tasks, max(args.workers, 1), dataset_path, output_dir, args.model, args.max_steps, log, args.tool_mode
+        ))
+    elif args.workers > 1:
+        success_count, error_count = run_tasks_parallel(
+            tasks, args.workers, dataset_path, output_dir, args.model, args.max_steps, log, args.tool_mode
+        )
+    else:
+        success_count = 0
+        error_count = 0
+
+        for data in tqdm(tasks, desc="ExcelAgent Benchmark"):
+            try:
+                result = run_single_task(data, dataset_path, output_dir, args.model, args.max_steps, args.tool_mode)
+            except Exception as e:
+                result = {
+                    "id": data["id"],
+                    "status": "error",
+                    "error": str(e),
+                    "timestamp": datetime.now().isoformat(),
+                }
+
+            if result["status"] == "success":
+                success_count += 1
+            else:
+                error_count += 1
+
+            log.append(result)
 
     print(f"\nDone. success={success_count}, error={error_count}")
+    print(f"Efficiency ({args.tool_mode or TOOL_MODE} mode): {json.dumps(summarize_efficiency(log.efficiency))}")
+    print(f"Prompt cache: {json.dumps(usage.TOTAL.cache_summary())}")
+    print(f"LLM latency: {json.dumps(LLM_LATENCY.summary())}")
+    if LLM_CACHE.enabled:
+        print(f"LLM cache: {json.dumps(LLM_CACHE.stats())}")
+    print(f"Rate limiter: {json.dumps(LIMITER.stats())}")
     print(f"Results: {conv_log_path}")
     print(f"Outputs: {output_dir}")
     print(f"\nNext step: python benchmark/evaluate.py --dataset {args.dataset} --model {safe_model} --setting {args.setting}")
@@ -0,0 +1,170 @@
+"""LLM 响应缓存 — SQLite 内容寻址，用于重复运行同一批任务时免去相同请求的费用
+
+键为 (调用类型, model, temperature, max_tokens, messages, tools) 的 SHA-256。模式:
+    - off: 不使用缓存（默认）
+    - rw: 命中时直接返回缓存的回复，未命中时请求 LLM 并写入
+    - replay: 只读回放，未命中时抛出 CacheMiss，不会发出任何网络请求（无需 API Key）
+
+条目数超过 max_entries 时按最近使用时间淘汰（LRU）。命中不经过限流器、不计入 token 用量。
+
+环境变量: LLM_CACHE（off / rw / replay）、LLM_CACHE_PATH（默认项目根目录下
+.cache/llm_responses.sqlite）、LLM_CACHE_MAX_ENTRIES（默认 100000）。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+MODES = ("off", "rw", "replay")
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "llm_responses.sqlite"
+)
+
+
+class CacheMiss(LookupError):
+    """replay 模式下请求不在缓存中。"""
+
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_PATH, mode: str = "off", max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._conn: sqlite3.Connection | None = None
+        self._count = 0
+        self._lock = threading.Lock()
+        self.mode = "off"
+        self.configure(mode=mode)
+
+    def configure(self, mode: str | None = None, path: str | None = None, max_entries: int | None = None) -> None:
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"未知的缓存模式: {mode}，可用: {', '.join(MODES)}")
+        with self._lock:
+            if path is not None and path != self.path:
+                self._close()
+                self.path = path
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if mode is not None:
+                self.mode = mode
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, payload TEXT NOT NULL, created REAL, last_used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def key(
+        self,
+        kind: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        messages: list[dict],
+        tools: list[dict] | None = None,
+    ) -> str | None:
+        """请求的缓存键；缓存关闭时返回 None（不计算哈希）。"""
+        if not self.enabled:
+            return None
+        request = {
+            "kind": kind,
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "tools": tools,
+        }
+        blob = json.dumps(request, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str | None) -> dict | None:
+        """命中时返回缓存的 payload；replay 模式未命中时抛出 CacheMiss。"""
+        if key is None:
+            return None
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT payload FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.mode == "replay":
+                    raise CacheMiss(f"LLM 响应不在缓存中（replay 模式）: {key[:16]}")
+                return None
+            self.hits += 1
+            if self.mode == "rw":
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str | None, model: str, payload: dict) -> None:
+        """写入一条回复（只在 rw 模式下生效），超出 max_entries 时淘汰最久未使用的条目。"""
+        if key is None or self.mode != "rw":
+            return
+        blob = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO responses (key, model, payload, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, blob, now, now),
+            )
+            if cursor.rowcount:
+                self._count += 1
+                self.writes += 1
+            excess = self._count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._count -= excess
+                self.evictions += excess
+            conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": self._count if self._conn is not None else None,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+CACHE = ResponseCache(
+    path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH),
+    mode=os.getenv("LLM_CACHE", "off"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000")),
+)
@@ -1,9 +1,30 @@
-"""OpenRouter LLM 客户端（OpenAI 兼容格式）"""
+"""OpenRouter LLM 客户端（OpenAI 兼容格式）
 
+进程内共享一个连接池：同步客户端（httpx.Client 线程安全）全局一个，异步客户端的连接
+绑定事件循环，每个事件循环一个。连接保持 keep-alive，安装了 h2 时使用 HTTP/2。
+每次调用的建连 / 首 token / 总耗时记入 llm.latency.STATS，token 用量记入 llm.usage；
+调用前先查 llm.cache.CACHE（开启时），未命中再向 llm.ratelimit.LIMITER 申请额度。
+"""
+
+import asyncio
+import importlib.util
+import json
 import os
+import threading
+import weakref
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import DEFAULT_TIMEOUT, AsyncOpenAI, OpenAI
+from openai.types.chat import ChatCompletionMessage
+
+from llm import latency, usage
+from llm.cache import CACHE
+from llm.ratelimit import LIMITER, estimate_tokens
+
+try:
+    import httpx
+except ImportError:  # 不基于 httpx 的 openai 发行版：使用 SDK 自带的连接池
+    httpx = None
 
 load_dotenv()
 
@@ -12,12 +33,133 @@ BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "4096"))
 
+# 连接池
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "100"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("LLM_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+# 显式前缀缓存标记：auto 时只对需要 cache_control 才缓存的模型（Anthropic、Gemini）添加；
+# OpenAI、DeepSeek 等服务端自动缓存相同前缀，无需标记
+PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "auto")
+_EXPLICIT_CACHE_MODELS = ("anthropic/", "google/gemini")
+
+# SDK 内部的重试绕过限流器（不会降低并发），默认关闭，由 agent.core 的重试循环负责
+SDK_MAX_RETRIES = int(os.getenv("LLM_SDK_MAX_RETRIES", "0"))
+
+_client: OpenAI | None = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+if httpx is not None:
+
+    class _TracingTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            request.extensions["trace"] = latency.trace
+            return super().handle_request(request)
+
+    class _AsyncTracingTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            request.extensions["trace"] = latency.atrace
+            return await super().handle_async_request(request)
+
+
+def _transport_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        "http2": HTTP2,
+    }
+
 
 def get_client() -> OpenAI:
-    """获取 OpenRouter 客户端实例。"""
+    """进程内共享的 OpenRouter 客户端，各线程复用同一连接池。"""
+    global _client
+    if _client is not None:
+        return _client
     if not API_KEY:
         raise ValueError("请设置 OPENROUTER_API_KEY 环境变量")
-    return OpenAI(base_url=BASE_URL, api_key=API_KEY)
+    with _lock:
+        if _client is None:
+            http_client = None
+            if httpx is not None:
+                http_client = httpx.Client(
+                    transport=_TracingTransport(**_transport_options()),
+                    timeout=DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                )
+            _client = OpenAI(base_url=BASE_URL, api_key=API_KEY, http_client=http_client, max_retries=SDK_MAX_RETRIES)
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """当前事件循环共享的异步客户端。"""
+    if not API_KEY:
+        raise ValueError("请设置 OPENROUTER_API_KEY 环境变量")
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            http_client = None
+            if httpx is not None:
+                http_client = httpx.AsyncClient(
+                    transport=_AsyncTracingTransport(**_transport_options()),
+                    timeout=DEFAULT_TIMEOUT,
+                    follow_redirects=True,
+                )
+            client = _async_clients[loop] = AsyncOpenAI(
+                base_url=BASE_URL, api_key=API_KEY, http_client=http_client, max_retries=SDK_MAX_RETRIES
+            )
+    return client
+
+
+def _cache_markers(model: str) -> bool:
+    if PROMPT_CACHE == "auto":
+        return model.startswith(_EXPLICIT_CACHE_MODELS)
+    return PROMPT_CACHE != "0"
+
+
+def _with_cache_control(messages: list[dict], model: str) -> list[dict]:
+    """给 system prompt 加 cache_control 断点，使其后各步只按缓存价计费与处理。
+
+    调用方的 messages 不变（日志中仍是字符串 content），只改写发送出去的副本。
+    """
+    if not messages or not _cache_markers(model):
+        return messages
+    first = messages[0]
+    if first["role"] != "system" or not isinstance(first["content"], str):
+        return messages
+    system = {
+        "role": "system",
+        "content": [{"type": "text", "text": first["content"], "cache_control": {"type": "ephemeral"}}],
+    }
+    return [system, *messages[1:]]
+
+
+class _StreamUsage:
+    """流式回复的 token 用量：优先使用最后一个 chunk 中的 usage，流被提前关闭时按字符数估算。"""
+
+    def __init__(self, messages: list[dict]):
+        self.messages = messages
+        self.chars = 0
+        self.reported: int | None = None
+
+    def update(self, chunk) -> None:
+        if chunk.usage is not None:
+            self.reported = usage.record_response(chunk)
+        elif chunk.choices and chunk.choices[0].delta.content:
+            self.chars += len(chunk.choices[0].delta.content)
+
+    def finish(self) -> int:
+        if self.reported is not None:
+            return self.reported
+        prompt = estimate_tokens(self.messages, 0)
+        usage.record(prompt, self.chars // 4, estimated=True)
+        return prompt + self.chars // 4
 
 
 def chat(
@@ -32,16 +174,25 @@ def chat(
         messages: [{"role": "user", "content": "..."}]
         model: 模型ID，默认使用环境变量配置
     """
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("chat", model, temperature, max_tokens, messages)
+    if (cached := CACHE.get(key)) is not None:
+        return cached["content"]
+
     client = get_client()
-    response = client.chat.completions.create(
-        model=model or DEFAULT_MODEL,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens or MAX_TOKENS,
-    )
+    with LIMITER.limit(model, estimate_tokens(messages, max_tokens)) as ticket, latency.measure(model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=_with_cache_control(messages, model),
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        ticket.used_tokens = usage.record_response(response)
     content = response.choices[0].message.content
     if content is None:
         raise ValueError("LLM returned None content")
+    CACHE.put(key, model, {"content": content})
     return content
 
 
@@ -51,15 +202,188 @@ def chat_stream(
     temperature: float = 0.7,
     max_tokens: int | None = None,
 ):
-    """流式聊天，yield 每个文本片段。"""
+    """流式聊天，yield 每个文本片段；关闭生成器即取消本次生成。
+
+    缓存的是调用方实际收到的文本（提前关闭时为关闭前的部分），命中时一次 yield 全部内容。
+    """
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("stream", model, temperature, max_tokens, messages)
+    if (cached := CACHE.get(key)) is not None:
+        yield cached["content"]
+        return
+
+    client = get_client()
+    with LIMITER.limit(model, estimate_tokens(messages, max_tokens)) as ticket, \
+            latency.measure(model, stream=True) as timing:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=_with_cache_control(messages, model),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        meter = _StreamUsage(messages)
+        received: list[str] = []
+        consumed = False
+        try:
+            for chunk in stream:
+                meter.update(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    timing.first_token()
+                    received.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            consumed = True
+        except GeneratorExit:
+            consumed = True
+            raise
+        finally:
+            # 调用方提前关闭生成器时断开连接，服务端随之停止生成
+            stream.close()
+            ticket.used_tokens = meter.finish()
+            if consumed and received:
+                CACHE.put(key, model, {"content": "".join(received)})
+
+
+async def achat(
+    messages: list[dict],
+    model: str | None = None,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+) -> str:
+    """chat() 的异步版本：等待回复期间不占用线程。"""
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("chat", model, temperature, max_tokens, messages)
+    if (cached := CACHE.get(key)) is not None:
+        return cached["content"]
+
+    client = get_async_client()
+    async with LIMITER.alimit(model, estimate_tokens(messages, max_tokens)) as ticket:
+        with latency.measure(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=_with_cache_control(messages, model),
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        ticket.used_tokens = usage.record_response(response)
+    content = response.choices[0].message.content
+    if content is None:
+        raise ValueError("LLM returned None content")
+    CACHE.put(key, model, {"content": content})
+    return content
+
+
+async def achat_stream(
+    messages: list[dict],
+    model: str | None = None,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+):
+    """chat_stream() 的异步版本，async for 逐个得到文本片段。"""
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("stream", model, temperature, max_tokens, messages)
+    if (cached := CACHE.get(key)) is not None:
+        yield cached["content"]
+        return
+
+    client = get_async_client()
+    async with LIMITER.alimit(model, estimate_tokens(messages, max_tokens)) as ticket:
+        with latency.measure(model, stream=True) as timing:
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=_with_cache_control(messages, model),
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            meter = _StreamUsage(messages)
+            received: list[str] = []
+            consumed = False
+            try:
+                async for chunk in stream:
+                    meter.update(chunk)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        timing.first_token()
+                        received.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                consumed = True
+            except GeneratorExit:
+                consumed = True
+                raise
+            finally:
+                await stream.close()
+                ticket.used_tokens = meter.finish()
+                if consumed and received:
+                    CACHE.put(key, model, {"content": "".join(received)})
+
+
+def chat_with_tools(
+    messages: list[dict],
+    tools: list[dict],
+    model: str | None = None,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+):
+    """使用原生 function calling 发送请求，返回 assistant 消息（content 与 tool_calls）。
+
+    Args:
+        tools: OpenAI tools 格式的工具定义，见 agent.dispatcher.get_tool_schemas
+    """
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("tools", model, temperature, max_tokens, messages, tools)
+    if (cached := CACHE.get(key)) is not None:
+        return ChatCompletionMessage.model_validate(cached)
+
     client = get_client()
-    stream = client.chat.completions.create(
-        model=model or DEFAULT_MODEL,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens or MAX_TOKENS,
-        stream=True,
-    )
-    for chunk in stream:
-        if chunk.choices and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
+    with LIMITER.limit(model, _estimate_with_tools(messages, tools, max_tokens)) as ticket, latency.measure(model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=_with_cache_control(messages, model),
+            tools=tools,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        ticket.used_tokens = usage.record_response(response)
+    message = response.choices[0].message
+    CACHE.put(key, model, message.model_dump(exclude_none=True))
+    return message
+
+
+async def achat_with_tools(
+    messages: list[dict],
+    tools: list[dict],
+    model: str | None = None,
+    temperature: float = 0.7,
+    max_tokens: int | None = None,
+):
+    """chat_with_tools() 的异步版本。"""
+    model = model or DEFAULT_MODEL
+    max_tokens = max_tokens or MAX_TOKENS
+    key = CACHE.key("tools", model, temperature, max_tokens, messages, tools)
+    if (cached := CACHE.get(key)) is not None:
+        return ChatCompletionMessage.model_validate(cached)
+
+    client = get_async_client()
+    async with LIMITER.alimit(model, _estimate_with_tools(messages, tools, max_tokens)) as ticket:
+        with latency.measure(model):
+            response = await client.chat.completions.create(
+                model=model,
+                messages=_with_cache_control(messages, model),
+                tools=tools,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        ticket.used_tokens = usage.record_response(response)
+    message = response.choices[0].message
+    CACHE.put(key, model, message.model_dump(exclude_none=True))
+    return message
+
+
+def _estimate_with_tools(messages: list[dict], tools: list[dict], max_tokens: int) -> int:
+    return estimate_tokens(messages, max_tokens) + len(json.dumps(tools, ensure_ascii=False)) // 4
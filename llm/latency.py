@@ -0,0 +1,123 @@
+"""LLM 调用延迟统计 — 建连 / 首 token / 总耗时
+
+每次 chat 调用在 measure() 上下文中进行，HTTP 传输层通过 trace 回调把建连
+（TCP + TLS）耗时记到当前调用上；复用连接池中的连接时建连耗时为 0。
+非流式调用的首 token 时间为收到响应的时间（服务端生成完才返回），流式调用为收到
+第一个文本片段的时间。调用方提前关闭的流（如已拿到完整 tool_call）记为 stopped_early。
+"""
+
+import contextvars
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class CallTiming:
+    __slots__ = ("model", "stream", "start", "connect", "ttft", "total", "stopped_early", "_connect_start")
+
+    def __init__(self, model: str, stream: bool):
+        self.model = model
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.connect = 0.0
+        self.ttft: float | None = None
+        self.total: float | None = None
+        self.stopped_early = False
+        self._connect_start: float | None = None
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+
+class LatencyStats:
+    """最近 maxlen 次调用的耗时记录（线程安全）。"""
+
+    def __init__(self, maxlen: int = 10000):
+        self._records: deque[CallTiming] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, timing: CallTiming) -> None:
+        with self._lock:
+            self._records.append(timing)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def summary(self) -> dict:
+        """{"calls", "new_connections", "stopped_early", "connect_ms", "ttft_ms", "total_ms"}，
+        耗时各项为 mean/p50/p95。"""
+        with self._lock:
+            records = list(self._records)
+        connects = [r.connect for r in records if r.connect > 0]
+        return {
+            "calls": len(records),
+            "new_connections": len(connects),
+            "stopped_early": sum(1 for r in records if r.stopped_early),
+            "connect_ms": _describe(connects),
+            "ttft_ms": _describe([r.ttft for r in records if r.ttft is not None]),
+            "total_ms": _describe([r.total for r in records if r.total is not None]),
+        }
+
+
+def _describe(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(v * 1000 for v in values)
+    return {
+        "mean": round(statistics.fmean(values), 1),
+        "p50": round(values[len(values) // 2], 1),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+    }
+
+
+STATS = LatencyStats()
+
+_current: contextvars.ContextVar[CallTiming | None] = contextvars.ContextVar("llm_call_timing", default=None)
+
+
+@contextmanager
+def measure(model: str, stream: bool = False):
+    """记录一次 LLM 调用；正常结束或流被调用方提前关闭时计入 STATS。"""
+    timing = CallTiming(model, stream)
+    token = _current.set(timing)
+    completed = False
+    try:
+        yield timing
+        completed = True
+    except GeneratorExit:
+        timing.stopped_early = completed = True
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # 生成器在其他上下文中被关闭
+        if completed:
+            timing.total = time.perf_counter() - timing.start
+            timing.first_token()
+            STATS.add(timing)
+
+
+def _on_event(name: str) -> None:
+    timing = _current.get()
+    if timing is None:
+        return
+    if name == "connection.connect_tcp.started":
+        timing._connect_start = time.perf_counter()
+    elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        if timing._connect_start is not None:
+            timing.connect = time.perf_counter() - timing._connect_start
+
+
+def trace(name: str, info: dict) -> None:
+    """httpcore 同步 trace 回调。"""
+    _on_event(name)
+
+
+async def atrace(name: str, info: dict) -> None:
+    """httpcore 异步 trace 回调。"""
+    _on_event(name)
@@ -0,0 +1,276 @@
+"""LLM 调用限流 — 按模型的 RPM / TPM 令牌桶 + AIMD 并发控制
+
+进程内所有会话（run、run_benchmark、线程或 asyncio）在调用 LLM 前都从同一个 LIMITER
+申请额度:
+    - 每个模型一组令牌桶：每分钟请求数、每分钟 token 数（发送前按 prompt 长度 + max_tokens
+      预估，拿到 usage 后按实际用量多退少补）
+    - 并发上限按 AIMD 自适应：成功一次加 1/limit，遇到 429 减半
+    - 429 的 Retry-After / retry-after-ms 会让该模型暂停到指定时间，所有等待都加随机抖动，
+      避免大量会话同时醒来再次撞上限
+
+环境变量: LLM_RPM、LLM_TPM（默认不限）、LLM_MAX_CONCURRENCY（默认 32）。
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+
+POLL_INTERVAL = 0.05
+DEFAULT_COOLDOWN = 1.0
+
+
+class _Bucket:
+    """容量为一分钟额度、匀速补充的令牌桶。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)  # 超过一分钟额度的请求等桶满即可
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelState:
+    def __init__(self, rpm: float | None, tpm: float | None, max_concurrency: int):
+        self.requests = _Bucket(rpm) if rpm else None
+        self.tokens = _Bucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.rate_limited = 0
+
+
+class Ticket:
+    """一次已获准的调用；调用方在拿到 usage 后设置 used_tokens。"""
+
+    __slots__ = ("model", "tokens", "used_tokens", "retry_after", "throttled")
+
+    def __init__(self, model: str, tokens: int):
+        self.model = model
+        self.tokens = tokens
+        self.used_tokens: int | None = None
+        self.retry_after: float | None = None
+        self.throttled = False
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        jitter: float = 0.2,
+    ):
+        self.defaults = {"rpm": rpm, "tpm": tpm, "max_concurrency": max_concurrency}
+        self.min_concurrency = min_concurrency
+        self.jitter = jitter
+        self._overrides: dict[str, dict] = {}
+        self._models: dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        model: str | None = None,
+        rpm: float | None = None,
+        tpm: float | None = None,
+        max_concurrency: int | None = None,
+    ) -> None:
+        """设置限额；model 为 None 时修改所有模型的默认值。已建立的模型状态会被重置。"""
+        settings = {k: v for k, v in (("rpm", rpm), ("tpm", tpm), ("max_concurrency", max_concurrency))
+                    if v is not None}
+        with self._lock:
+            if model is None:
+                self.defaults.update(settings)
+                self._models.clear()
+            else:
+                self._overrides.setdefault(model, {}).update(settings)
+                self._models.pop(model, None)
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            settings = {**self.defaults, **self._overrides.get(model, {})}
+            state = self._models[model] = _ModelState(**settings)
+        return state
+
+    # ------------------------------------------------------------------
+    # 申请与归还
+    # ------------------------------------------------------------------
+
+    def _reserve(self, ticket: Ticket) -> float:
+        """额度足够时占用并返回 0，否则返回建议等待的秒数。"""
+        with self._lock:
+            state = self._state(ticket.model)
+            now = time.monotonic()
+            wait = state.cooldown_until - now
+            if state.in_flight >= max(int(state.limit), self.min_concurrency):
+                wait = max(wait, POLL_INTERVAL)
+            if state.requests:
+                wait = max(wait, state.requests.wait_time(1, now))
+            if state.tokens:
+                wait = max(wait, state.tokens.wait_time(ticket.tokens, now))
+            if wait > 0:
+                return wait
+            if state.requests:
+                state.requests.take(1)
+            if state.tokens:
+                state.tokens.take(ticket.tokens)
+            state.in_flight += 1
+            return 0.0
+
+    def _jittered(self, wait: float) -> float:
+        return wait * (1 + random.uniform(0, self.jitter))
+
+    def acquire(self, model: str, tokens: int = 0) -> Ticket:
+        ticket = Ticket(model, tokens)
+        while (wait := self._reserve(ticket)) > 0:
+            time.sleep(self._jittered(wait))
+        return ticket
+
+    async def aacquire(self, model: str, tokens: int = 0) -> Ticket:
+        ticket = Ticket(model, tokens)
+        while (wait := self._reserve(ticket)) > 0:
+            await asyncio.sleep(self._jittered(wait))
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """归还并发名额，按实际用量修正 token 桶，并据结果调整并发上限。"""
+        with self._lock:
+            state = self._state(ticket.model)
+            state.in_flight = max(0, state.in_flight - 1)
+            if state.tokens and ticket.used_tokens is not None:
+                diff = ticket.tokens - ticket.used_tokens
+                if diff > 0:
+                    state.tokens.give(diff)
+                else:
+                    state.tokens.take(-diff)
+            if ticket.throttled:
+                state.rate_limited += 1
+                state.limit = max(float(self.min_concurrency), state.limit / 2)
+                pause = ticket.retry_after if ticket.retry_after is not None else DEFAULT_COOLDOWN
+                state.cooldown_until = max(state.cooldown_until, time.monotonic() + self._jittered(pause))
+            else:
+                state.limit = min(float(state.max_concurrency), state.limit + 1 / state.limit)
+
+    @contextmanager
+    def limit(self, model: str, tokens: int = 0):
+        ticket = self.acquire(model, tokens)
+        try:
+            yield ticket
+        except Exception as e:
+            _mark_throttled(ticket, e)
+            raise
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def alimit(self, model: str, tokens: int = 0):
+        ticket = await self.aacquire(model, tokens)
+        try:
+            yield ticket
+        except Exception as e:
+            _mark_throttled(ticket, e)
+            raise
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                model: {
+                    "concurrency_limit": round(state.limit, 2),
+                    "in_flight": state.in_flight,
+                    "rate_limited": state.rate_limited,
+                }
+                for model, state in self._models.items()
+            }
+
+
+def retry_after(exc: Exception) -> float | None:
+    """从 429 响应头读取需要等待的秒数。"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _mark_throttled(ticket: Ticket, exc: Exception) -> None:
+    if getattr(exc, "status_code", None) == 429:
+        ticket.throttled = True
+        ticket.retry_after = retry_after(exc)
+
+
+def text_tokens(text: str) -> int:
+    """快速估算文本的 token 数：ASCII 约 4 字符 / token，中文等非 ASCII 字符约 1 字符 / token。
+
+    只做一次 UTF-8 编码（C 实现），不依赖分词器；误差在 ±30% 以内，足够用于限流与上下文预算。
+    """
+    extra = len(text.encode("utf-8")) - len(text)  # 非 ASCII 字符多出的字节数，CJK 每字 2 字节
+    wide = extra // 2
+    return (len(text) - wide) // 4 + wide
+
+
+def message_tokens(message: dict) -> int:
+    """一条消息的估算 token 数（content 与 tool_calls 参数）。"""
+    content = message.get("content")
+    tokens = 4  # role 等消息结构开销
+    if isinstance(content, str):
+        tokens += text_tokens(content)
+    elif isinstance(content, list):
+        tokens += sum(text_tokens(part.get("text", "")) for part in content if isinstance(part, dict))
+    for call in message.get("tool_calls") or ():
+        tokens += text_tokens(call["function"]["arguments"])
+    return tokens
+
+
+def estimate_tokens(messages: list[dict], max_tokens: int) -> int:
+    """预估一次调用的 token 数：各消息的估算值之和加上 max_tokens。"""
+    return sum(message_tokens(m) for m in messages) + max_tokens
+
+
+def _env_float(name: str) -> float | None:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+LIMITER = RateLimiter(
+    rpm=_env_float("LLM_RPM"),
+    tpm=_env_float("LLM_TPM"),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+)
@@ -0,0 +1,90 @@
+"""LLM token 用量统计 — 按调用方上下文累计
+
+在 track() 上下文内的所有 LLM 调用（包括 asyncio.to_thread、copy_context 派生出的子任务）
+把 prompt / completion token 记到同一个 TokenUsage 上，用来统计每个任务的 token 消耗。
+服务端没有返回 usage 时（如流式回复被提前关闭）按字符数估算，并计入 estimated_calls。
+cached_tokens 为 prompt 中命中服务端前缀缓存的部分（usage.prompt_tokens_details.cached_tokens）。
+TOTAL 累计整个进程的用量。
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+
+
+class TokenUsage:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.estimated_calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, estimated: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+            self.estimated_calls += estimated
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "cached_tokens": self.cached_tokens,
+            "estimated_calls": self.estimated_calls,
+        }
+
+    def cache_summary(self) -> dict:
+        """prompt token 中命中 / 未命中前缀缓存的数量与命中率。"""
+        with self._lock:
+            prompt, cached = self.prompt_tokens, self.cached_tokens
+        return {
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "uncached_tokens": prompt - cached,
+            "hit_rate": round(cached / prompt, 3) if prompt else 0.0,
+        }
+
+
+TOTAL = TokenUsage()
+
+
+_current: contextvars.ContextVar[TokenUsage | None] = contextvars.ContextVar("llm_token_usage", default=None)
+
+
+@contextmanager
+def track():
+    """在此上下文内累计 token 用量，yield TokenUsage。"""
+    usage = TokenUsage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def record(prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0, estimated: bool = False) -> None:
+    """把一次调用的用量记入 TOTAL 与当前上下文（没有 track() 时只记 TOTAL）。"""
+    TOTAL.add(prompt_tokens, completion_tokens, cached_tokens, estimated)
+    usage = _current.get()
+    if usage is not None:
+        usage.add(prompt_tokens, completion_tokens, cached_tokens, estimated)
+
+
+def record_response(response) -> int | None:
+    """记录响应（或流的最后一个 chunk）中的 usage，返回 total_tokens（服务端未返回时为 None）。"""
+    if response.usage is None:
+        return None
+    details = getattr(response.usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    record(response.usage.prompt_tokens or 0, response.usage.completion_tokens or 0, cached)
+    return response.usage.total_tokens
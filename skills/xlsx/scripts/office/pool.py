@@ -0,0 +1,265 @@
+"""
+Pool of long-lived headless LibreOffice instances driven over UNO.
+
+Starting soffice costs several seconds; recalculating a workbook in an
+already running instance takes a fraction of that.  Each worker owns one
+soffice process with its own user profile (so instances never fight over
+the profile lock), connects to it over a UNO pipe -- or a localhost TCP
+socket when AF_UNIX sockets are blocked and the LD_PRELOAD shim from
+office.soffice is in effect -- and restarts it after a crash or timeout.
+
+Requires the LibreOffice Python bindings (``import uno``, e.g. the
+python3-uno package).
+
+Usage:
+    from office.pool import SofficePool
+
+    with SofficePool(workers=4) as pool:
+        futures = [pool.submit(path) for path in paths]   # queue API
+        errors = [f.result() for f in futures]            # None on success
+
+        pool.recalc("one.xlsx")                           # blocking helper
+"""
+
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from office.soffice import _needs_shim, get_soffice_env
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+CONNECT_TIMEOUT = 60
+_STOP = object()
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _prop(name, value):
+    p = PropertyValue()
+    p.Name = name
+    p.Value = value
+    return p
+
+
+class SofficeWorker:
+    """One soffice process plus its UNO connection."""
+
+    def __init__(self, index: int, profile_root: Path):
+        self.index = index
+        self.profile = profile_root / f"worker{index}"
+        self.proc = None
+        self.desktop = None
+        self.jobs = 0
+        self.restarts = 0
+
+    def _connection(self) -> str:
+        if _needs_shim():
+            # The shim cannot accept() on AF_UNIX, so use a TCP socket instead
+            return f"socket,host=127.0.0.1,port={_free_port()}"
+        return f"pipe,name=excelagent_{os.getpid()}_{self.index}"
+
+    def start(self):
+        connection = self._connection()
+        cmd = [
+            "soffice",
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--norestore",
+            "--nodefault",
+            "--nolockcheck",
+            f"-env:UserInstallation={self.profile.as_uri()}",
+            f"--accept={connection};urp;StarOffice.ComponentContext",
+        ]
+        self.proc = subprocess.Popen(
+            cmd,
+            env=get_soffice_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local
+        )
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while True:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"soffice exited with code {self.proc.returncode}")
+            try:
+                ctx = resolver.resolve(f"uno:{connection};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if time.monotonic() > deadline:
+                    self.kill()
+                    raise RuntimeError("Timed out connecting to soffice")
+                time.sleep(0.2)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", ctx
+        )
+
+    def healthy(self) -> bool:
+        if self.proc is None or self.proc.poll() is not None or self.desktop is None:
+            return False
+        try:
+            self.desktop.getFrames().getCount()
+            return True
+        except Exception:
+            return False
+
+    def kill(self):
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.proc.wait()
+        self.desktop = None
+
+    def stop(self):
+        if self.healthy():
+            try:
+                self.desktop.terminate()
+                self.proc.wait(timeout=10)
+            except Exception:
+                pass
+        self.kill()
+
+    def restart(self):
+        self.kill()
+        self.restarts += 1
+        self.start()
+
+    def recalc(self, abs_path: str, timeout: int):
+        """Recalculate and save one file; raises on failure or timeout."""
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            self.kill()
+
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.start()
+        try:
+            doc = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(abs_path),
+                "_blank",
+                0,
+                (_prop("Hidden", True), _prop("MacroExecutionMode", 0)),
+            )
+            if doc is None:
+                raise RuntimeError(f"LibreOffice could not open {abs_path}")
+            try:
+                doc.calculateAll()
+                doc.store()
+            finally:
+                doc.close(True)
+        except Exception as e:
+            if timed_out.is_set():
+                raise TimeoutError(f"Recalculation timed out after {timeout}s") from e
+            raise
+        finally:
+            watchdog.cancel()
+        self.jobs += 1
+
+
+class SofficePool:
+    """Queue of recalculation jobs served by ``workers`` soffice instances.
+
+    Workers start lazily on their first job.  Before each job the worker is
+    health-checked; a dead or hung instance is killed and restarted, and a
+    job that crashed its instance is retried once on a fresh one.
+    """
+
+    def __init__(self, workers: int = 2, timeout: int = 30, profile_root: str | None = None):
+        if uno is None:
+            raise RuntimeError("LibreOffice Python bindings (uno) are not available")
+        self.timeout = timeout
+        self._own_root = profile_root is None
+        self.profile_root = Path(profile_root or tempfile.mkdtemp(prefix="soffice_pool_"))
+        self.workers = [SofficeWorker(i, self.profile_root) for i in range(workers)]
+        self._queue = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._serve, args=(w,), daemon=True, name=f"soffice-{w.index}")
+            for w in self.workers
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, filename, timeout: int | None = None) -> Future:
+        """Queue a file; the future resolves to None on success or an error string."""
+        future = Future()
+        self._queue.put((str(Path(filename).absolute()), timeout or self.timeout, future))
+        return future
+
+    def recalc(self, filename, timeout: int | None = None):
+        return self.submit(filename, timeout).result()
+
+    def map(self, filenames, timeout: int | None = None) -> list:
+        futures = [self.submit(f, timeout) for f in filenames]
+        return [f.result() for f in futures]
+
+    def stats(self) -> list[dict]:
+        return [{"worker": w.index, "jobs": w.jobs, "restarts": w.restarts} for w in self.workers]
+
+    def _serve(self, worker: SofficeWorker):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                worker.stop()
+                return
+            abs_path, timeout, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            future.set_result(self._run(worker, abs_path, timeout))
+
+    def _run(self, worker: SofficeWorker, abs_path: str, timeout: int):
+        error = None
+        for _ in range(2):
+            try:
+                if worker.proc is None:
+                    worker.start()
+                elif not worker.healthy():
+                    worker.restart()
+                worker.recalc(abs_path, timeout)
+                return None
+            except TimeoutError as e:
+                return str(e)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if worker.healthy():
+                    break
+                # The instance died mid-job: retry once on a fresh one
+        return error
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        if self._own_root:
+            shutil.rmtree(self.profile_root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,6 +1,7 @@
 """
 Excel Formula Recalculation Script
-Recalculates all formulas in an Excel file using LibreOffice
+Recalculates all formulas in an Excel file with the native Python engine
+(tools.formula), falling back to LibreOffice for unsupported formulas
 """
 
 import json
@@ -8,12 +9,25 @@ import os
 import platform
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from office.soffice import get_soffice_env
 
 from openpyxl import load_workbook
 
+# Make the ExcelAgent project root importable for the native engine
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+try:
+    from tools.formula import UnsupportedFormula, recalc_file
+except ImportError:
+    recalc_file = None
+
+ENGINES = ("auto", "native", "libreoffice")
+
 MACRO_DIR_MACOS = "~/Library/Application Support/LibreOffice/4/user/basic/Standard"
 MACRO_DIR_LINUX = "~/.config/libreoffice/4/user/basic/Standard"
 MACRO_FILENAME = "Module1.xba"
@@ -67,12 +81,46 @@ def setup_libreoffice_macro():
         return False
 
 
-def recalc(filename, timeout=30):
+def recalc(filename, timeout=30, engine="auto", pool=None):
+    """Recalculate formulas and scan for errors.
+
+    engine: "auto" tries the native engine and falls back to LibreOffice when
+    the workbook uses unsupported formulas; "native" / "libreoffice" force one.
+    pool: optional office.pool.SofficePool; LibreOffice recalculation then runs
+    in one of its long-lived instances instead of a fresh soffice process.
+    """
     if not Path(filename).exists():
         return {"error": f"File {filename} does not exist"}
 
+    if engine not in ENGINES:
+        return {"error": f"Unknown engine {engine!r}, expected one of {ENGINES}"}
+
+    if engine != "libreoffice":
+        if recalc_file is None:
+            if engine == "native":
+                return {"error": "Native formula engine (tools.formula) is not importable"}
+        else:
+            try:
+                return recalc_file(filename)
+            except UnsupportedFormula as e:
+                if engine == "native":
+                    return {"error": f"Unsupported by native engine: {e}"}
+            except Exception as e:
+                if engine == "native":
+                    return {"error": str(e)}
+
+    return recalc_libreoffice(filename, timeout, pool)
+
+
+def recalc_libreoffice(filename, timeout=30, pool=None):
     abs_path = str(Path(filename).absolute())
 
+    if pool is not None:
+        error = pool.recalc(abs_path, timeout)
+        if error:
+            return {"error": error}
+        return scan_errors(filename)
+
     if not setup_libreoffice_macro():
         return {"error": "Failed to setup LibreOffice macro"}
 
@@ -97,6 +145,10 @@ def recalc(filename, timeout=30):
             return {"error": "LibreOffice macro not configured properly"}
         return {"error": error_msg}
 
+    return scan_errors(filename)
+
+
+def scan_errors(filename):
     try:
         wb = load_workbook(filename, data_only=True)
 
@@ -162,9 +214,22 @@ def recalc(filename, timeout=30):
 
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python recalc.py <excel_file> [timeout_seconds]")
-        print("\nRecalculates all formulas in an Excel file using LibreOffice")
+    engine = "auto"
+    workers = 1
+    args = []
+    for arg in sys.argv[1:]:
+        if arg.startswith("--engine="):
+            engine = arg.split("=", 1)[1]
+        elif arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+        else:
+            args.append(arg)
+
+    if not args:
+        print("Usage: python recalc.py <excel_file> [excel_file ...] [timeout_seconds] "
+              "[--engine=auto|native|libreoffice] [--workers=N]")
+        print("\nRecalculates all formulas in an Excel file (native engine, LibreOffice fallback)")
+        print("With several files or --workers, LibreOffice runs as a pool of N persistent instances")
         print("\nReturns JSON with error details:")
         print("  - status: 'success' or 'errors_found'")
         print("  - total_errors: Total number of Excel errors found")
@@ -173,11 +238,32 @@ def main():
         print("    - #VALUE!, #DIV/0!, #REF!, #NAME?, #NULL!, #NUM!, #N/A")
         sys.exit(1)
 
-    filename = sys.argv[1]
-    timeout = int(sys.argv[2]) if len(sys.argv) > 2 else 30
-
-    result = recalc(filename, timeout)
-    print(json.dumps(result, indent=2))
+    timeout = 30
+    if len(args) > 1 and args[-1].isdigit() and not Path(args[-1]).exists():
+        timeout = int(args.pop())
+    filenames = args
+
+    if len(filenames) == 1 and workers == 1:
+        result = recalc(filenames[0], timeout, engine)
+        print(json.dumps(result, indent=2))
+        return
+
+    from office.pool import SofficePool
+
+    pool = None
+    if engine != "native":
+        try:
+            pool = SofficePool(workers, timeout)
+        except RuntimeError:
+            pass  # No UNO bindings: one soffice process at a time, as before
+    parallel = workers if pool is not None or engine == "native" else 1
+    try:
+        with ThreadPoolExecutor(max(parallel, 1)) as executor:
+            results = list(executor.map(lambda f: recalc(f, timeout, engine, pool), filenames))
+    finally:
+        if pool is not None:
+            pool.close()
+    print(json.dumps(dict(zip(filenames, results)), indent=2))
 
 
 if __name__ == "__main__":
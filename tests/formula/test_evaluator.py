@@ -0,0 +1,237 @@
+"""公式求值：运算与函数、错误传播、区域依赖与增量重算的脏锥。"""
+
+import pytest
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from tools.columnar import ColumnarWorkbook
+from tools.formula import Evaluator, UnsupportedFormula, XLError
+
+
+def make_book(sheets: dict[str, dict[str, object]]) -> ColumnarWorkbook:
+    """{sheet: {"A1": 值 或 "=公式"}} → ColumnarWorkbook。"""
+    book = ColumnarWorkbook()
+    for name, cells in sheets.items():
+        ws = book.create_sheet(name)
+        for ref, value in cells.items():
+            row, col = coordinate_to_tuple(ref)
+            if isinstance(value, str) and value.startswith("="):
+                ws.set_formula(row, col, value)
+            else:
+                ws.set(row, col, value)
+    return book
+
+
+def evaluate(cells: dict[str, object], sheet: str = "S") -> tuple[Evaluator, dict[str, object]]:
+    evaluator = Evaluator(make_book({sheet: cells}))
+    values = evaluator.evaluate()
+    by_ref = {}
+    for (_, row, col), value in values.items():
+        ref = next(r for r in cells if coordinate_to_tuple(r) == (row, col))
+        by_ref[ref] = value
+    return evaluator, by_ref
+
+
+def key(ref: str, sheet: str = "S") -> tuple[str, int, int]:
+    return (sheet, *coordinate_to_tuple(ref))
+
+
+# ---------------------------------------------------------------------------
+# 运算与函数
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=1+2*3", 7.0),
+    ("=2^3^2", 64.0),
+    ("=-2^2", 4.0),
+    ("=50%", 0.5),
+    ('="a"&1&TRUE', "a1TRUE"),
+    ('="1"+1', 2.0),
+    ('="abc"="ABC"', True),
+    ('=1<"a"', True),
+    ('="a"<TRUE', True),
+    ("=SUM(1,2,3)", 6.0),
+    ("=ROUND(2.345,2)", 2.35),
+    ('=TEXT(1234.5,"#,##0.00")', "1,234.50"),
+])
+def test_scalar_formulas(formula, expected):
+    _, values = evaluate({"A1": formula})
+    assert values["A1"] == expected
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=0.1+0.2=0.3", True),
+    ("=0.1+0.2<>0.3", False),
+    ("=0.1+0.2>0.3", False),
+    ("=0.3<0.1+0.2", False),
+    ("=1-0.9=0.1", True),
+    ("=1+1E-10=1", False),
+    ("=MATCH(0.1+0.2,{0.1,0.3,0.5},0)", 2.0),
+    ("=VLOOKUP(0.1+0.2,{0.3,\"x\"},2,FALSE)", "x"),
+    ('=COUNTIF(B1:B3,0.3)', 1.0),
+    ('=COUNTIF(B1:B3,">0.3")', 1.0),
+    ('=COUNTIF(B1:B3,"<=0.3")', 2.0),
+])
+def test_comparisons_use_15_significant_digits(formula, expected):
+    _, values = evaluate({"A1": formula, "B1": 0.1 + 0.2, "B2": 0.2, "B3": 0.7})
+    assert values["A1"] == expected
+
+
+def test_variance_and_standard_deviation():
+    data = {f"A{i}": float(v) for i, v in enumerate([2, 4, 4, 4, 5, 5, 7, 9], start=1)}
+    data.update({
+        "B1": "=STDEV(A1:A8)", "B2": "=STDEV.S(A1:A8)", "B3": "=STDEVP(A1:A8)", "B4": "=STDEV.P(A1:A8)",
+        "B5": "=VAR(A1:A8)", "B6": "=VAR.S(A1:A8)", "B7": "=VARP(A1:A8)", "B8": "=VAR.P(A1:A8)",
+        "C1": "=STDEV(A1)", "C2": "=VARP(D1:D2)",
+    })
+    _, values = evaluate(data)
+    assert values["B1"] == values["B2"] == pytest.approx(2.1380899353)
+    assert values["B3"] == values["B4"] == 2.0
+    assert values["B5"] == values["B6"] == pytest.approx(32 / 7)
+    assert values["B7"] == values["B8"] == 4.0
+    assert values["C1"] == values["C2"] == XLError("#DIV/0!")
+
+
+def test_unsupported_function_is_rejected():
+    with pytest.raises(UnsupportedFormula):
+        evaluate({"A1": "=NOSUCHFUNCTION(1)"})
+    with pytest.raises(UnsupportedFormula):
+        evaluate({"A1": "=Rate*2"})  # 定义名称
+
+
+def test_circular_reference_is_rejected():
+    with pytest.raises(UnsupportedFormula):
+        evaluate({"A1": "=B1+1", "B1": "=A1+1"})
+
+
+# ---------------------------------------------------------------------------
+# 错误传播
+# ---------------------------------------------------------------------------
+
+
+def test_errors_propagate_through_operators_and_aggregates():
+    _, values = evaluate({
+        "A1": "=1/0",
+        "A2": "=A1+1",
+        "A3": "=SUM(A1:A2)",
+        "A4": "=IFERROR(A3,-1)",
+        "A5": "=NA()",
+        "A6": "=IFNA(A5,\"none\")",
+        "A7": "=IFNA(A1,\"none\")",
+        "A8": "=ISERROR(A1)",
+        "A9": '="x"*2',
+        "A10": "=SQRT(-1)",
+    })
+    assert values["A1"] == values["A2"] == values["A3"] == XLError("#DIV/0!")
+    assert values["A4"] == -1.0
+    assert values["A5"] == XLError("#N/A")
+    assert values["A6"] == "none"
+    assert values["A7"] == XLError("#DIV/0!")
+    assert values["A8"] is True
+    assert values["A9"] == XLError("#VALUE!")
+    assert values["A10"] == XLError("#NUM!")
+
+
+def test_error_values_in_cells():
+    book = make_book({"S": {"A3": "=A1", "A4": "=ISERROR(A2)", "A5": "=COUNTA(A1:A2)"}})
+    ws = book["S"]
+    ws.set(1, 1, "#REF!", data_type="e")
+    ws.set(2, 1, "#REF!")  # 内容恰好是错误码的文本
+    values = Evaluator(book).evaluate()
+    assert values[key("A3")] == XLError("#REF!")
+    assert values[key("A4")] is False
+    assert values[key("A5")] == 2.0
+
+
+def test_missing_sheet_reference_is_ref_error():
+    _, values = evaluate({"A1": "=Nowhere!B2"})
+    assert values["A1"] == XLError("#REF!")
+
+
+# ---------------------------------------------------------------------------
+# 区域依赖
+# ---------------------------------------------------------------------------
+
+
+def test_range_nodes_are_shared_and_ordered():
+    evaluator, values = evaluate({
+        "A1": 1.0, "A2": "=A1*2", "A3": "=A2*2",
+        "B1": "=SUM(A1:A3)", "B2": "=SUM(A1:A3)+B1", "B3": "=SUM(A:A)",
+    })
+    assert values["B1"] == 7.0
+    assert values["B2"] == 14.0
+    assert values["B3"] == 7.0
+    graph = evaluator.graph
+    # 同一区域只登记一个节点，被两个公式引用
+    assert graph.range_dependents[("S", 1, 1, 3, 1)] == {key("B1"), key("B2")}
+    assert ("S", 1, 1, None, 1) in graph.range_dependents
+    order = evaluator.order()
+    assert order.index(key("A3")) < order.index(key("B1")) < order.index(key("B2"))
+
+
+def test_cross_sheet_dependencies():
+    book = make_book({
+        "Data": {"A1": 5.0, "A2": 7.0},
+        "Calc": {"A1": "=SUM(Data!A1:A2)", "A2": "='Data'!A1*A1"},
+    })
+    values = Evaluator(book).evaluate()
+    assert values[("Calc", 1, 1)] == 12.0
+    assert values[("Calc", 2, 1)] == 60.0
+
+
+# ---------------------------------------------------------------------------
+# 增量重算
+# ---------------------------------------------------------------------------
+
+
+def test_recalculate_only_touches_the_dirty_cone():
+    evaluator, _ = evaluate({
+        "A1": 1.0, "A2": 2.0, "A10": 100.0,
+        "B1": "=A1*10",
+        "B2": "=SUM(A1:A3)",
+        "C1": "=B1+B2",
+        "D1": "=A10+1",          # 与 A1 无关
+        "E1": "=SUM(A5:A9)",     # 区域不含 A1
+    })
+    evaluator.set_value("S", 1, 1, 5.0)
+    changed = evaluator.recalculate()
+    assert set(changed) == {key("B1"), key("B2"), key("C1")}
+    assert changed[key("C1")] == 50.0 + 7.0
+    assert evaluator.values[key("D1")] == 101.0
+
+
+def test_new_cell_inside_referenced_range_dirties_its_dependents():
+    evaluator, _ = evaluate({"A1": 1.0, "B1": "=SUM(A1:A100)", "C1": "=COUNT(A:A)"})
+    evaluator.set_value("S", 50, 1, 4.0)
+    changed = evaluator.recalculate()
+    assert changed == {key("B1"): 5.0, key("C1"): 2.0}
+
+
+def test_set_formula_rewires_dependencies():
+    evaluator, _ = evaluate({"A1": 1.0, "A2": 2.0, "B1": "=A1", "C1": "=B1*2"})
+    evaluator.set_formula("S", 1, 2, "=A2")
+    assert evaluator.recalculate() == {key("B1"): 2.0, key("C1"): 4.0}
+    # 旧的引用已移除：修改 A1 不再影响 B1
+    evaluator.set_value("S", 1, 1, 10.0)
+    assert evaluator.recalculate() == {}
+
+
+def test_overwriting_a_formula_with_a_constant():
+    evaluator, _ = evaluate({"A1": 1.0, "B1": "=A1+1", "C1": "=B1*3"})
+    evaluator.set_value("S", 1, 2, 10.0)
+    assert evaluator.recalculate() == {key("C1"): 30.0}
+    assert key("B1") not in evaluator.asts
+
+
+def test_incremental_matches_full_evaluation():
+    cells = {f"A{i}": float(i) for i in range(1, 21)}
+    cells.update({f"B{i}": f"=A{i}*2+SUM(A$1:A{i})" for i in range(1, 21)})
+    cells["C1"] = "=SUMIF(B1:B20,\">50\")"
+    cells["C2"] = "=VLOOKUP(7,A1:B20,2,FALSE)"
+    evaluator, _ = evaluate(cells)
+    evaluator.set_value("S", 7, 1, 70.0)
+    evaluator.set_formula("S", 3, 2, "=A3*100")
+    evaluator.recalculate()
+
+    fresh = Evaluator(evaluator.book)
+    assert fresh.evaluate() == evaluator.values
@@ -0,0 +1,68 @@
+"""公式解析：词法 → AST、引用形式、模板平移。"""
+
+import pytest
+
+from tools.formula.parser import UnsupportedFormula, iter_nodes, parse, parse_ref, shift, template_key
+
+
+def test_operator_precedence():
+    # 1+2*3^2 → 1+(2*(3^2))
+    assert parse("=1+2*3^2") == (
+        "bin", "+", ("num", 1.0), ("bin", "*", ("num", 2.0), ("bin", "^", ("num", 3.0), ("num", 2.0))),
+    )
+    # 比较运算优先级最低，& 介于比较与加减之间
+    assert parse("=A1&1+2=B1")[1] == "="
+    assert parse("=A1&1+2=B1")[2][1] == "&"
+
+
+def test_left_associative():
+    assert parse("=8-4-2") == ("bin", "-", ("bin", "-", ("num", 8.0), ("num", 4.0)), ("num", 2.0))
+
+
+def test_unary_and_percent():
+    assert parse("=-A1%") == ("neg", ("pct", parse_ref("A1")))
+    assert parse("=+5") == ("num", 5.0)
+
+
+def test_literals():
+    assert parse('="a""b"') == ("str", 'a"b')
+    assert parse("=TRUE") == ("bool", True)
+    assert parse("=#N/A") == ("err", "#N/A")
+    assert parse("={1,2;3,4}") == ("array", [[("num", 1.0), ("num", 2.0)], [("num", 3.0), ("num", 4.0)]])
+
+
+def test_function_calls():
+    node = parse("=_xlfn.STDEV.S(A1:A3, , 2)")
+    assert node[0] == "call" and node[1] == "STDEV.S"
+    assert node[2][1] == ("missing",)
+    assert parse("=sum()") == ("call", "SUM", [])
+
+
+def test_references():
+    assert parse_ref("$B$2") == ("ref", None, 2, 2, 2, 2, False, (True, True, True, True))
+    assert parse_ref("'My Sheet'!C3:A1") == (
+        "ref", "My Sheet", 1, 1, 3, 3, True, (False, False, False, False),
+    )
+    # 整列 / 整行引用的开放端为 None
+    assert parse_ref("B:D")[2:6] == (1, 2, None, 4)
+    assert parse_ref("2:5")[2:6] == (2, 1, 5, None)
+    assert parse_ref("Rate") == ("name", "Rate")
+
+
+@pytest.mark.parametrize("formula", ["=SUM(A1", "=[Book.xlsx]S!A1", "=Table1[Col]", "=A1:B2 A1", "="])
+def test_unsupported_syntax(formula):
+    with pytest.raises(UnsupportedFormula):
+        parse(formula)
+
+
+def test_iter_nodes_visits_every_reference():
+    refs = [n for n in iter_nodes(parse("=IF(A1>0,SUM(B1:B3),-C1%)")) if n[0] == "ref"]
+    assert [(r[2], r[3]) for r in refs] == [(1, 1), (1, 2), (1, 3)]
+
+
+def test_template_key_and_shift():
+    # 向下填充的公式共享同一个模板，绝对引用与引号内文本不参与平移
+    assert template_key('=A2*$B$1&"C2"', 2, 3) == template_key('=A3*$B$1&"C2"', 3, 3)
+    assert template_key("=A2", 2, 3) != template_key("=A2", 3, 3)
+    shifted = shift(parse("=A2+$B$1+A:A"), 3, 1)
+    assert shifted == parse("=B5+$B$1+A:A")
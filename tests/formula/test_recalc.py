@@ -0,0 +1,111 @@
+"""原生重算与 LibreOffice 的对照：skills/xlsx/scripts/recalc.py 的两种引擎结果应一致。
+
+LibreOffice（soffice）不可用时跳过对照用例；原生引擎的写回与退回条件始终检查。
+"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import openpyxl
+import pytest
+
+from tools.formula import UnsupportedFormula, XLError, recalc_file
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "skills" / "xlsx" / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import recalc  # noqa: E402  skills/xlsx/scripts/recalc.py
+
+# 对照用的公式，覆盖运算符、比较精度、聚合、条件、查找、文本与日期函数
+FORMULAS = [
+    "=A2+B2*C2", "=A3/0", "=2^10-1", "=-A2%", '="n="&A2',
+    "=0.1+0.2=0.3", "=1-0.9=0.1", "=0.1+0.2>0.3",
+    "=SUM(A2:A11)", "=AVERAGE(A2:A11)", "=MIN(B2:B11)", "=MAX(B2:B11)", "=MEDIAN(A2:A11)",
+    "=STDEV(A2:A11)", "=STDEV.P(A2:A11)", "=VAR(B2:B11)", "=VAR.P(B2:B11)",
+    "=PRODUCT(A2:A5)", "=SUMPRODUCT(A2:A11,B2:B11)", "=COUNT(A2:D11)", "=COUNTA(D2:D11)",
+    '=SUMIF(D2:D11,"x",A2:A11)', '=SUMIFS(B2:B11,A2:A11,">3",D2:D11,"y")', '=COUNTIF(A2:A11,">=5")',
+    '=AVERAGEIF(D2:D11,"<>x",B2:B11)', "=IF(A2>1,\"big\",\"small\")", "=IFERROR(A3/0,-1)",
+    "=VLOOKUP(4,A2:D11,4,FALSE)", "=HLOOKUP(\"b\",{\"a\",\"b\";1,2},2,FALSE)", "=INDEX(B2:B11,MATCH(7,A2:A11,0))",
+    "=MATCH(5.5,A2:A11,1)", "=ROUND(B2/3,2)", "=ROUNDUP(B3/7,1)", "=MOD(-7,3)", "=ABS(-B4)",
+    '=LEFT(D2&"abc",2)', '=UPPER(D3)&LEN(D4)', '=SUBSTITUTE("a-b-c","-","+")', '=TEXT(B5,"0.00")',
+    "=DATE(2024,2,29)+1", "=YEAR(DATE(2023,12,31)+1)", "=EOMONTH(DATE(2024,1,15),1)",
+]
+
+
+def build_fixture(path: Path) -> list[str]:
+    """写入数据区 A1:D11 与 F 列公式，返回公式所在单元格。"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws.append(["n", "value", "ratio", "tag"])
+    for i in range(1, 11):
+        ws.append([i, i * 1.5 + 0.1, i / 7, "xy"[i % 2]])
+    cells = []
+    for i, formula in enumerate(FORMULAS, start=1):
+        ws.cell(row=i, column=6, value=formula)
+        cells.append(f"F{i}")
+    wb.save(path)
+    return cells
+
+
+def cached_values(path: Path, cells: list[str]) -> dict:
+    wb = openpyxl.load_workbook(path, data_only=True)
+    ws = wb["Data"]
+    values = {ref: ws[ref].value for ref in cells}
+    wb.close()
+    return values
+
+
+def normalize(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return pytest.approx(float(value), rel=1e-9, abs=1e-12)
+    return value
+
+
+def test_native_recalc_writes_cached_values(tmp_path):
+    path = tmp_path / "native.xlsx"
+    cells = build_fixture(path)
+    result = recalc.recalc(str(path), engine="native")
+    assert "error" not in result
+    assert result["total_formulas"] == len(FORMULAS)
+    values = cached_values(path, cells)
+    assert values["F1"] == pytest.approx(1 + 1.6 / 7)  # =A2+B2*C2
+    assert values["F2"] == XLError("#DIV/0!").code
+    assert values["F6"] is True
+    assert values["F9"] == 55
+    assert values["F14"] == pytest.approx(3.0276503541)  # STDEV(1..10)
+
+
+def test_unsupported_function_falls_back(tmp_path):
+    path = tmp_path / "unsupported.xlsx"
+    wb = openpyxl.Workbook()
+    wb.active["A1"] = "=FORECAST.ETS(1,{1,2},{1,2})"
+    wb.save(path)
+    before = path.read_bytes()
+    with pytest.raises(UnsupportedFormula):
+        recalc_file(str(path))
+    assert path.read_bytes() == before
+    assert "Unsupported by native engine" in recalc.recalc(str(path), engine="native")["error"]
+
+
+@pytest.mark.skipif(shutil.which("soffice") is None, reason="LibreOffice (soffice) is not installed")
+def test_native_engine_matches_libreoffice(tmp_path):
+    native, office = tmp_path / "native.xlsx", tmp_path / "office.xlsx"
+    cells = build_fixture(native)
+    shutil.copy(native, office)
+
+    assert "error" not in recalc.recalc(str(native), engine="native")
+    office_result = recalc.recalc(str(office), timeout=120, engine="libreoffice")
+    assert "error" not in office_result, office_result
+
+    expected = cached_values(office, cells)
+    actual = cached_values(native, cells)
+    mismatches = {
+        ref: (FORMULAS[int(ref[1:]) - 1], expected[ref], actual[ref])
+        for ref in cells
+        if normalize(actual[ref]) != expected[ref]
+    }
+    assert not mismatches
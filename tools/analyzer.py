@@ -7,7 +7,14 @@ matplotlib.use("Agg")  # 非交互式后端
 import matplotlib.pyplot as plt
 import pandas as pd
 
-from tools.reader import read_excel
+from tools.reader import read_columnar
+
+
+def _load_frame(file_path: str, sheet_name: str | None) -> tuple[str, pd.DataFrame]:
+    """读取 sheet 为 DataFrame（首行为表头），经由列式模型，不构建 openpyxl 单元格对象。"""
+    book = read_columnar(file_path, sheet_name)
+    target = sheet_name or book.active
+    return target, book[target].to_frame()
 
 
 def analyze_data(file_path: str, sheet_name: str | None = None) -> dict:
@@ -22,9 +29,7 @@ def analyze_data(file_path: str, sheet_name: str | None = None) -> dict:
             "missing": {col: count},
         }
     """
-    info = read_excel(file_path, sheet_name)
-    target = sheet_name or info["active_sheet"]
-    df = info["data"][target]
+    _, df = _load_frame(file_path, sheet_name)
 
     missing = {col: int(df[col].isna().sum()) for col in df.columns if df[col].isna().any()}
 
@@ -57,9 +62,7 @@ def create_chart(
     Returns:
         生成的图片路径
     """
-    info = read_excel(file_path, sheet_name)
-    target = sheet_name or info["active_sheet"]
-    df = info["data"][target]
+    target, df = _load_frame(file_path, sheet_name)
 
     if not output_path:
         base = os.path.splitext(file_path)[0]
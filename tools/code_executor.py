@@ -1,9 +1,73 @@
-"""Python 代码执行工具 — 用于处理预定义工具无法覆盖的复杂操作"""
+"""Python 代码执行工具 — 用于处理预定义工具无法覆盖的复杂操作
 
+默认在 tools.python_worker 的常驻进程池中执行（已预先导入 pandas 等库），
+RUN_PYTHON_POOL=0 或 worker 无法启动时每次启动新的解释器。
+"""
+
+import atexit
+import contextvars
+import locale
 import os
 import subprocess
 import sys
 import tempfile
+from contextlib import contextmanager
+
+from tools.python_worker import WorkerPool, WorkerUnavailable
+from tools.session import checkpoint
+
+POOL: WorkerPool | None = None
+if os.getenv("RUN_PYTHON_POOL", "1") != "0" and os.name == "posix":
+    POOL = WorkerPool(size=int(os.getenv("RUN_PYTHON_WORKERS", "4")))
+    atexit.register(POOL.close)
+
+# 并发运行多个智能体时，每个 worker 的脚本与其临时文件放在各自的目录下
+_scratch_dir: contextvars.ContextVar[str | None] = contextvars.ContextVar("run_python_scratch", default=None)
+
+
+@contextmanager
+def scratch_directory(path: str):
+    """在此上下文内，run_python 的脚本文件与 TMPDIR 都放在 path 下。"""
+    os.makedirs(path, exist_ok=True)
+    token = _scratch_dir.set(path)
+    try:
+        yield path
+    finally:
+        _scratch_dir.reset(token)
+
+
+def _run_subprocess(temp_path: str, timeout: int, env: dict | None) -> tuple[int, str, str]:
+    result = subprocess.run(
+        [sys.executable, temp_path],
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+        cwd=os.getcwd(),
+        env=env,
+    )
+    return result.returncode, result.stdout, result.stderr
+
+
+def _run_pooled(temp_path: str, timeout: int, env: dict | None) -> tuple[int, str, str]:
+    """在 worker 中执行；输出按 subprocess(text=True) 的方式解码（本地编码、统一换行符）。"""
+    out_path, err_path = f"{temp_path}.stdout", f"{temp_path}.stderr"
+    try:
+        returncode = POOL.run(temp_path, out_path, err_path, os.getcwd(), env or dict(os.environ), timeout)
+        encoding = locale.getpreferredencoding(False)
+        outputs = []
+        for path in (out_path, err_path):
+            try:
+                with open(path, encoding=encoding) as f:
+                    outputs.append(f.read())
+            except FileNotFoundError:
+                outputs.append("")
+        return returncode, outputs[0], outputs[1]
+    finally:
+        for path in (out_path, err_path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
 
 def run_python(code: str, timeout: int = 60) -> str:
@@ -19,31 +83,40 @@ def run_python(code: str, timeout: int = 60) -> str:
     Returns:
         执行输出或错误信息
     """
+    # 脚本直接读写磁盘文件，先写回会话中尚未保存的修改
+    checkpoint()
+
+    scratch = _scratch_dir.get()
+    env = None
+    if scratch:
+        env = dict(os.environ, TMPDIR=scratch, TEMP=scratch, TMP=scratch)
+
     with tempfile.NamedTemporaryFile(
-        mode="w", suffix=".py", delete=False, encoding="utf-8"
+        mode="w", suffix=".py", delete=False, encoding="utf-8", dir=scratch
     ) as f:
         f.write(code)
         temp_path = f.name
 
     try:
-        result = subprocess.run(
-            [sys.executable, temp_path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-            cwd=os.getcwd(),
-        )
+        try:
+            if POOL is None:
+                raise WorkerUnavailable("worker pool disabled")
+            returncode, stdout, stderr = _run_pooled(temp_path, timeout, env)
+        except WorkerUnavailable:
+            returncode, stdout, stderr = _run_subprocess(temp_path, timeout, env)
         output = ""
-        if result.stdout:
-            output += result.stdout
-        if result.stderr:
+        if stdout:
+            output += stdout
+        if stderr:
             if output:
                 output += "\n"
-            output += result.stderr
-        if result.returncode != 0 and not result.stderr:
-            output += f"\n[exit code: {result.returncode}]"
+            output += stderr
+        if returncode != 0 and not stderr:
+            output += f"\n[exit code: {returncode}]"
+        # 临时脚本路径每次不同，换成固定名称，相同代码的报错文本保持一致（便于 LLM 响应缓存命中）
+        output = output.replace(temp_path, "script.py")
         return output.strip() or "[Code executed successfully with no output]"
-    except subprocess.TimeoutExpired:
+    except (subprocess.TimeoutExpired, TimeoutError):
         return f"[Execution timed out after {timeout} seconds]"
     except Exception as e:
         return f"[Execution error: {e}]"
@@ -0,0 +1,338 @@
+"""列式工作簿模型 — 以紧凑数组保存单元格值，供读取、写入、分析与公式计算共享
+
+openpyxl 每个单元格是一个带样式代理的 Cell 对象（数百字节）。这里每个 sheet 按列
+保存两个定长数组：1 字节的类型标记 + 8 字节的数值；文本与错误值存为共享字符串池
+中的编号（float64 无法精确表示的大整数也以文本形式存入池中），公式存放在稀疏字典中，
+样式使用 xlsx 自身已去重的 cellXfs 序号。
+
+用法:
+    book = ColumnarWorkbook.from_xlsx("data.xlsx")
+    ws = book["Sheet1"]
+    ws.get(2, 3)            # 第 2 行第 3 列的值
+    ws.formula(2, 4)        # "=B2*C2" 或 None
+    df = ws.to_frame()      # 首行作为表头
+"""
+
+import sys
+from array import array
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+from openpyxl.cell.cell import ERROR_CODES
+from openpyxl.utils.datetime import CALENDAR_WINDOWS_1900, from_excel, to_excel
+
+from tools import sheet_xml
+
+# 类型标记
+EMPTY, NUMBER, INTEGER, TEXT, BOOL, ERROR, DATETIME, DURATION, BIGINT = range(9)
+
+# float64 能精确表示的整数范围，超出的整数存为 BIGINT
+_EXACT_INT = 1 << 53
+
+
+class StringPool:
+    """字典编码的字符串池：相同字符串只保存一份，单元格中只记编号。"""
+
+    __slots__ = ("_ids", "strings")
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self.strings: list[str] = []
+
+    def intern(self, text: str) -> int:
+        idx = self._ids.get(text)
+        if idx is None:
+            idx = len(self.strings)
+            self._ids[text] = idx
+            self.strings.append(text)
+        return idx
+
+    def __getitem__(self, idx: int) -> str:
+        return self.strings[idx]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class Column:
+    """单列存储：tags[i] 为第 i+1 行的类型标记，data[i] 为对应数值或字符串编号。"""
+
+    __slots__ = ("tags", "data", "styles")
+
+    def __init__(self):
+        self.tags = bytearray()
+        self.data = array("d")
+        self.styles: array | None = None  # 只有出现非默认样式时才分配
+
+    def grow(self, rows: int) -> None:
+        extra = rows - len(self.tags)
+        if extra > 0:
+            self.tags.extend(bytes(extra))
+            self.data.frombytes(bytes(8 * extra))
+            if self.styles is not None:
+                self.styles.frombytes(bytes(4 * extra))
+
+    def set_style(self, idx: int, style: int) -> None:
+        if self.styles is None:
+            if not style:
+                return
+            self.styles = array("I", bytes(4 * len(self.tags)))
+        self.styles[idx] = style
+
+    @property
+    def nbytes(self) -> int:
+        size = len(self.tags) + self.data.itemsize * len(self.data)
+        if self.styles is not None:
+            size += self.styles.itemsize * len(self.styles)
+        return size
+
+
+class ColumnarSheet:
+    """单个 sheet 的列式视图，行列均从 1 开始。"""
+
+    __slots__ = ("title", "pool", "columns", "formulas", "max_row", "epoch")
+
+    def __init__(self, title: str, pool: StringPool | None = None, epoch: datetime = CALENDAR_WINDOWS_1900):
+        self.title = title
+        self.pool = pool if pool is not None else StringPool()
+        self.columns: list[Column | None] = []
+        self.formulas: dict[tuple[int, int], int] = {}  # (row, col) -> 字符串池编号
+        self.max_row = 0
+        self.epoch = epoch
+
+    @property
+    def max_column(self) -> int:
+        return len(self.columns)
+
+    def _column(self, col: int) -> Column:
+        if col > len(self.columns):
+            self.columns.extend([None] * (col - len(self.columns)))
+        column = self.columns[col - 1]
+        if column is None:
+            column = self.columns[col - 1] = Column()
+        return column
+
+    def set(self, row: int, col: int, value, style: int = 0, data_type: str | None = None) -> None:
+        """写入一个值；None 表示清空。
+
+        data_type 为源单元格的类型（xlsx 的 t 属性 / openpyxl 的 data_type），只有为 "e" 时
+        字符串才记为错误值，内容恰好是 "#N/A" 等的文本单元格仍是文本。
+        """
+        column = self._column(col)
+        column.grow(row)
+        if row > self.max_row:
+            self.max_row = row
+        i = row - 1
+
+        if value is None:
+            tag, num = EMPTY, 0.0
+        elif isinstance(value, bool):
+            tag, num = BOOL, float(value)
+        elif isinstance(value, int):
+            if -_EXACT_INT <= value <= _EXACT_INT:
+                tag, num = INTEGER, float(value)
+            else:
+                tag, num = BIGINT, float(self.pool.intern(str(value)))
+        elif isinstance(value, float):
+            tag, num = NUMBER, value
+        elif isinstance(value, timedelta):
+            tag, num = DURATION, to_excel(value)
+        elif isinstance(value, (datetime, date, time)):
+            tag, num = DATETIME, to_excel(value, self.epoch)
+        elif data_type == "e" and isinstance(value, str) and value in ERROR_CODES:
+            tag, num = ERROR, float(self.pool.intern(value))
+        else:
+            tag, num = TEXT, float(self.pool.intern(str(value)))
+
+        column.tags[i] = tag
+        column.data[i] = num
+        column.set_style(i, style)
+
+    def get(self, row: int, col: int):
+        """读取值（公式单元格返回缓存的计算结果）。"""
+        if col > len(self.columns) or self.columns[col - 1] is None:
+            return None
+        column = self.columns[col - 1]
+        if row > len(column.tags):
+            return None
+        return self._decode(column.tags[row - 1], column.data[row - 1])
+
+    def _decode(self, tag: int, num: float):
+        if tag == EMPTY:
+            return None
+        if tag == NUMBER:
+            return num
+        if tag == INTEGER:
+            return int(num)
+        if tag in (TEXT, ERROR):
+            return self.pool[int(num)]
+        if tag == BIGINT:
+            return int(self.pool[int(num)])
+        if tag == BOOL:
+            return bool(num)
+        if tag == DATETIME:
+            return from_excel(num, self.epoch)
+        return from_excel(num, self.epoch, timedelta=True)
+
+    def style(self, row: int, col: int) -> int:
+        if col > len(self.columns) or self.columns[col - 1] is None:
+            return 0
+        styles = self.columns[col - 1].styles
+        if styles is None or row > len(styles):
+            return 0
+        return styles[row - 1]
+
+    def set_formula(self, row: int, col: int, formula: str | None) -> None:
+        """设置公式（带或不带 "="）；None 表示删除。"""
+        if formula is None:
+            self.formulas.pop((row, col), None)
+            return
+        self.formulas[(row, col)] = self.pool.intern(formula.lstrip("="))
+        if row > self.max_row:
+            self.max_row = row
+        self._column(col)
+
+    def formula(self, row: int, col: int) -> str | None:
+        idx = self.formulas.get((row, col))
+        return None if idx is None else f"={self.pool[idx]}"
+
+    def column_values(self, col: int, min_row: int = 1, max_row: int | None = None) -> list:
+        """一列的值列表（空单元格为 None）。"""
+        max_row = max_row or self.max_row
+        if col > len(self.columns) or self.columns[col - 1] is None:
+            return [None] * (max_row - min_row + 1)
+        column = self.columns[col - 1]
+        tags, data = column.tags, column.data
+        n = len(tags)
+        decode = self._decode
+        return [decode(tags[i], data[i]) if i < n else None for i in range(min_row - 1, max_row)]
+
+    def iter_rows(self, min_row: int = 1, max_row: int | None = None):
+        """按行产出值元组，与 ws.iter_rows(values_only=True) 相同。"""
+        cols = [self.column_values(c, min_row, max_row) for c in range(1, self.max_column + 1)]
+        return zip(*cols) if cols else iter(())
+
+    def _frame_cell(self, tag: int, num: float):
+        """按 pandas openpyxl 引擎的规则转换一个值（与 sheet_xml._sheet_grid 相同）。"""
+        if tag == EMPTY:
+            return ""
+        if tag == ERROR:
+            return float("nan")
+        if tag == NUMBER and num.is_integer():
+            return int(num)
+        return self._decode(tag, num)
+
+    def to_frame(self, header: bool = True) -> pd.DataFrame:
+        """转为 DataFrame，结果与 pd.read_excel 一致；header=True 时首行作为列名。"""
+        cols = []
+        for column in self.columns:
+            if column is None:
+                cols.append([""] * self.max_row)
+                continue
+            tags, data = column.tags, column.data
+            convert = self._frame_cell
+            cols.append([convert(tags[i], data[i]) for i in range(len(tags))] + [""] * (self.max_row - len(tags)))
+
+        # 去掉每行末尾与整表末尾的空单元格，再补齐为同一宽度
+        rows = []
+        last = 0
+        for values in zip(*cols):
+            values = list(values)
+            while values and values[-1] == "":
+                values.pop()
+            rows.append(values)
+            if values:
+                last = len(rows)
+        rows = rows[:last]
+        if not rows:
+            return pd.DataFrame()
+        width = max(len(r) for r in rows)
+        for r in rows:
+            r.extend([""] * (width - len(r)))
+        return TextParser(rows, header=0 if header else None, skip_blank_lines=False).read()
+
+    @property
+    def nbytes(self) -> int:
+        """列数组与公式索引占用的字节数（不含共享字符串池）。"""
+        size = sum(c.nbytes for c in self.columns if c is not None)
+        # 稀疏公式字典：字典本身 + 每项的 (row, col) 元组、行号与池编号对象
+        size += sys.getsizeof(self.formulas)
+        for key, idx in self.formulas.items():
+            size += sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(idx)
+        return size
+
+
+class ColumnarWorkbook:
+    """多个 ColumnarSheet 共享一个字符串池。"""
+
+    __slots__ = ("sheets", "pool", "active", "epoch")
+
+    def __init__(self, epoch: datetime = CALENDAR_WINDOWS_1900):
+        self.sheets: dict[str, ColumnarSheet] = {}
+        self.pool = StringPool()
+        self.active: str | None = None
+        self.epoch = epoch
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self.sheets)
+
+    def __getitem__(self, name: str) -> ColumnarSheet:
+        return self.sheets[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sheets
+
+    def create_sheet(self, title: str) -> ColumnarSheet:
+        ws = ColumnarSheet(title, self.pool, self.epoch)
+        self.sheets[title] = ws
+        if self.active is None:
+            self.active = title
+        return ws
+
+    @property
+    def nbytes(self) -> int:
+        pool = self.pool
+        size = sys.getsizeof(pool.strings) + sys.getsizeof(pool._ids)
+        size += sum(sys.getsizeof(text) for text in pool.strings)
+        return size + sum(ws.nbytes for ws in self.sheets.values())
+
+    @classmethod
+    def from_xlsx(cls, file_path: str, sheet_names: list[str] | None = None) -> "ColumnarWorkbook":
+        """用 tools.sheet_xml 流式解析构建，不经过 openpyxl Cell 对象。"""
+        with sheet_xml.WorkbookXml(file_path) as book:
+            cwb = cls(book.epoch)
+            for name in sheet_names or book.sheetnames:
+                ws = cwb.create_sheet(name)
+                for row, col, value, formula, dtype, style in book.iter_styled_cells(name):
+                    ws.set(row, col, value, style, dtype)
+                    if formula:
+                        ws.set_formula(row, col, formula)
+            cwb.active = book.active_sheet if book.active_sheet in cwb else cwb.active
+        return cwb
+
+    @classmethod
+    def from_openpyxl(cls, wb) -> "ColumnarWorkbook":
+        """从已加载的 openpyxl Workbook 构建。
+
+        formula 模式加载的工作簿只有公式没有缓存值，值列对应位置为空。
+        """
+        cwb = cls(wb.epoch)
+        for ws in wb.worksheets:
+            cws = cwb.create_sheet(ws.title)
+            for row in ws.iter_rows():
+                for cell in row:
+                    value = cell.value
+                    if value is None:
+                        continue
+                    if cell.data_type == "f":
+                        # ArrayFormula 等对象的公式文本在 .text 中
+                        text = value if isinstance(value, str) else getattr(value, "text", None)
+                        if text:
+                            cws.set_formula(cell.row, cell.column, text)
+                    else:
+                        cws.set(cell.row, cell.column, value, cell.style_id, cell.data_type)
+        if wb.active is not None:
+            cwb.active = wb.active.title
+        return cwb
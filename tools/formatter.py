@@ -1,12 +1,13 @@
 """Excel 格式化工具"""
 
-import openpyxl
 from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 
+from tools.session import load_workbook, save_workbook
+
 
 def auto_fit_columns(file_path: str, sheet_name: str) -> str:
     """自动调整列宽以适应内容。"""
-    wb = openpyxl.load_workbook(file_path)
+    wb = load_workbook(file_path)
     ws = wb[sheet_name]
 
     for column_cells in ws.columns:
@@ -19,7 +20,7 @@ def auto_fit_columns(file_path: str, sheet_name: str) -> str:
                     max_length = cell_len
         ws.column_dimensions[col_letter].width = min(max_length + 2, 50)
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
 
@@ -32,7 +33,7 @@ def apply_header_style(
     font_color: str = "FFFFFF",
 ) -> str:
     """给表头行应用样式。"""
-    wb = openpyxl.load_workbook(file_path)
+    wb = load_workbook(file_path)
     ws = wb[sheet_name]
 
     fill = PatternFill(start_color=bg_color, end_color=bg_color, fill_type="solid")
@@ -44,7 +45,7 @@ def apply_header_style(
         cell.font = font
         cell.alignment = alignment
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
 
@@ -55,7 +56,7 @@ def add_table_borders(file_path: str, sheet_name: str, cell_range: str) -> str:
     Args:
         cell_range: e.g. "A1:D10"
     """
-    wb = openpyxl.load_workbook(file_path)
+    wb = load_workbook(file_path)
     ws = wb[sheet_name]
 
     thin = Side(style="thin")
@@ -65,6 +66,6 @@ def add_table_borders(file_path: str, sheet_name: str, cell_range: str) -> str:
         for cell in row:
             cell.border = border
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
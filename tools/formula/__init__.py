@@ -0,0 +1,13 @@
+"""原生 Excel 公式引擎：解析、依赖图、求值与重算写回。
+
+覆盖常用的算术/比较/文本运算与 SUM、STDEV/VAR、SUMIF(S)、COUNTIF(S)、VLOOKUP、INDEX/MATCH、
+IF、ROUND、TEXT、日期等函数；遇到不支持的公式时抛出 UnsupportedFormula，
+调用方（skills/xlsx/scripts/recalc.py）据此退回 LibreOffice。
+"""
+
+from tools.formula.evaluator import Evaluator
+from tools.formula.functions import FUNCTIONS, Range, XLError
+from tools.formula.parser import UnsupportedFormula, parse
+from tools.formula.recalc import recalc_file
+
+__all__ = ["Evaluator", "FUNCTIONS", "Range", "XLError", "UnsupportedFormula", "parse", "recalc_file"]
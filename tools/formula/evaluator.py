@@ -0,0 +1,295 @@
+"""公式求值 — 在 ColumnarWorkbook 上按依赖图计算公式，支持增量重算
+
+全量求值: compile() 解析全部公式并登记到 DependencyGraph，evaluate() 按拓扑序计算。
+增量求值: set_value() / set_formula() 修改单元格后，recalculate() 只重算受影响的
+“脏锥”，其余公式沿用已有结果。
+
+区域值按区域节点缓存：拓扑序保证区域内公式已先算完，同一区域被成千上万个
+SUMIF/VLOOKUP 引用时只构建一次；增量重算时只丢弃脏锥中的区域缓存。
+"""
+
+import math
+from bisect import bisect_left, bisect_right
+
+from openpyxl.utils.cell import get_column_letter
+
+from tools.columnar import BIGINT, BOOL, EMPTY, ERROR, TEXT, ColumnarWorkbook
+from tools.formula.functions import FUNCTIONS, NUM, REF, VALUE, Range, XLError, binary, to_number, unary
+from tools.formula.graph import CellKey, DependencyGraph, NodeKey
+from tools.formula.parser import UnsupportedFormula, iter_nodes, parse, shift, template_key
+
+RangeKey = tuple[str, int, int, int, int]
+
+
+class Evaluator:
+    """对一个列式工作簿求值。计算结果在 values 中，键为 (sheet, row, col)。"""
+
+    def __init__(self, book: ColumnarWorkbook):
+        self.book = book
+        self.epoch = book.epoch
+        self.values: dict[CellKey, object] = {}
+        self.asts: dict[CellKey, tuple] = {}
+        self.graph = DependencyGraph()
+        self._sheet_names = {name.lower(): name for name in book.sheetnames}
+        self._templates: dict[str, tuple[tuple, int, int]] = {}
+        self._ranges: dict[NodeKey, tuple[RangeKey, Range]] = {}
+        self._changed: set[CellKey] = set()
+        self._compiled = False
+        # 当前正在求值的单元格（ROW()、隐式交集需要）
+        self.sheet: str = ""
+        self.row = 0
+        self.col = 0
+
+    # ------------------------------------------------------------------
+    # 解析与依赖图
+    # ------------------------------------------------------------------
+
+    def compile(self) -> None:
+        """解析全部公式、检查是否都能由原生引擎处理，并建立依赖图。"""
+        for name, ws in self.book.sheets.items():
+            for (row, col), idx in ws.formulas.items():
+                self._install((name, row, col), ws.pool[idx])
+        self._compiled = True
+
+    def _parse(self, text: str, row: int, col: int) -> tuple:
+        """填充出来的公式（相对引用形式相同）只解析一次，其余由模板 AST 平移得到。"""
+        key = template_key(text, row, col)
+        template = self._templates.get(key)
+        if template is not None:
+            base, base_row, base_col = template
+            return shift(base, row - base_row, col - base_col)
+        ast = parse(text)
+        for node in iter_nodes(ast):
+            if node[0] == "name":
+                raise UnsupportedFormula(f"定义名称: {node[1]}")
+            if node[0] == "call" and node[1] not in FUNCTIONS:
+                raise UnsupportedFormula(f"函数: {node[1]}")
+        self._templates[key] = (ast, row, col)
+        return ast
+
+    def _install(self, cell: CellKey, text: str) -> None:
+        self.asts[cell] = self._parse(text, cell[1], cell[2])
+        self.graph.add(cell, *self.references(cell))
+
+    def _uninstall(self, cell: CellKey) -> None:
+        self.asts.pop(cell, None)
+        self.values.pop(cell, None)
+        for key in self.graph.remove(cell):
+            self._ranges.pop(key, None)
+
+    def sheet_name(self, name: str | None, default: str) -> str | None:
+        if name is None:
+            return default
+        return self._sheet_names.get(name.lower())
+
+    def node_key(self, node: tuple, sheet: str) -> NodeKey | None:
+        """ref 节点 → (sheet, r1, c1, r2, c2)，整列/整行引用的开放端保留为 None。"""
+        name = self.sheet_name(node[1], sheet)
+        if name is None:
+            return None
+        return name, node[2], node[3], node[4], node[5]
+
+    def bounds(self, key: NodeKey) -> RangeKey:
+        """开放端以 sheet 当前已用区域为界。"""
+        sheet, r1, c1, r2, c2 = key
+        ws = self.book[sheet]
+        if r2 is None:
+            r2 = max(ws.max_row, r1)
+        if c2 is None:
+            c2 = max(ws.max_column, c1)
+        return sheet, r1, c1, r2, c2
+
+    def references(self, cell: CellKey) -> tuple[set[CellKey], set[NodeKey]]:
+        """cell 的公式直接引用的 (单元格, 区域节点)。"""
+        cells, ranges = set(), set()
+        for node in iter_nodes(self.asts[cell]):
+            if node[0] != "ref":
+                continue
+            key = self.node_key(node, cell[0])
+            if key is None:
+                continue
+            if node[6]:
+                ranges.add(key)
+            else:
+                cells.add(key[:3])
+        return cells, ranges
+
+    def order(self) -> list[CellKey]:
+        """拓扑序（被引用者在前）；存在循环引用时抛出 UnsupportedFormula。"""
+        return self.graph.order()
+
+    # ------------------------------------------------------------------
+    # 增量修改
+    # ------------------------------------------------------------------
+
+    def _sheet(self, sheet: str):
+        if sheet not in self.book:
+            raise UnsupportedFormula(f"新工作表需要重建依赖图: {sheet}")
+        return self.book[sheet]
+
+    def set_value(self, sheet: str, row: int, col: int, value) -> None:
+        """写入常量（覆盖原有公式）；下一次 recalculate() 时重算其下游。"""
+        ws = self._sheet(sheet)
+        cell = (sheet, row, col)
+        if cell in self.asts:
+            self._uninstall(cell)
+            ws.set_formula(row, col, None)
+        ws.set(row, col, value)
+        self._changed.add(cell)
+
+    def set_formula(self, sheet: str, row: int, col: int, formula: str) -> None:
+        """写入公式（带或不带 "="）；语法或函数不受支持时抛出 UnsupportedFormula。"""
+        ws = self._sheet(sheet)
+        cell = (sheet, row, col)
+        text = formula[1:] if formula.startswith("=") else formula
+        ast = self._parse(text, row, col)
+        if cell in self.asts:
+            self._uninstall(cell)
+        ws.set_formula(row, col, text)
+        self.asts[cell] = ast
+        self.graph.add(cell, *self.references(cell))
+        self._changed.add(cell)
+
+    def recalculate(self) -> dict[CellKey, object]:
+        """只重算自上次求值以来修改过的单元格的下游，返回 {重算的单元格: 新值}。"""
+        if not self._compiled:
+            self._changed.clear()
+            return dict(self.evaluate())
+        changed, self._changed = self._changed, set()
+        order, ranges = self.graph.cone(changed)
+        for key in ranges:
+            self._ranges.pop(key, None)
+        for cell in order:
+            self.evaluate_cell(cell)
+        return {cell: self.values[cell] for cell in order}
+
+    # ------------------------------------------------------------------
+    # 求值
+    # ------------------------------------------------------------------
+
+    def evaluate(self) -> dict[CellKey, object]:
+        """计算全部公式，返回 {(sheet, row, col): 值}。"""
+        if not self._compiled:
+            self.compile()
+        self._ranges.clear()
+        self._changed.clear()
+        for cell in self.order():
+            self.evaluate_cell(cell)
+        return self.values
+
+    def evaluate_cell(self, cell: CellKey):
+        self.sheet, self.row, self.col = cell
+        try:
+            value = self.scalar(self.eval(self.asts[cell]))
+        except XLError as e:
+            value = e
+        except (ZeroDivisionError, OverflowError):
+            value = NUM
+        except (TypeError, RecursionError) as e:
+            raise UnsupportedFormula(f"{cell[0]}!{get_column_letter(cell[2])}{cell[1]}: {e}") from e
+        if value is None:
+            value = 0.0
+        elif isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+            value = NUM
+        self.values[cell] = value
+        return value
+
+    def cell_value(self, sheet: str, row: int, col: int):
+        key = (sheet, row, col)
+        if key in self.asts:
+            return self.values.get(key)
+        ws = self.book[sheet]
+        if col > len(ws.columns) or ws.columns[col - 1] is None:
+            return None
+        column = ws.columns[col - 1]
+        if row > len(column.tags):
+            return None
+        return self._convert(column.tags[row - 1], column.data[row - 1])
+
+    def _convert(self, tag: int, num: float):
+        if tag == EMPTY:
+            return None
+        if tag == TEXT:
+            return self.book.pool[int(num)]
+        if tag == BOOL:
+            return bool(num)
+        if tag == ERROR:
+            return XLError(self.book.pool[int(num)])
+        if tag == BIGINT:
+            return float(self.book.pool[int(num)])  # Excel 中的数值同样是双精度
+        return num  # 数值、日期、时长均为序列号
+
+    def resolve(self, key: NodeKey) -> Range:
+        """区域节点的当前值（按节点缓存；开放端区域在已用区域变化后重建）。"""
+        bounds = self.bounds(key)
+        cached = self._ranges.get(key)
+        if cached is not None and cached[0] == bounds:
+            return cached[1]
+
+        sheet, r1, c1, r2, c2 = bounds
+        ws = self.book[sheet]
+        convert = self._convert
+        formula_rows = self.graph.formula_rows
+        cols = []
+        for col in range(c1, c2 + 1):
+            column = ws.columns[col - 1] if col <= len(ws.columns) else None
+            if column is None:
+                values = [None] * (r2 - r1 + 1)
+            else:
+                tags, data = column.tags, column.data
+                stop = min(r2, len(tags))
+                values = [convert(tags[i], data[i]) for i in range(r1 - 1, stop)]
+                values.extend([None] * (r2 - r1 + 1 - len(values)))
+            rows = formula_rows.get((sheet, col))
+            if rows:
+                for row in rows[bisect_left(rows, r1):bisect_right(rows, r2)]:
+                    values[row - r1] = self.values.get((sheet, row, col))
+            cols.append(values)
+
+        rng = Range(cols, sheet, r1, c1)
+        self._ranges[key] = (bounds, rng)
+        return rng
+
+    def scalar(self, value):
+        """区域用在需要单值的位置时按 Excel 隐式交集取值。"""
+        if not isinstance(value, Range):
+            return value
+        if value.height == 1 and value.width == 1:
+            return value.cols[0][0]
+        if value.sheet is None:
+            return value.cols[0][0] if value.height and value.width else VALUE
+        if value.width == 1 and value.sheet == self.sheet and value.row <= self.row < value.row + value.height:
+            return value.cols[0][self.row - value.row]
+        if value.height == 1 and value.sheet == self.sheet and value.col <= self.col < value.col + value.width:
+            return value.cols[self.col - value.col][0]
+        return VALUE
+
+    def eval(self, node):
+        kind = node[0]
+        if kind == "num" or kind == "str" or kind == "bool":
+            return node[1]
+        if kind == "ref":
+            key = self.node_key(node, self.sheet)
+            if key is None:
+                return REF
+            if not node[6]:
+                return self.cell_value(key[0], key[1], key[2])
+            return self.resolve(key)
+        if kind == "call":
+            fn, lazy = FUNCTIONS[node[1]]
+            if lazy:
+                return fn(self, *node[2])
+            return fn(self, *(self.eval(arg) for arg in node[2]))
+        if kind == "bin":
+            return binary(node[1], self.eval(node[2]), self.eval(node[3]))
+        if kind == "neg":
+            return unary(lambda v: -to_number(v), self.eval(node[1]))
+        if kind == "pct":
+            return unary(lambda v: to_number(v) / 100, self.eval(node[1]))
+        if kind == "err":
+            return XLError(node[1])
+        if kind == "missing":
+            return None
+        if kind == "array":
+            return Range.from_rows([[self.scalar(self.eval(item)) for item in row] for row in node[1]])
+        raise UnsupportedFormula(f"无法求值的节点: {kind}")
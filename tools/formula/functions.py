@@ -0,0 +1,1546 @@
+"""Excel 工作表函数的原生实现
+
+求值期间的值类型:
+    float   数值（日期/时间为序列号）
+    str     文本
+    bool    逻辑值
+    None    空单元格
+    XLError 错误值（同时是异常，遇到时直接抛出向上传播）
+    Range   区域或数组，按列保存
+
+函数注册在 FUNCTIONS 中: 名称 -> (实现, 是否惰性求值)。普通函数接收 (ctx, *已求值参数)；
+惰性函数（IF、IFERROR、ROW 等）接收 (ctx, *AST 节点)，自行决定求值哪些分支。
+遇到无法忠实模拟的用法时抛出 UnsupportedFormula，由调用方改用 LibreOffice。
+"""
+
+import math
+import operator
+import re
+from itertools import compress
+from datetime import date, datetime, timedelta
+from decimal import ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, Decimal
+
+from openpyxl.utils.datetime import from_excel, to_excel
+
+from tools.formula.parser import UnsupportedFormula
+
+
+class XLError(Exception):
+    """Excel 错误值；同一错误码只有一个实例。"""
+
+    _instances: dict[str, "XLError"] = {}
+
+    def __new__(cls, code: str):
+        inst = cls._instances.get(code)
+        if inst is None:
+            inst = super().__new__(cls)
+            cls._instances[code] = inst
+        return inst
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+    def __str__(self) -> str:
+        return self.code
+
+    def __repr__(self) -> str:
+        return f"XLError({self.code!r})"
+
+    def __reduce__(self):
+        return (XLError, (self.code,))
+
+
+NA = XLError("#N/A")
+VALUE = XLError("#VALUE!")
+DIV0 = XLError("#DIV/0!")
+REF = XLError("#REF!")
+NAME = XLError("#NAME?")
+NUM = XLError("#NUM!")
+NULL = XLError("#NULL!")
+
+
+class Range:
+    """区域或数组常量。cols[j][i] 为第 i 行第 j 列；sheet/row/col 记录区域左上角位置。"""
+
+    __slots__ = ("cols", "height", "width", "sheet", "row", "col")
+
+    def __init__(self, cols: list[list], sheet: str | None = None, row: int = 1, col: int = 1):
+        self.cols = cols
+        self.width = len(cols)
+        self.height = len(cols[0]) if cols else 0
+        self.sheet = sheet
+        self.row = row
+        self.col = col
+
+    @classmethod
+    def from_rows(cls, rows: list[list]) -> "Range":
+        return cls([list(c) for c in zip(*rows)])
+
+    def values(self):
+        """按列顺序产出所有值（聚合函数用）。"""
+        for column in self.cols:
+            yield from column
+
+    def row_major(self):
+        """按行顺序产出所有值（文本拼接等顺序敏感的函数用）。"""
+        for i in range(self.height):
+            for column in self.cols:
+                yield column[i]
+
+    def vector(self) -> list:
+        """单行或单列区域展开为一维列表。"""
+        if self.width == 1:
+            return self.cols[0]
+        if self.height == 1:
+            return [c[0] for c in self.cols]
+        raise NA
+
+
+def as_range(value) -> Range:
+    return value if isinstance(value, Range) else Range([[value]])
+
+
+# ---------------------------------------------------------------------------
+# 类型转换
+# ---------------------------------------------------------------------------
+
+
+def _parse_number(text: str) -> float | None:
+    """按 Excel 文本转数值的常见规则：允许千分位、百分号与首尾空格。"""
+    s = text.strip().replace(",", "")
+    if not s:
+        return None
+    pct = s.endswith("%")
+    if pct:
+        s = s[:-1]
+    try:
+        num = float(s)
+    except ValueError:
+        serial = _parse_date(text)
+        return serial
+    if math.isnan(num) or math.isinf(num):
+        return None
+    return num / 100 if pct else num
+
+
+def _parse_date(text: str) -> float | None:
+    s = text.strip()
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return float(to_excel(datetime.strptime(s, fmt)))
+        except ValueError:
+            continue
+    return None
+
+
+def to_number(value) -> float:
+    """算术运算中的数值转换：空为 0，逻辑值为 0/1，数字文本可转换，其余为 #VALUE!。"""
+    if isinstance(value, float):
+        return value
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, Decimal)):
+        return float(value)
+    if isinstance(value, str):
+        num = _parse_number(value)
+        if num is None:
+            raise VALUE
+        return num
+    if isinstance(value, XLError):
+        raise value
+    if isinstance(value, Range):
+        raise VALUE
+    raise VALUE
+
+
+def to_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    if isinstance(value, float):
+        return value != 0
+    if isinstance(value, str):
+        upper = value.strip().upper()
+        if upper == "TRUE":
+            return True
+        if upper == "FALSE":
+            return False
+        raise VALUE
+    if isinstance(value, XLError):
+        raise value
+    raise VALUE
+
+
+def format_general(num: float) -> str:
+    """数值的“常规”格式文本（最多 15 位有效数字）。"""
+    if num == int(num) and abs(num) < 1e15:
+        return str(int(num))
+    text = f"{num:.15g}"
+    if "e" in text:
+        mantissa, exp = text.split("e")
+        text = f"{mantissa}E{exp[0]}{exp[1:].lstrip('0').zfill(2)}"
+    return text
+
+
+def to_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return format_general(value)
+    if isinstance(value, XLError):
+        raise value
+    raise VALUE
+
+
+def check(value):
+    """错误值向上传播。"""
+    if isinstance(value, XLError):
+        raise value
+    return value
+
+
+def round15(num: float) -> float:
+    """按 Excel 的精度取 15 位有效数字（比较前使用，如 0.1+0.2 与 0.3 视为相等）。"""
+    if num == 0 or not math.isfinite(num):
+        return num
+    return float(f"{num:.15g}")
+
+
+def num_compare(a: float, b: float) -> int:
+    """两个数值在 15 位有效数字下的比较结果（-1 / 0 / 1）。"""
+    if a == b:
+        return 0
+    # 只有相对差极小时两者才可能在 15 位有效数字下相等，其余情况直接比较
+    if abs(a - b) <= 1e-13 * max(abs(a), abs(b)):
+        a, b = round15(a), round15(b)
+    return (a > b) - (a < b)
+
+
+def _type_rank(value) -> int:
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, str):
+        return 1
+    return 0
+
+
+def compare(left, right) -> int:
+    """Excel 比较规则：数值 < 文本 < 逻辑值；文本不区分大小写；空值按对方类型取零值。
+
+    数值按 15 位有效数字比较（见 num_compare），比较运算符与查找函数都经过这里。
+    """
+    check(left)
+    check(right)
+    if left is None:
+        left = "" if isinstance(right, str) else (False if isinstance(right, bool) else 0.0)
+    if right is None:
+        right = "" if isinstance(left, str) else (False if isinstance(left, bool) else 0.0)
+    lr, rr = _type_rank(left), _type_rank(right)
+    if lr != rr:
+        return -1 if lr < rr else 1
+    if isinstance(left, str):
+        left, right = left.lower(), right.lower()
+    elif isinstance(left, bool):
+        left, right = int(left), int(right)
+    else:
+        return num_compare(left, right)
+    return (left > right) - (left < right)
+
+
+# ---------------------------------------------------------------------------
+# 运算符
+# ---------------------------------------------------------------------------
+
+
+def _arith(op: str, a: float, b: float) -> float:
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        if b == 0:
+            raise DIV0
+        return a / b
+    # "^"
+    if a == 0 and b < 0:
+        raise DIV0
+    try:
+        result = a ** b
+    except (OverflowError, ZeroDivisionError):
+        raise NUM
+    if isinstance(result, complex):
+        raise NUM
+    return result
+
+
+_COMPARE = {
+    "=": lambda c: c == 0,
+    "<>": lambda c: c != 0,
+    "<": lambda c: c < 0,
+    ">": lambda c: c > 0,
+    "<=": lambda c: c <= 0,
+    ">=": lambda c: c >= 0,
+}
+
+
+def binary_scalar(op: str, left, right):
+    if op in _COMPARE:
+        return _COMPARE[op](compare(left, right))
+    if op == "&":
+        return to_text(check(left)) + to_text(check(right))
+    result = _arith(op, to_number(check(left)), to_number(check(right)))
+    if math.isinf(result) or math.isnan(result):
+        raise NUM
+    return result
+
+
+def _elementwise(fn, left, right):
+    """对数组逐元素运算；形状不一致时按 Excel 规则广播，越界位置为 #N/A。"""
+    a, b = as_range(left), as_range(right)
+    height = b.height if a.height == 1 else (a.height if b.height == 1 else max(a.height, b.height))
+    width = b.width if a.width == 1 else (a.width if b.width == 1 else max(a.width, b.width))
+
+    def pick(r: Range, i: int, j: int):
+        i = 0 if r.height == 1 else i
+        j = 0 if r.width == 1 else j
+        if i >= r.height or j >= r.width:
+            return NA
+        return r.cols[j][i]
+
+    cols = []
+    for j in range(width):
+        column = []
+        for i in range(height):
+            try:
+                column.append(fn(pick(a, i, j), pick(b, i, j)))
+            except XLError as e:
+                column.append(e)
+        cols.append(column)
+    origin = a if isinstance(left, Range) else b
+    return Range(cols, origin.sheet, origin.row, origin.col)
+
+
+def binary(op: str, left, right):
+    if isinstance(left, Range) or isinstance(right, Range):
+        return _elementwise(lambda x, y: binary_scalar(op, x, y), left, right)
+    return binary_scalar(op, left, right)
+
+
+def unary(fn, value):
+    if isinstance(value, Range):
+        cols = []
+        for column in value.cols:
+            out = []
+            for v in column:
+                try:
+                    out.append(fn(v))
+                except XLError as e:
+                    out.append(e)
+            cols.append(out)
+        return Range(cols, value.sheet, value.row, value.col)
+    return fn(value)
+
+
+# ---------------------------------------------------------------------------
+# 函数注册
+# ---------------------------------------------------------------------------
+
+FUNCTIONS: dict[str, tuple] = {}
+
+
+def register(*names: str, lazy: bool = False):
+    def decorator(fn):
+        for name in names:
+            FUNCTIONS[name] = (fn, lazy)
+        return fn
+    return decorator
+
+
+def _is_missing(node) -> bool:
+    return node[0] == "missing"
+
+
+def _numbers(args):
+    """聚合函数的参数展开：区域中只取数值；直接给出的参数会做类型转换。"""
+    for arg in args:
+        if isinstance(arg, Range):
+            for v in arg.values():
+                if isinstance(v, XLError):
+                    raise v
+                if isinstance(v, float):
+                    yield v
+        elif arg is not None:
+            yield to_number(arg)
+
+
+def _flatten(args):
+    for arg in args:
+        if isinstance(arg, Range):
+            yield from arg.values()
+        else:
+            yield arg
+
+
+@register("SUM")
+def fn_sum(ctx, *args):
+    return math.fsum(_numbers(args))
+
+
+@register("PRODUCT")
+def fn_product(ctx, *args):
+    result = 1.0
+    for v in _numbers(args):
+        result *= v
+    return result
+
+
+@register("AVERAGE")
+def fn_average(ctx, *args):
+    nums = list(_numbers(args))
+    if not nums:
+        raise DIV0
+    return math.fsum(nums) / len(nums)
+
+
+@register("MIN")
+def fn_min(ctx, *args):
+    nums = list(_numbers(args))
+    return min(nums) if nums else 0.0
+
+
+@register("MAX")
+def fn_max(ctx, *args):
+    nums = list(_numbers(args))
+    return max(nums) if nums else 0.0
+
+
+@register("MEDIAN")
+def fn_median(ctx, *args):
+    nums = sorted(_numbers(args))
+    if not nums:
+        raise NUM
+    mid = len(nums) // 2
+    return nums[mid] if len(nums) % 2 else (nums[mid - 1] + nums[mid]) / 2
+
+
+def _variance(args, sample: bool) -> float:
+    nums = list(_numbers(args))
+    n = len(nums) - (1 if sample else 0)
+    if n <= 0:
+        raise DIV0
+    mean = math.fsum(nums) / len(nums)
+    return math.fsum((v - mean) ** 2 for v in nums) / n
+
+
+@register("VAR", "VAR.S")
+def fn_var(ctx, *args):
+    return _variance(args, sample=True)
+
+
+@register("VARP", "VAR.P")
+def fn_varp(ctx, *args):
+    return _variance(args, sample=False)
+
+
+@register("STDEV", "STDEV.S")
+def fn_stdev(ctx, *args):
+    return math.sqrt(_variance(args, sample=True))
+
+
+@register("STDEVP", "STDEV.P")
+def fn_stdevp(ctx, *args):
+    return math.sqrt(_variance(args, sample=False))
+
+
+@register("COUNT")
+def fn_count(ctx, *args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, Range):
+            count += sum(1 for v in arg.values() if isinstance(v, float))
+        elif isinstance(arg, (float, bool)):
+            count += 1
+        elif isinstance(arg, str) and _parse_number(arg) is not None:
+            count += 1
+    return float(count)
+
+
+@register("COUNTA")
+def fn_counta(ctx, *args):
+    return float(sum(1 for v in _flatten(args) if v is not None))
+
+
+@register("COUNTBLANK")
+def fn_countblank(ctx, rng):
+    return float(sum(1 for v in as_range(rng).values() if v is None or v == ""))
+
+
+@register("SUMPRODUCT")
+def fn_sumproduct(ctx, *arrays):
+    ranges = [as_range(a) for a in arrays]
+    shape = (ranges[0].height, ranges[0].width)
+    if any((r.height, r.width) != shape for r in ranges):
+        raise VALUE
+    total = 0.0
+    for j in range(shape[1]):
+        for i in range(shape[0]):
+            product = 1.0
+            for r in ranges:
+                v = r.cols[j][i]
+                if isinstance(v, XLError):
+                    raise v
+                product *= v if isinstance(v, float) else 0.0
+            total += product
+    return total
+
+
+# ---------------------------------------------------------------------------
+# 条件聚合
+# ---------------------------------------------------------------------------
+
+_CRITERIA_RE = re.compile(r"^(<=|>=|<>|<|>|=)?(.*)$", re.S)
+
+
+def _wildcard_regex(pattern: str):
+    """Excel 通配符: * 任意串, ? 任意字符, ~ 转义。"""
+    if not any(ch in pattern for ch in "*?~"):
+        return None
+    out = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "~" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        out.append(".*" if ch == "*" else "." if ch == "?" else re.escape(ch))
+        i += 1
+    return re.compile("".join(out), re.S | re.I)
+
+
+def make_criteria(criteria):
+    """把 COUNTIF/SUMIF 的条件转为判定函数。"""
+    check(criteria)
+    if isinstance(criteria, Range):
+        raise UnsupportedFormula("数组形式的条件")
+    if criteria is None:
+        criteria = 0.0
+    if isinstance(criteria, bool):
+        return lambda v: isinstance(v, bool) and v == criteria
+    if isinstance(criteria, float):
+        return lambda v: isinstance(v, float) and num_compare(v, criteria) == 0
+
+    op, operand = _CRITERIA_RE.match(criteria).groups()
+    op = op or "="
+    num = _parse_number(operand) if operand else None
+    upper = operand.upper()
+
+    if num is not None:
+        cmp = _COMPARE[op]
+
+        def match_number(v):
+            if isinstance(v, str):
+                parsed = _parse_number(v) if op in ("=", "<>") else None
+                if parsed is None:
+                    return op == "<>"
+                v = parsed
+            elif not isinstance(v, float):
+                return op == "<>"
+            return cmp(num_compare(v, num))
+        return match_number
+
+    if upper in ("TRUE", "FALSE"):
+        flag = upper == "TRUE"
+        if op in ("=", "<>"):
+            return lambda v: (isinstance(v, bool) and v == flag) == (op == "=")
+
+    if operand == "":
+        if op == "=":
+            return lambda v: v is None or v == ""
+        if op == "<>":
+            return lambda v: v is not None and v != ""
+
+    if op in ("=", "<>"):
+        regex = _wildcard_regex(operand)
+        if regex is not None:
+            def match_text(v):
+                hit = isinstance(v, str) and regex.fullmatch(v) is not None
+                return hit if op == "=" else not hit
+        else:
+            lowered = operand.lower()
+
+            def match_text(v):
+                hit = isinstance(v, str) and v.lower() == lowered
+                return hit if op == "=" else not hit
+        return match_text
+
+    cmp = _COMPARE[op]
+    lowered = operand.lower()
+    return lambda v: isinstance(v, str) and cmp((v.lower() > lowered) - (v.lower() < lowered))
+
+
+_ORDERING = {"<": operator.lt, ">": operator.gt, "<=": operator.le, ">=": operator.ge}
+
+
+def criteria_hits(values: list, criteria) -> list[bool]:
+    """对整列值批量求条件结果。
+
+    最常见的数值比较条件（">0"、"<="&A1 等）用单个列表推导完成，不经过逐元素的闭包调用；
+    只有与条件值极接近的数才按 15 位有效数字比较（与 num_compare 相同）。
+    """
+    if isinstance(criteria, str):
+        op, operand = _CRITERIA_RE.match(criteria).groups()
+        if op in _ORDERING and operand:
+            num = _parse_number(operand)
+            if num is not None:
+                cmp = _ORDERING[op]
+                tol, num15 = 1e-13 * abs(num), round15(num)
+                return [
+                    v.__class__ is float and (cmp(v, num) if abs(v - num) > tol else cmp(round15(v), num15))
+                    for v in values
+                ]
+    elif isinstance(criteria, float):
+        tol, num15 = 1e-13 * abs(criteria), round15(criteria)
+        return [
+            v.__class__ is float and (v == criteria or (abs(v - criteria) <= tol and round15(v) == num15))
+            for v in values
+        ]
+    test = make_criteria(criteria)
+    return [test(v) for v in values]
+
+
+def _flat(rng: Range) -> list:
+    return rng.cols[0] if rng.width == 1 else list(rng.values())
+
+
+def _criteria_mask(pairs) -> list[bool]:
+    """COUNTIFS/SUMIFS: 多组 (区域, 条件) 的逐单元格与。"""
+    mask = None
+    shape = None
+    for rng, criteria in pairs:
+        rng = as_range(rng)
+        if shape is None:
+            shape = (rng.height, rng.width)
+        elif (rng.height, rng.width) != shape:
+            raise VALUE
+        check(criteria)
+        hits = criteria_hits(_flat(rng), criteria)
+        mask = hits if mask is None else [a and b for a, b in zip(mask, hits)]
+    return mask
+
+
+def _masked(rng, mask: list[bool], shape: tuple[int, int] | None = None) -> list:
+    rng = as_range(rng)
+    if shape is not None and (rng.height, rng.width) != shape:
+        raise VALUE
+    return list(compress(_flat(rng), mask))
+
+
+def _sum_values(values) -> float:
+    total = []
+    for v in values:
+        if isinstance(v, XLError):
+            raise v
+        if isinstance(v, float):
+            total.append(v)
+    return math.fsum(total)
+
+
+def _resize(rng: Range, like: Range) -> Range:
+    """SUMIF 的求和区域与条件区域大小不同时 Excel 按左上角扩展，
+    扩展出的部分不在依赖图中，交给 LibreOffice 处理。"""
+    if (rng.height, rng.width) != (like.height, like.width):
+        raise UnsupportedFormula("SUMIF/AVERAGEIF 求和区域与条件区域大小不同")
+    return rng
+
+
+@register("COUNTIF")
+def fn_countif(ctx, rng, criteria):
+    return float(sum(_criteria_mask([(rng, criteria)])))
+
+
+@register("COUNTIFS")
+def fn_countifs(ctx, *args):
+    if len(args) % 2:
+        raise VALUE
+    return float(sum(_criteria_mask(zip(args[::2], args[1::2]))))
+
+
+@register("SUMIF")
+def fn_sumif(ctx, rng, criteria, sum_range=None):
+    rng = as_range(rng)
+    target = rng if sum_range is None else _resize(as_range(sum_range), rng)
+    mask = _criteria_mask([(rng, criteria)])
+    return _sum_values(_masked(target, mask))
+
+
+@register("SUMIFS")
+def fn_sumifs(ctx, sum_range, *args):
+    if not args or len(args) % 2:
+        raise VALUE
+    target = as_range(sum_range)
+    mask = _criteria_mask(zip(args[::2], args[1::2]))
+    return _sum_values(_masked(target, mask, (as_range(args[0]).height, as_range(args[0]).width)))
+
+
+def _average(values) -> float:
+    nums = [check(v) for v in values if isinstance(v, (float, XLError))]
+    if not nums:
+        raise DIV0
+    return math.fsum(nums) / len(nums)
+
+
+@register("AVERAGEIF")
+def fn_averageif(ctx, rng, criteria, avg_range=None):
+    rng = as_range(rng)
+    target = rng if avg_range is None else _resize(as_range(avg_range), rng)
+    return _average(_masked(target, _criteria_mask([(rng, criteria)])))
+
+
+@register("AVERAGEIFS")
+def fn_averageifs(ctx, avg_range, *args):
+    if not args or len(args) % 2:
+        raise VALUE
+    mask = _criteria_mask(zip(args[::2], args[1::2]))
+    return _average(_masked(avg_range, mask, (as_range(args[0]).height, as_range(args[0]).width)))
+
+
+def _extreme_ifs(pick):
+    def fn(ctx, target, *args):
+        if not args or len(args) % 2:
+            raise VALUE
+        mask = _criteria_mask(zip(args[::2], args[1::2]))
+        nums = [check(v) for v in _masked(target, mask) if isinstance(v, (float, XLError))]
+        return pick(nums) if nums else 0.0
+    return fn
+
+
+FUNCTIONS["MAXIFS"] = (_extreme_ifs(max), False)
+FUNCTIONS["MINIFS"] = (_extreme_ifs(min), False)
+
+
+# ---------------------------------------------------------------------------
+# 逻辑
+# ---------------------------------------------------------------------------
+
+
+def _pick(value: Range, i: int, j: int):
+    """按广播规则取数组元素（单行/单列数组沿另一维重复）。"""
+    return value.cols[0 if value.width == 1 else j][0 if value.height == 1 else i]
+
+
+@register("IF", lazy=True)
+def fn_if(ctx, cond, then=("missing",), otherwise=None):
+    value = ctx.eval(cond)
+    a = 0.0 if _is_missing(then) else None
+    b = False if otherwise is None else (0.0 if _is_missing(otherwise) else None)
+    if isinstance(value, Range):
+        # 数组条件：两个分支都求值后逐元素选择
+        a = as_range(ctx.eval(then) if a is None else a)
+        b = as_range(ctx.eval(otherwise) if b is None else b)
+        cols = []
+        for j, column in enumerate(value.cols):
+            out = []
+            for i, v in enumerate(column):
+                try:
+                    out.append(_pick(a if to_bool(v) else b, i, j))
+                except XLError as e:
+                    out.append(e)
+            cols.append(out)
+        return Range(cols, value.sheet, value.row, value.col)
+    if to_bool(ctx.scalar(value)):
+        return ctx.eval(then) if a is None else a
+    return ctx.eval(otherwise) if b is None else b
+
+
+@register("IFS", lazy=True)
+def fn_ifs(ctx, *nodes):
+    if len(nodes) % 2:
+        raise VALUE
+    for cond, value in zip(nodes[::2], nodes[1::2]):
+        if to_bool(ctx.scalar(ctx.eval(cond))):
+            return ctx.eval(value)
+    raise NA
+
+
+def _catch(ctx, node, fallback, errors):
+    try:
+        value = ctx.eval(node)
+    except XLError as e:
+        if not errors(e):
+            raise
+        return ctx.eval(fallback)
+    if isinstance(value, Range):
+        if not any(isinstance(v, XLError) and errors(v) for v in value.values()):
+            return value
+        other = ctx.eval(fallback)
+        cols = [[other if isinstance(v, XLError) and errors(v) else v for v in column] for column in value.cols]
+        return Range(cols, value.sheet, value.row, value.col)
+    if isinstance(value, XLError) and errors(value):
+        return ctx.eval(fallback)
+    return value
+
+
+@register("IFERROR", lazy=True)
+def fn_iferror(ctx, node, fallback):
+    return _catch(ctx, node, fallback, lambda e: True)
+
+
+@register("IFNA", lazy=True)
+def fn_ifna(ctx, node, fallback):
+    return _catch(ctx, node, fallback, lambda e: e is NA)
+
+
+def _logicals(args):
+    for v in _flatten(args):
+        check(v)
+        if isinstance(v, (bool, float)):
+            yield bool(v)
+
+
+@register("AND")
+def fn_and(ctx, *args):
+    values = list(_logicals(args))
+    if not values:
+        raise VALUE
+    return all(values)
+
+
+@register("OR")
+def fn_or(ctx, *args):
+    values = list(_logicals(args))
+    if not values:
+        raise VALUE
+    return any(values)
+
+
+@register("XOR")
+def fn_xor(ctx, *args):
+    return sum(_logicals(args)) % 2 == 1
+
+
+@register("NOT")
+def fn_not(ctx, value):
+    return not to_bool(value)
+
+
+@register("TRUE")
+def fn_true(ctx):
+    return True
+
+
+@register("FALSE")
+def fn_false(ctx):
+    return False
+
+
+@register("CHOOSE")
+def fn_choose(ctx, index, *values):
+    i = int(to_number(index))
+    if not 1 <= i <= len(values):
+        raise VALUE
+    return values[i - 1]
+
+
+# ---------------------------------------------------------------------------
+# 信息
+# ---------------------------------------------------------------------------
+
+
+def _info(test):
+    def fn(ctx, node):
+        try:
+            value = ctx.scalar(ctx.eval(node))
+        except XLError as e:
+            value = e
+        return test(value)
+    return fn
+
+
+for _name, _test in {
+    "ISBLANK": lambda v: v is None,
+    "ISNUMBER": lambda v: isinstance(v, float),
+    "ISTEXT": lambda v: isinstance(v, str),
+    "ISNONTEXT": lambda v: not isinstance(v, str),
+    "ISLOGICAL": lambda v: isinstance(v, bool),
+    "ISERROR": lambda v: isinstance(v, XLError),
+    "ISERR": lambda v: isinstance(v, XLError) and v is not NA,
+    "ISNA": lambda v: v is NA,
+}.items():
+    FUNCTIONS[_name] = (_info(_test), True)
+
+
+@register("NA")
+def fn_na(ctx):
+    raise NA
+
+
+@register("N")
+def fn_n(ctx, value):
+    value = ctx.scalar(value)
+    check(value)
+    if isinstance(value, bool):
+        return float(value)
+    return value if isinstance(value, float) else 0.0
+
+
+@register("ROW", lazy=True)
+def fn_row(ctx, node=None):
+    if node is None:
+        return float(ctx.row)
+    if node[0] != "ref":
+        raise VALUE
+    return float(node[2])
+
+
+@register("COLUMN", lazy=True)
+def fn_column(ctx, node=None):
+    if node is None:
+        return float(ctx.col)
+    if node[0] != "ref":
+        raise VALUE
+    return float(node[3])
+
+
+@register("ROWS")
+def fn_rows(ctx, rng):
+    return float(as_range(rng).height)
+
+
+@register("COLUMNS")
+def fn_columns(ctx, rng):
+    return float(as_range(rng).width)
+
+
+# ---------------------------------------------------------------------------
+# 数学
+# ---------------------------------------------------------------------------
+
+
+def _round(num: float, digits: float, mode) -> float:
+    digits = int(digits)
+    quantum = Decimal(1).scaleb(-digits)
+    result = Decimal(repr(num)).quantize(quantum, rounding=mode) if digits >= 0 else (
+        (Decimal(repr(num)) / quantum).quantize(Decimal(1), rounding=mode) * quantum)
+    return float(result)
+
+
+@register("ROUND")
+def fn_round(ctx, num, digits=0.0):
+    return _round(to_number(ctx.scalar(num)), to_number(ctx.scalar(digits)), ROUND_HALF_UP)
+
+
+@register("ROUNDUP")
+def fn_roundup(ctx, num, digits=0.0):
+    return _round(to_number(ctx.scalar(num)), to_number(ctx.scalar(digits)), ROUND_UP)
+
+
+@register("ROUNDDOWN", "TRUNC")
+def fn_rounddown(ctx, num, digits=0.0):
+    return _round(to_number(ctx.scalar(num)), to_number(ctx.scalar(digits)), ROUND_DOWN)
+
+
+def _math1(fn, domain=lambda x: True):
+    def wrapper(ctx, value):
+        def apply(v):
+            x = to_number(v)
+            if not domain(x):
+                raise NUM
+            return float(fn(x))
+        return unary(apply, value)
+    return wrapper
+
+
+FUNCTIONS.update({
+    "ABS": (_math1(abs), False),
+    "INT": (_math1(math.floor), False),
+    "SQRT": (_math1(math.sqrt, lambda x: x >= 0), False),
+    "LN": (_math1(math.log, lambda x: x > 0), False),
+    "LOG10": (_math1(math.log10, lambda x: x > 0), False),
+    "EXP": (_math1(math.exp), False),
+    "SIGN": (_math1(lambda x: (x > 0) - (x < 0)), False),
+})
+
+
+@register("LOG")
+def fn_log(ctx, num, base=10.0):
+    x, b = to_number(num), to_number(base)
+    if x <= 0 or b <= 0:
+        raise NUM
+    if b == 1:
+        raise DIV0
+    return math.log(x, b)
+
+
+@register("MOD")
+def fn_mod(ctx, num, divisor):
+    a, b = to_number(ctx.scalar(num)), to_number(ctx.scalar(divisor))
+    if b == 0:
+        raise DIV0
+    return a - b * math.floor(a / b)
+
+
+@register("POWER")
+def fn_power(ctx, num, power):
+    return binary_scalar("^", ctx.scalar(num), ctx.scalar(power))
+
+
+@register("PI")
+def fn_pi(ctx):
+    return math.pi
+
+
+@register("CEILING", "CEILING.MATH")
+def fn_ceiling(ctx, num, significance=1.0):
+    x, s = to_number(num), to_number(significance)
+    if s == 0:
+        return 0.0
+    return math.ceil(x / s) * s
+
+
+@register("FLOOR", "FLOOR.MATH")
+def fn_floor(ctx, num, significance=1.0):
+    x, s = to_number(num), to_number(significance)
+    if s == 0:
+        raise DIV0
+    return math.floor(x / s) * s
+
+
+# ---------------------------------------------------------------------------
+# 查找与引用
+# ---------------------------------------------------------------------------
+
+
+def _lookup_equal(lookup, candidates: list) -> int:
+    """精确匹配（文本支持通配符、不区分大小写），返回下标或 -1。"""
+    if isinstance(lookup, str):
+        regex = _wildcard_regex(lookup)
+        lowered = lookup.lower()
+        for i, v in enumerate(candidates):
+            if isinstance(v, str) and (regex.fullmatch(v) if regex else v.lower() == lowered):
+                return i
+        return -1
+    for i, v in enumerate(candidates):
+        if v is not None and _type_rank(v) == _type_rank(lookup) and not isinstance(v, XLError) \
+                and compare(v, lookup) == 0:
+            return i
+    return -1
+
+
+def _lookup_sorted(lookup, candidates: list, descending: bool = False) -> int:
+    """近似匹配：升序时找不大于 lookup 的最后一个值，降序时找不小于 lookup 的最后一个值。"""
+    found = -1
+    rank = _type_rank(lookup)
+    for i, v in enumerate(candidates):
+        if v is None or isinstance(v, XLError) or _type_rank(v) != rank:
+            continue
+        c = compare(v, lookup)
+        if (c <= 0) if not descending else (c >= 0):
+            found = i
+        else:
+            break
+    return found
+
+
+@register("VLOOKUP")
+def fn_vlookup(ctx, lookup, table, col_index, approximate=True):
+    lookup = check(ctx.scalar(lookup))
+    table = as_range(table)
+    j = int(to_number(col_index))
+    if j < 1:
+        raise VALUE
+    if j > table.width:
+        raise REF
+    approximate = to_bool(ctx.scalar(approximate))
+    keys = table.cols[0]
+    i = _lookup_sorted(lookup, keys) if approximate else _lookup_equal(lookup, keys)
+    if i < 0:
+        raise NA
+    return table.cols[j - 1][i]
+
+
+@register("HLOOKUP")
+def fn_hlookup(ctx, lookup, table, row_index, approximate=True):
+    lookup = check(ctx.scalar(lookup))
+    table = as_range(table)
+    i = int(to_number(row_index))
+    if i < 1:
+        raise VALUE
+    if i > table.height:
+        raise REF
+    approximate = to_bool(ctx.scalar(approximate))
+    keys = [c[0] for c in table.cols]
+    j = _lookup_sorted(lookup, keys) if approximate else _lookup_equal(lookup, keys)
+    if j < 0:
+        raise NA
+    return table.cols[j][i - 1]
+
+
+@register("MATCH")
+def fn_match(ctx, lookup, array, match_type=1.0):
+    lookup = check(ctx.scalar(lookup))
+    candidates = as_range(array).vector()
+    kind = to_number(ctx.scalar(match_type))
+    if kind == 0:
+        i = _lookup_equal(lookup, candidates)
+    else:
+        i = _lookup_sorted(lookup, candidates, descending=kind < 0)
+    if i < 0:
+        raise NA
+    return float(i + 1)
+
+
+@register("XLOOKUP")
+def fn_xlookup(ctx, lookup, lookup_array, return_array, if_not_found=NA, match_mode=0.0, search_mode=1.0):
+    lookup = check(ctx.scalar(lookup))
+    keys = as_range(lookup_array).vector()
+    mode = to_number(ctx.scalar(match_mode))
+    search = to_number(ctx.scalar(search_mode)) or 1.0
+    if search not in (1.0, -1.0) or mode not in (0.0, -1.0, 1.0, 2.0):
+        raise UnsupportedFormula("XLOOKUP 的二分查找或该匹配模式")
+    order = range(len(keys)) if search > 0 else range(len(keys) - 1, -1, -1)
+
+    found = -1
+    if mode in (0.0, 2.0):
+        regex = _wildcard_regex(lookup) if mode == 2.0 and isinstance(lookup, str) else None
+        for i in order:
+            v = keys[i]
+            if regex is not None:
+                if isinstance(v, str) and regex.fullmatch(v):
+                    found = i
+                    break
+            elif v is not None and not isinstance(v, XLError) and _type_rank(v) == _type_rank(lookup) \
+                    and compare(v, lookup) == 0:
+                found = i
+                break
+    else:
+        best = None
+        for i in order:
+            v = keys[i]
+            if v is None or isinstance(v, XLError) or _type_rank(v) != _type_rank(lookup):
+                continue
+            c = compare(v, lookup)
+            if c == 0:
+                found = i
+                break
+            if (mode < 0 and c < 0 and (best is None or compare(v, keys[best]) > 0)) or \
+                    (mode > 0 and c > 0 and (best is None or compare(v, keys[best]) < 0)):
+                best = i
+        if found < 0 and best is not None:
+            found = best
+
+    if found < 0:
+        if isinstance(if_not_found, XLError):
+            raise if_not_found
+        return if_not_found
+    result = as_range(return_array)
+    if result.width == 1:
+        return result.cols[0][found]
+    if result.height == 1:
+        return result.cols[found][0]
+    if len(keys) == result.height:
+        return Range([[c[found]] for c in result.cols])
+    return Range([result.cols[found]])
+
+
+@register("INDEX")
+def fn_index(ctx, array, row=None, col=None):
+    rng = as_range(array)
+    r = int(to_number(row)) if row is not None else 0
+    c = int(to_number(col)) if col is not None else 0
+    if col is None and (rng.height == 1 or rng.width == 1) and r:
+        # 一维区域只给一个序号时沿该方向取值
+        if rng.height == 1:
+            r, c = 1, r
+        else:
+            c = 1
+    if r < 0 or c < 0 or r > rng.height or c > rng.width:
+        raise REF
+    if r and c:
+        return rng.cols[c - 1][r - 1]
+    if r:
+        return Range([[column[r - 1]] for column in rng.cols], rng.sheet, rng.row + r - 1, rng.col)
+    if c:
+        return Range([rng.cols[c - 1]], rng.sheet, rng.row, rng.col + c - 1)
+    return rng
+
+
+# ---------------------------------------------------------------------------
+# 文本
+# ---------------------------------------------------------------------------
+
+
+def _text_arg(ctx, value) -> str:
+    return to_text(check(ctx.scalar(value)))
+
+
+def _int_arg(ctx, value, default: int) -> int:
+    return default if value is None else int(to_number(ctx.scalar(value)))
+
+
+@register("LEFT")
+def fn_left(ctx, text, count=None):
+    n = _int_arg(ctx, count, 1)
+    if n < 0:
+        raise VALUE
+    return _text_arg(ctx, text)[:n]
+
+
+@register("RIGHT")
+def fn_right(ctx, text, count=None):
+    n = _int_arg(ctx, count, 1)
+    if n < 0:
+        raise VALUE
+    s = _text_arg(ctx, text)
+    return s[len(s) - n:] if n else ""
+
+
+@register("MID")
+def fn_mid(ctx, text, start, count):
+    s, n = _int_arg(ctx, start, 1), _int_arg(ctx, count, 0)
+    if s < 1 or n < 0:
+        raise VALUE
+    return _text_arg(ctx, text)[s - 1:s - 1 + n]
+
+
+@register("LEN")
+def fn_len(ctx, text):
+    return unary(lambda v: float(len(to_text(v))), text)
+
+
+@register("UPPER")
+def fn_upper(ctx, text):
+    return unary(lambda v: to_text(v).upper(), text)
+
+
+@register("LOWER")
+def fn_lower(ctx, text):
+    return unary(lambda v: to_text(v).lower(), text)
+
+
+@register("PROPER")
+def fn_proper(ctx, text):
+    return re.sub(r"[A-Za-z]+", lambda m: m.group(0).capitalize(), _text_arg(ctx, text))
+
+
+@register("TRIM")
+def fn_trim(ctx, text):
+    return unary(lambda v: re.sub(" +", " ", to_text(v)).strip(" "), text)
+
+
+@register("CONCATENATE")
+def fn_concatenate(ctx, *args):
+    return "".join(_text_arg(ctx, a) for a in args)
+
+
+@register("CONCAT")
+def fn_concat(ctx, *args):
+    parts = []
+    for arg in args:
+        values = arg.row_major() if isinstance(arg, Range) else (arg,)
+        parts.extend(to_text(check(v)) for v in values)
+    return "".join(parts)
+
+
+@register("TEXTJOIN")
+def fn_textjoin(ctx, delimiter, ignore_empty, *args):
+    sep = _text_arg(ctx, delimiter)
+    skip = to_bool(ctx.scalar(ignore_empty))
+    parts = []
+    for arg in args:
+        values = arg.row_major() if isinstance(arg, Range) else (arg,)
+        for v in values:
+            text = to_text(check(v))
+            if text or not skip:
+                parts.append(text)
+    return sep.join(parts)
+
+
+@register("SUBSTITUTE")
+def fn_substitute(ctx, text, old, new, instance=None):
+    s, o, n = _text_arg(ctx, text), _text_arg(ctx, old), _text_arg(ctx, new)
+    if not o:
+        return s
+    if instance is None:
+        return s.replace(o, n)
+    k = _int_arg(ctx, instance, 1)
+    if k < 1:
+        raise VALUE
+    pos = -1
+    for _ in range(k):
+        pos = s.find(o, pos + 1)
+        if pos < 0:
+            return s
+    return s[:pos] + n + s[pos + len(o):]
+
+
+@register("FIND")
+def fn_find(ctx, needle, haystack, start=None):
+    n, h, s = _text_arg(ctx, needle), _text_arg(ctx, haystack), _int_arg(ctx, start, 1)
+    if s < 1 or s > len(h) + 1:
+        raise VALUE
+    pos = h.find(n, s - 1)
+    if pos < 0:
+        raise VALUE
+    return float(pos + 1)
+
+
+@register("SEARCH")
+def fn_search(ctx, needle, haystack, start=None):
+    n, h, s = _text_arg(ctx, needle), _text_arg(ctx, haystack), _int_arg(ctx, start, 1)
+    if s < 1 or s > len(h) + 1:
+        raise VALUE
+    regex = _wildcard_regex(n) or re.compile(re.escape(n), re.I)
+    m = regex.search(h, s - 1)
+    if m is None:
+        raise VALUE
+    return float(m.start() + 1)
+
+
+@register("REPT")
+def fn_rept(ctx, text, count):
+    n = _int_arg(ctx, count, 0)
+    if n < 0:
+        raise VALUE
+    return _text_arg(ctx, text) * n
+
+
+@register("EXACT")
+def fn_exact(ctx, a, b):
+    return _text_arg(ctx, a) == _text_arg(ctx, b)
+
+
+@register("VALUE")
+def fn_value(ctx, text):
+    value = check(ctx.scalar(text))
+    if isinstance(value, float):
+        return value
+    num = _parse_number(to_text(value))
+    if num is None:
+        raise VALUE
+    return num
+
+
+@register("T")
+def fn_t(ctx, value):
+    value = check(ctx.scalar(value))
+    return value if isinstance(value, str) else ""
+
+
+_DATE_TOKEN_RE = re.compile(r"yyyy|yy|mmmm|mmm|mm|m|dddd|ddd|dd|d|hh|h|ss|s|AM/PM", re.I)
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December"]
+_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _format_date(serial: float, fmt: str, epoch) -> str:
+    moment = from_excel(serial, epoch)
+    if isinstance(moment, date) and not isinstance(moment, datetime):
+        moment = datetime(moment.year, moment.month, moment.day)
+    tokens = list(_DATE_TOKEN_RE.finditer(fmt))
+    out = []
+    pos = 0
+    for k, m in enumerate(tokens):
+        out.append(fmt[pos:m.start()].replace('"', "").replace("\\", ""))
+        tok = m.group(0).lower()
+        if tok in ("mm", "m"):
+            # m 紧跟在 h 之后或紧挨 s 之前时表示分钟
+            prev = tokens[k - 1].group(0).lower() if k else ""
+            nxt = tokens[k + 1].group(0).lower() if k + 1 < len(tokens) else ""
+            if prev.startswith("h") or nxt.startswith("s"):
+                tok = "min2" if tok == "mm" else "min1"
+        out.append({
+            "yyyy": f"{moment.year:04d}", "yy": f"{moment.year % 100:02d}",
+            "mmmm": _MONTHS[moment.month - 1], "mmm": _MONTHS[moment.month - 1][:3],
+            "mm": f"{moment.month:02d}", "m": str(moment.month),
+            "dddd": _DAYS[moment.weekday()], "ddd": _DAYS[moment.weekday()][:3],
+            "dd": f"{moment.day:02d}", "d": str(moment.day),
+            "hh": f"{moment.hour:02d}", "h": str(moment.hour),
+            "min2": f"{moment.minute:02d}", "min1": str(moment.minute),
+            "ss": f"{moment.second:02d}", "s": str(moment.second),
+            "am/pm": "AM" if moment.hour < 12 else "PM",
+        }[tok])
+        pos = m.end()
+    out.append(fmt[pos:].replace('"', "").replace("\\", ""))
+    return "".join(out)
+
+
+_NUMBER_FORMAT_RE = re.compile(r'^(?P<prefix>[^0#.,%]*)(?P<body>[0#,]*(?:\.[0#]*)?)(?P<pct>%?)(?P<suffix>[^0#.,%]*)$')
+
+
+def _format_number(num: float, fmt: str) -> str:
+    if ";" in fmt:
+        sections = fmt.split(";")
+        if num < 0 and len(sections) > 1:
+            return _format_number(-num, sections[1])
+        if num == 0 and len(sections) > 2:
+            return _format_number(num, sections[2])
+        fmt = sections[0]
+    m = _NUMBER_FORMAT_RE.match(fmt)
+    if m is None or not m.group("body"):
+        raise UnsupportedFormula(f"TEXT 格式: {fmt}")
+    body = m.group("body")
+    if m.group("pct"):
+        num *= 100
+    integer, _, frac = body.partition(".")
+    decimals = len(frac)
+    grouping = "," in integer
+    min_int = integer.count("0")
+    rounded = _round(abs(num), decimals, ROUND_HALF_UP)
+    text = f"{rounded:{',' if grouping else ''}.{decimals}f}"
+    int_part, _, frac_part = text.partition(".")
+    if int_part.replace(",", "") == "0" and min_int == 0:
+        int_part = ""
+    elif len(int_part.replace(",", "")) < min_int:
+        int_part = int_part.zfill(min_int)
+    sign = "-" if num < 0 and rounded != 0 else ""
+    strip = lambda s: s.replace('"', "").replace("\\", "")
+    number = int_part + ("." + frac_part if decimals else "")
+    return f"{sign}{strip(m.group('prefix'))}{number}{m.group('pct')}{strip(m.group('suffix'))}"
+
+
+@register("TEXT")
+def fn_text(ctx, value, fmt):
+    value = check(ctx.scalar(value))
+    fmt = _text_arg(ctx, fmt)
+    if isinstance(value, str):
+        num = _parse_number(value)
+        if num is None:
+            return value
+        value = num
+    num = to_number(value)
+    if fmt.lower() in ("general", "@", ""):
+        return format_general(num)
+    if _DATE_TOKEN_RE.search(fmt.replace("AM/PM", "")) and not re.search(r"[0#]", fmt):
+        return _format_date(num, fmt, ctx.epoch)
+    return _format_number(num, fmt)
+
+
+# ---------------------------------------------------------------------------
+# 日期
+# ---------------------------------------------------------------------------
+
+
+def _serial(ctx, value) -> float:
+    num = to_number(check(ctx.scalar(value)))
+    if num < 0:
+        raise NUM
+    return num
+
+
+def _to_date(ctx, value) -> date:
+    moment = from_excel(math.floor(_serial(ctx, value)), ctx.epoch)
+    return moment.date() if isinstance(moment, datetime) else moment
+
+
+def _date_serial(ctx, d: date) -> float:
+    return float(to_excel(d, ctx.epoch))
+
+
+@register("DATE")
+def fn_date(ctx, year, month, day):
+    y, m, d = (int(to_number(ctx.scalar(v))) for v in (year, month, day))
+    if 0 <= y < 1900:
+        y += 1900
+    y += (m - 1) // 12
+    m = (m - 1) % 12 + 1
+    try:
+        result = date(y, m, 1) + timedelta(days=d - 1)
+    except (ValueError, OverflowError):
+        raise NUM
+    return _date_serial(ctx, result)
+
+
+@register("YEAR")
+def fn_year(ctx, serial):
+    return float(_to_date(ctx, serial).year)
+
+
+@register("MONTH")
+def fn_month(ctx, serial):
+    return float(_to_date(ctx, serial).month)
+
+
+@register("DAY")
+def fn_day(ctx, serial):
+    return float(_to_date(ctx, serial).day)
+
+
+@register("TODAY")
+def fn_today(ctx):
+    return _date_serial(ctx, date.today())
+
+
+@register("NOW")
+def fn_now(ctx):
+    return float(to_excel(datetime.now(), ctx.epoch))
+
+
+def _add_months(d: date, months: int) -> tuple[int, int]:
+    total = d.year * 12 + d.month - 1 + months
+    return total // 12, total % 12 + 1
+
+
+def _month_end(year: int, month: int) -> date:
+    nxt = date(year + month // 12, month % 12 + 1, 1)
+    return nxt - timedelta(days=1)
+
+
+@register("EDATE")
+def fn_edate(ctx, start, months):
+    d = _to_date(ctx, start)
+    y, m = _add_months(d, int(to_number(ctx.scalar(months))))
+    return _date_serial(ctx, date(y, m, min(d.day, _month_end(y, m).day)))
+
+
+@register("EOMONTH")
+def fn_eomonth(ctx, start, months):
+    d = _to_date(ctx, start)
+    y, m = _add_months(d, int(to_number(ctx.scalar(months))))
+    return _date_serial(ctx, _month_end(y, m))
+
+
+@register("WEEKDAY")
+def fn_weekday(ctx, serial, return_type=None):
+    d = _to_date(ctx, serial)
+    kind = _int_arg(ctx, return_type, 1)
+    iso = d.isoweekday()  # 周一 = 1
+    if kind == 1:
+        return float(iso % 7 + 1)
+    if kind == 2:
+        return float(iso)
+    if kind == 3:
+        return float(iso - 1)
+    raise UnsupportedFormula(f"WEEKDAY 返回类型 {kind}")
+
+
+@register("DAYS")
+def fn_days(ctx, end, start):
+    return float(math.floor(_serial(ctx, end)) - math.floor(_serial(ctx, start)))
+
+
+@register("DATEDIF")
+def fn_datedif(ctx, start, end, unit):
+    a, b = _to_date(ctx, start), _to_date(ctx, end)
+    if a > b:
+        raise NUM
+    u = _text_arg(ctx, unit).upper()
+    months = (b.year - a.year) * 12 + b.month - a.month - (b.day < a.day)
+    if u == "D":
+        return float((b - a).days)
+    if u == "M":
+        return float(months)
+    if u == "Y":
+        return float(months // 12)
+    raise UnsupportedFormula(f"DATEDIF 单位 {u}")
+
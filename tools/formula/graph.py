@@ -0,0 +1,205 @@
+"""公式依赖图 — 持久保存每个公式的引用关系，支持增量重算
+
+节点有两种:
+    单元格 (sheet, row, col)
+    区域   (sheet, r1, c1, r2, c2)；整列/整行引用的开放端为 None
+
+一个被多次引用的区域只对应一个节点（区域压缩）：区域内的公式 → 区域 → 引用它的公式。
+某个单元格变化时，通过按列、按行块划分的空间索引找到包含它的区域节点，
+再沿依赖边收集需要重算的“脏锥”，只对这部分做拓扑排序与求值。
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+
+from tools.formula.parser import UnsupportedFormula
+
+CellKey = tuple[str, int, int]
+NodeKey = tuple[str, int, int, int | None, int | None]
+
+ROW_BLOCK = 256     # 空间索引的行块大小
+WIDE_COLUMNS = 64   # 超过该列数的区域不按列索引，单独线性检查
+
+
+class DependencyGraph:
+    """precedents[cell] 为 cell 的公式直接引用的 (单元格集合, 区域集合)；
+    cell_dependents / range_dependents 为反向边。"""
+
+    def __init__(self):
+        self.precedents: dict[CellKey, tuple[frozenset, frozenset]] = {}
+        self.cell_dependents: dict[CellKey, set[CellKey]] = {}
+        self.range_dependents: dict[NodeKey, set[CellKey]] = {}
+        self.formula_rows: dict[tuple[str, int], list[int]] = {}
+        self._buckets: dict[tuple[str, int, int], list[NodeKey]] = {}
+        self._wide: dict[str, set[NodeKey]] = {}
+
+    def __contains__(self, cell: CellKey) -> bool:
+        return cell in self.precedents
+
+    # ------------------------------------------------------------------
+    # 维护
+    # ------------------------------------------------------------------
+
+    def add(self, cell: CellKey, cells: set[CellKey], ranges: set[NodeKey]) -> None:
+        """登记公式单元格及其引用（已存在时先移除旧引用）。"""
+        if cell in self.precedents:
+            self.remove(cell)
+        self.precedents[cell] = (frozenset(cells), frozenset(ranges))
+        insort(self.formula_rows.setdefault((cell[0], cell[2]), []), cell[1])
+        for target in cells:
+            self.cell_dependents.setdefault(target, set()).add(cell)
+        for key in ranges:
+            dependents = self.range_dependents.get(key)
+            if dependents is None:
+                dependents = self.range_dependents[key] = set()
+                self._index(key)
+            dependents.add(cell)
+
+    def remove(self, cell: CellKey) -> set[NodeKey]:
+        """移除公式单元格，返回不再被任何公式引用而被删除的区域节点。"""
+        entry = self.precedents.pop(cell, None)
+        if entry is None:
+            return set()
+        rows = self.formula_rows[(cell[0], cell[2])]
+        del rows[bisect_left(rows, cell[1])]
+        cells, ranges = entry
+        for target in cells:
+            dependents = self.cell_dependents[target]
+            dependents.discard(cell)
+            if not dependents:
+                del self.cell_dependents[target]
+        dropped = set()
+        for key in ranges:
+            dependents = self.range_dependents[key]
+            dependents.discard(cell)
+            if not dependents:
+                del self.range_dependents[key]
+                self._unindex(key)
+                dropped.add(key)
+        return dropped
+
+    def _bucket_keys(self, key: NodeKey):
+        sheet, r1, c1, r2, c2 = key
+        if c2 is None or c2 - c1 >= WIDE_COLUMNS:
+            return None
+        blocks = [-1] if r2 is None else range(r1 // ROW_BLOCK, r2 // ROW_BLOCK + 1)
+        return [(sheet, col, block) for col in range(c1, c2 + 1) for block in blocks]
+
+    def _index(self, key: NodeKey) -> None:
+        buckets = self._bucket_keys(key)
+        if buckets is None:
+            self._wide.setdefault(key[0], set()).add(key)
+            return
+        for bucket in buckets:
+            self._buckets.setdefault(bucket, []).append(key)
+
+    def _unindex(self, key: NodeKey) -> None:
+        buckets = self._bucket_keys(key)
+        if buckets is None:
+            self._wide[key[0]].discard(key)
+            return
+        for bucket in buckets:
+            items = self._buckets[bucket]
+            items.remove(key)
+            if not items:
+                del self._buckets[bucket]
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def formulas_in(self, key: NodeKey):
+        """区域内的公式单元格。"""
+        sheet, r1, c1, r2, c2 = key
+        if c2 is None:
+            cols = sorted(c for (s, c) in self.formula_rows if s == sheet and c >= c1)
+        else:
+            cols = range(c1, c2 + 1)
+        for col in cols:
+            rows = self.formula_rows.get((sheet, col))
+            if not rows:
+                continue
+            stop = len(rows) if r2 is None else bisect_right(rows, r2)
+            for row in rows[bisect_left(rows, r1):stop]:
+                yield sheet, row, col
+
+    def ranges_containing(self, sheet: str, row: int, col: int):
+        """包含该单元格的区域节点。"""
+        for key in self._buckets.get((sheet, col, row // ROW_BLOCK), ()):
+            if key[1] <= row <= key[3]:
+                yield key
+        for key in self._buckets.get((sheet, col, -1), ()):
+            if key[1] <= row:
+                yield key
+        for key in self._wide.get(sheet, ()):
+            _, r1, c1, r2, c2 = key
+            if r1 <= row and (r2 is None or row <= r2) and c1 <= col and (c2 is None or col <= c2):
+                yield key
+
+    def successors(self, node):
+        if len(node) == 5:
+            return self.range_dependents.get(node, ())
+        found = list(self.cell_dependents.get(node, ()))
+        found.extend(self.ranges_containing(*node))
+        return found
+
+    # ------------------------------------------------------------------
+    # 排序
+    # ------------------------------------------------------------------
+
+    def order(self) -> list[CellKey]:
+        """全部公式的拓扑序（被引用者在前）；存在循环引用时抛出 UnsupportedFormula。"""
+        indegree: dict = {cell: 0 for cell in self.precedents}
+        edges: dict = {}
+
+        def link(src, dst) -> None:
+            edges.setdefault(src, []).append(dst)
+            indegree[dst] += 1
+
+        for target, dependents in self.cell_dependents.items():
+            if target in self.precedents:
+                for cell in dependents:
+                    link(target, cell)
+        for key, dependents in self.range_dependents.items():
+            indegree.setdefault(key, 0)
+            for cell in self.formulas_in(key):
+                link(cell, key)
+            for cell in dependents:
+                link(key, cell)
+        return self._kahn(indegree, edges.get, len(self.precedents))
+
+    def cone(self, changed) -> tuple[list[CellKey], set[NodeKey]]:
+        """changed 的全部下游：返回 (需要重算的公式单元格拓扑序, 受影响的区域节点)。"""
+        seen = set(changed)
+        queue = deque(seen)
+        while queue:
+            for nxt in self.successors(queue.popleft()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    queue.append(nxt)
+
+        indegree = dict.fromkeys(seen, 0)
+        edges = {}
+        for node in seen:
+            succ = self.successors(node)
+            edges[node] = succ
+            for nxt in succ:
+                indegree[nxt] += 1
+        formulas = sum(1 for node in seen if node in self.precedents)
+        order = self._kahn(indegree, edges.get, formulas)
+        return order, {node for node in seen if len(node) == 5}
+
+    def _kahn(self, indegree: dict, successors, expected: int) -> list[CellKey]:
+        queue = deque(node for node, n in indegree.items() if n == 0)
+        result = []
+        while queue:
+            node = queue.popleft()
+            if len(node) == 3 and node in self.precedents:
+                result.append(node)
+            for nxt in successors(node) or ():
+                indegree[nxt] -= 1
+                if indegree[nxt] == 0:
+                    queue.append(nxt)
+        if len(result) != expected:
+            raise UnsupportedFormula(f"循环引用（{expected - len(result)} 个单元格）")
+        return result
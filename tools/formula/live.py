@@ -0,0 +1,88 @@
+"""会话内的增量计算模型 — 写入公式后立即得到计算结果
+
+在 workbook_session() 内，某个文件第一次被计算时，用会话中 formula 模式的 Workbook
+（即 read_excel_formulas 看到的内容）构建 Evaluator 并全量求值一次；之后 writer 的每次写入
+通过 notify() 记为待处理变更，下一次计算只重算受影响的脏锥，通常只需几毫秒。
+
+没有活动会话时直接从磁盘文件构建并全量求值。
+"""
+
+import os
+import threading
+import weakref
+
+from openpyxl import Workbook
+
+from tools.columnar import ColumnarWorkbook
+from tools.formula.evaluator import Evaluator
+from tools.formula.graph import CellKey
+from tools.formula.parser import UnsupportedFormula
+from tools.session import current_session
+
+
+class LiveWorkbook:
+    """与会话中某个 Workbook 同步的 Evaluator。"""
+
+    def __init__(self, wb: Workbook):
+        self.wb = wb
+        self.evaluator = Evaluator(ColumnarWorkbook.from_openpyxl(wb))
+        self.evaluator.evaluate()
+        self.pending: list[tuple[str, dict[tuple[int, int], object]]] = []
+
+    def apply(self) -> dict[CellKey, object]:
+        """应用待处理的写入并增量重算，返回 {重算的单元格: 新值}。"""
+        pending, self.pending = self.pending, []
+        evaluator = self.evaluator
+        for sheet, changes in pending:
+            for (row, col), value in changes.items():
+                if isinstance(value, str) and value.startswith("="):
+                    evaluator.set_formula(sheet, row, col, value)
+                else:
+                    evaluator.set_value(sheet, row, col, value)
+        return evaluator.recalculate()
+
+
+# 会话 → {绝对路径: LiveWorkbook}；会话结束后随之释放
+_models: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_models_lock = threading.Lock()
+
+
+def _session_models(session, create: bool = False) -> dict:
+    with _models_lock:
+        if create:
+            return _models.setdefault(session, {})
+        return _models.get(session, {})
+
+
+def notify(file_path: str, sheet_name: str, changes: dict[tuple[int, int], object]) -> None:
+    """记录一次写入（{(row, col): 写入的值或 "=公式"}）。尚未建立模型时什么也不做。"""
+    session = current_session()
+    if session is None:
+        return
+    model = _session_models(session).get(os.path.abspath(file_path))
+    if model is not None and changes:
+        model.pending.append((sheet_name, changes))
+
+
+def calculate(file_path: str) -> Evaluator:
+    """返回与最新写入同步的 Evaluator；含不支持的公式时抛出 UnsupportedFormula。"""
+    session = current_session()
+    if session is None:
+        evaluator = Evaluator(ColumnarWorkbook.from_xlsx(file_path))
+        evaluator.evaluate()
+        return evaluator
+
+    path = os.path.abspath(file_path)
+    models = _session_models(session, create=True)
+    wb = session.load(path)
+    model = models.pop(path, None)
+    if model is not None and model.wb is wb:
+        try:
+            model.apply()
+            models[path] = model
+            return model.evaluator
+        except UnsupportedFormula:
+            pass  # 新建了工作表等情况：从 Workbook 重建
+    model = LiveWorkbook(wb)
+    models[path] = model
+    return model.evaluator
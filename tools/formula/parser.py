@@ -0,0 +1,274 @@
+"""公式解析 — openpyxl Tokenizer 的词法结果 → 抽象语法树
+
+AST 节点均为元组，首元素为节点类型:
+    ("num", float) ("str", text) ("bool", bool) ("err", "#N/A") ("missing",)
+    ("ref", sheet | None, r1, c1, r2 | None, c2 | None, is_range, (r1$, c1$, r2$, c2$))
+        r2/c2 为 None 表示整列/整行引用的开放端；末项为各端点是否绝对引用
+    ("name", text)                         定义名称
+    ("neg", node) ("pct", node)
+    ("bin", op, left, right)
+    ("call", NAME, [args])
+    ("array", [[node, ...], ...])
+"""
+
+import re
+
+from openpyxl.formula.tokenizer import Token, Tokenizer, TokenizerError
+from openpyxl.utils.cell import column_index_from_string
+
+
+class UnsupportedFormula(Exception):
+    """公式无法由原生引擎处理（语法、函数或引用类型不支持）。"""
+
+
+# Excel 运算符优先级（数值越大越先结合）
+BINARY_PRECEDENCE = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2,
+    "+": 3, "-": 3,
+    "*": 4, "/": 4,
+    "^": 5,
+}
+
+_CELL_RE = re.compile(r"^(\$?)([A-Za-z]{1,3})(\$?)(\d+)$")
+_COL_RE = re.compile(r"^\$?([A-Za-z]{1,3})$")
+_ROW_RE = re.compile(r"^\$?(\d+)$")
+# 公式文本中的单元格引用（不含引号内的文本与 sheet 名）
+_REF_IN_TEXT_RE = re.compile(r"(?<![A-Za-z0-9_.$])(\$?)([A-Za-z]{1,3})(\$?)(\d+)(?![A-Za-z0-9_(!\[])")
+_QUOTED_RE = re.compile(r"(\"(?:[^\"]|\"\")*\"|'(?:[^']|'')*')")
+_FUNC_PREFIXES = ("_xlfn._xlws.", "_xlfn.", "_xlws.")
+
+
+def split_sheet(ref: str) -> tuple[str | None, str]:
+    """拆分 "'My Sheet'!A1:B2" → ("My Sheet", "A1:B2")。"""
+    if "!" not in ref:
+        return None, ref
+    sheet, addr = ref.rsplit("!", 1)
+    if sheet.startswith("'") and sheet.endswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    if sheet.startswith("["):
+        raise UnsupportedFormula(f"外部工作簿引用: {ref}")
+    return sheet, addr
+
+
+def parse_ref(text: str) -> tuple:
+    """解析单元格/区域引用；无法识别为引用时视为定义名称。"""
+    sheet, addr = split_sheet(text)
+    if "[" in addr:
+        raise UnsupportedFormula(f"结构化引用: {text}")
+
+    parts = addr.split(":")
+    if len(parts) == 1:
+        m = _CELL_RE.match(addr)
+        if m is None:
+            if sheet is not None:
+                raise UnsupportedFormula(f"无法解析的引用: {text}")
+            return ("name", addr)
+        row, col = int(m.group(4)), column_index_from_string(m.group(2).upper())
+        row_abs, col_abs = bool(m.group(3)), bool(m.group(1))
+        return ("ref", sheet, row, col, row, col, False, (row_abs, col_abs, row_abs, col_abs))
+
+    if len(parts) != 2:
+        raise UnsupportedFormula(f"无法解析的引用: {text}")
+    a, b = parts
+    ma, mb = _CELL_RE.match(a), _CELL_RE.match(b)
+    if ma and mb:
+        r1, c1 = int(ma.group(4)), column_index_from_string(ma.group(2).upper())
+        r2, c2 = int(mb.group(4)), column_index_from_string(mb.group(2).upper())
+        rows = sorted([(r1, bool(ma.group(3))), (r2, bool(mb.group(3)))])
+        cols = sorted([(c1, bool(ma.group(1))), (c2, bool(mb.group(1)))])
+        return ("ref", sheet, rows[0][0], cols[0][0], rows[1][0], cols[1][0], True,
+                (rows[0][1], cols[0][1], rows[1][1], cols[1][1]))
+    # 整列/整行引用不参与模板平移（见 template_key），按绝对引用记录
+    ma, mb = _COL_RE.match(a), _COL_RE.match(b)
+    if ma and mb:
+        c1 = column_index_from_string(ma.group(1).upper())
+        c2 = column_index_from_string(mb.group(1).upper())
+        return ("ref", sheet, 1, min(c1, c2), None, max(c1, c2), True, (True, True, True, True))
+    ma, mb = _ROW_RE.match(a), _ROW_RE.match(b)
+    if ma and mb:
+        r1, r2 = int(ma.group(1)), int(mb.group(1))
+        return ("ref", sheet, min(r1, r2), 1, max(r1, r2), None, True, (True, True, True, True))
+    raise UnsupportedFormula(f"无法解析的引用: {text}")
+
+
+class _Parser:
+    def __init__(self, tokens: list[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self) -> Token | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> Token:
+        tok = self.peek()
+        if tok is None:
+            raise UnsupportedFormula("公式意外结束")
+        self.pos += 1
+        return tok
+
+    def parse(self):
+        node = self.expr(0)
+        if self.peek() is not None:
+            raise UnsupportedFormula(f"无法解析的记号: {self.peek().value!r}")
+        return node
+
+    def expr(self, min_prec: int):
+        left = self.unary()
+        while True:
+            tok = self.peek()
+            if tok is None or tok.type != Token.OP_IN:
+                return left
+            prec = BINARY_PRECEDENCE.get(tok.value)
+            if prec is None:
+                raise UnsupportedFormula(f"不支持的运算符: {tok.value}")
+            if prec < min_prec:
+                return left
+            self.next()
+            right = self.expr(prec + 1)
+            left = ("bin", tok.value, left, right)
+
+    def unary(self):
+        tok = self.peek()
+        if tok is not None and tok.type == Token.OP_PRE:
+            self.next()
+            operand = self.unary()
+            return ("neg", operand) if tok.value == "-" else operand
+        node = self.primary()
+        while True:
+            tok = self.peek()
+            if tok is not None and tok.type == Token.OP_POST and tok.value == "%":
+                self.next()
+                node = ("pct", node)
+            else:
+                return node
+
+    def primary(self):
+        tok = self.next()
+        if tok.type == Token.OPERAND:
+            if tok.subtype == Token.NUMBER:
+                return ("num", float(tok.value))
+            if tok.subtype == Token.TEXT:
+                return ("str", tok.value[1:-1].replace('""', '"'))
+            if tok.subtype == Token.LOGICAL:
+                return ("bool", tok.value.upper() == "TRUE")
+            if tok.subtype == Token.ERROR:
+                return ("err", tok.value.upper())
+            return parse_ref(tok.value)
+
+        if tok.type == Token.FUNC and tok.subtype == Token.OPEN:
+            name = tok.value[:-1].upper()
+            for prefix in _FUNC_PREFIXES:
+                if name.startswith(prefix.upper()):
+                    name = name[len(prefix):]
+            if ":" in name or "!" in name:
+                raise UnsupportedFormula(f"不支持的引用运算: {tok.value}")
+            return ("call", name, self.arguments())
+
+        if tok.type == Token.PAREN and tok.subtype == Token.OPEN:
+            node = self.expr(0)
+            close = self.next()
+            if close.type != Token.PAREN:
+                raise UnsupportedFormula("括号不匹配")
+            return node
+
+        if tok.type == Token.ARRAY and tok.subtype == Token.OPEN:
+            return self.array()
+
+        raise UnsupportedFormula(f"无法解析的记号: {tok.value!r}")
+
+    def arguments(self) -> list:
+        args = []
+        tok = self.peek()
+        if tok is not None and tok.type == Token.FUNC and tok.subtype == Token.CLOSE:
+            self.next()
+            return args
+        while True:
+            tok = self.peek()
+            if tok is not None and (tok.type == Token.SEP or (tok.type == Token.FUNC and tok.subtype == Token.CLOSE)):
+                args.append(("missing",))
+            else:
+                args.append(self.expr(0))
+            tok = self.next()
+            if tok.type == Token.FUNC and tok.subtype == Token.CLOSE:
+                return args
+            if not (tok.type == Token.SEP and tok.subtype == Token.ARG):
+                raise UnsupportedFormula(f"函数参数中出现意外记号: {tok.value!r}")
+
+    def array(self):
+        rows = [[]]
+        while True:
+            rows[-1].append(self.unary())
+            tok = self.next()
+            if tok.type == Token.ARRAY and tok.subtype == Token.CLOSE:
+                return ("array", rows)
+            if tok.type == Token.SEP and tok.subtype == Token.ROW:
+                rows.append([])
+            elif not (tok.type == Token.SEP and tok.subtype == Token.ARG):
+                raise UnsupportedFormula(f"数组常量中出现意外记号: {tok.value!r}")
+
+
+def parse(formula: str):
+    """解析公式（带 "="）为 AST；不支持的语法抛出 UnsupportedFormula。"""
+    if not formula.startswith("="):
+        formula = "=" + formula
+    try:
+        tokens = Tokenizer(formula).items
+    except TokenizerError as e:
+        raise UnsupportedFormula(str(e)) from e
+    tokens = [t for t in tokens if t.type != Token.WSPACE]
+    if not tokens:
+        raise UnsupportedFormula("空公式")
+    return _Parser(tokens).parse()
+
+
+def iter_nodes(node):
+    """深度优先遍历 AST 的所有节点。"""
+    yield node
+    kind = node[0]
+    if kind in ("neg", "pct"):
+        yield from iter_nodes(node[1])
+    elif kind == "bin":
+        yield from iter_nodes(node[2])
+        yield from iter_nodes(node[3])
+    elif kind == "call":
+        for arg in node[2]:
+            yield from iter_nodes(arg)
+    elif kind == "array":
+        for row in node[1]:
+            for item in row:
+                yield from iter_nodes(item)
+
+
+def template_key(formula: str, row: int, col: int) -> str:
+    """公式的相对引用形式（类似 R1C1）：向下/向右填充得到的公式共享同一个 key。"""
+    def relative(m: re.Match) -> str:
+        c = column_index_from_string(m.group(2).upper())
+        r = int(m.group(4))
+        col_part = f"C{c}" if m.group(1) else f"C[{c - col}]"
+        row_part = f"R{r}" if m.group(3) else f"R[{r - row}]"
+        return row_part + col_part
+
+    pieces = _QUOTED_RE.split(formula)
+    # split 结果中奇数位是引号内的文本，保持原样
+    return "".join(p if i % 2 else _REF_IN_TEXT_RE.sub(relative, p) for i, p in enumerate(pieces))
+
+
+def shift(node, row_delta: int, col_delta: int):
+    """把 AST 中的相对引用平移 (row_delta, col_delta)，绝对部分保持不变。"""
+    kind = node[0]
+    if kind == "ref":
+        _, sheet, r1, c1, r2, c2, is_range, (ra1, ca1, ra2, ca2) = node
+        return ("ref", sheet,
+                r1 if ra1 else r1 + row_delta, c1 if ca1 else c1 + col_delta,
+                r2 if ra2 or r2 is None else r2 + row_delta, c2 if ca2 or c2 is None else c2 + col_delta,
+                is_range, node[7])
+    if kind in ("neg", "pct"):
+        return (kind, shift(node[1], row_delta, col_delta))
+    if kind == "bin":
+        return ("bin", node[1], shift(node[2], row_delta, col_delta), shift(node[3], row_delta, col_delta))
+    if kind == "call":
+        return ("call", node[1], [shift(arg, row_delta, col_delta) for arg in node[2]])
+    if kind == "array":
+        return ("array", [[shift(item, row_delta, col_delta) for item in r] for r in node[1]])
+    return node
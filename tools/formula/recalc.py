@@ -0,0 +1,174 @@
+"""原生重算 — 计算全部公式并把结果写回 xlsx 的缓存值
+
+只改写公式单元格的 <v> 与 t 属性，工作表 XML 的其余部分（样式、条件格式、图表引用等）
+原样保留。返回值与 skills/xlsx/scripts/recalc.py 的 recalc() 完全相同。
+"""
+
+import os
+import re
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, range_boundaries
+
+from tools.columnar import ERROR, TEXT, ColumnarWorkbook
+from tools.formula.evaluator import Evaluator
+from tools.formula.functions import NUM, XLError
+from tools.formula.parser import UnsupportedFormula
+from tools.sheet_xml import WorkbookXml
+
+EXCEL_ERRORS = ["#VALUE!", "#DIV/0!", "#REF!", "#NAME?", "#NULL!", "#NUM!", "#N/A"]
+
+_CELL_RE = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_F_RE = re.compile(r"<f\b([^>]*?)(?:/>|>.*?</f>)", re.S)
+_R_ATTR_RE = re.compile(r'\sr="([A-Za-z]+\d+)"')
+_T_ATTR_RE = re.compile(r'\st="[^"]*"')
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def _check_formula_kinds(xml: str) -> None:
+    """多单元格数组公式与模拟运算表无法按单元格求值，交给 LibreOffice。"""
+    for m in _F_RE.finditer(xml):
+        attrs = dict(_ATTR_RE.findall(m.group(1)))
+        kind = attrs.get("t")
+        if kind == "dataTable":
+            raise UnsupportedFormula("模拟运算表")
+        if kind == "array":
+            min_col, min_row, max_col, max_row = range_boundaries(attrs.get("ref", "A1"))
+            if (min_col, min_row) != (max_col, max_row):
+                raise UnsupportedFormula(f"多单元格数组公式: {attrs.get('ref')}")
+
+
+def _serialize(value) -> tuple[str | None, str]:
+    """计算结果 → (t 属性, <v> 文本)。"""
+    if isinstance(value, XLError):
+        return "e", value.code
+    if isinstance(value, bool):
+        return "b", "1" if value else "0"
+    if isinstance(value, str):
+        return "str", escape(value)
+    if value != value or value in (float("inf"), float("-inf")):
+        return "e", NUM.code
+    if value == int(value) and abs(value) < 1e15:
+        return None, str(int(value))
+    return None, repr(value)
+
+
+def _patch_sheet(xml: str, sheet: str, results: dict) -> tuple[str, int]:
+    """替换一个 sheet 中所有公式单元格的缓存值，返回 (新 XML, 改写的单元格数)。"""
+    patched = 0
+
+    def replace(m: re.Match) -> str:
+        nonlocal patched
+        attrs, inner = m.group(1), m.group(2)
+        if not inner or "<f" not in inner:
+            return m.group(0)
+        ref = _R_ATTR_RE.search(attrs)
+        f = _F_RE.search(inner)
+        if ref is None or f is None:
+            return m.group(0)
+        row, col = coordinate_to_tuple(ref.group(1).upper())
+        key = (sheet, row, col)
+        if key not in results:
+            return m.group(0)
+        patched += 1
+        t, text = _serialize(results[key])
+        attrs = _T_ATTR_RE.sub("", attrs)
+        if t:
+            attrs += f' t="{t}"'
+        return f"<c{attrs}>{f.group(0)}<v>{text}</v></c>"
+
+    return _CELL_RE.sub(replace, xml), patched
+
+
+def _write_parts(file_path: str, parts: dict[str, bytes]) -> None:
+    """替换 zip 中的若干部件（写临时文件后原子替换）。"""
+    folder = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp = tempfile.mkstemp(suffix=".xlsx", dir=folder)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(file_path) as zin, zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+            for item in zin.infolist():
+                data = parts[item.filename] if item.filename in parts else zin.read(item.filename)
+                zout.writestr(item, data)
+        os.replace(tmp, file_path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _error_summary(book: ColumnarWorkbook, results: dict) -> dict:
+    """与 recalc() 相同的错误扫描：任何文本值包含错误码即计入，每格只计第一个匹配。"""
+    error_details = {err: [] for err in EXCEL_ERRORS}
+    pool = book.pool
+    flagged: dict[int, str | None] = {}
+
+    def classify(text: str) -> str | None:
+        return next((err for err in EXCEL_ERRORS if err in text), None)
+
+    for name, ws in book.sheets.items():
+        found = []
+        for col, column in enumerate(ws.columns, start=1):
+            if column is None:
+                continue
+            for i, tag in enumerate(column.tags):
+                if tag != TEXT and tag != ERROR:
+                    continue
+                if (name, i + 1, col) in results:
+                    continue
+                idx = int(column.data[i])
+                if idx not in flagged:
+                    flagged[idx] = classify(pool[idx])
+                if flagged[idx]:
+                    found.append((i + 1, col, flagged[idx]))
+        for (sheet, row, col), value in results.items():
+            if sheet != name:
+                continue
+            text = value.code if isinstance(value, XLError) else value if isinstance(value, str) else None
+            err = classify(text) if text else None
+            if err:
+                found.append((row, col, err))
+        for row, col, err in sorted(found):
+            error_details[err].append(f"{name}!{get_column_letter(col)}{row}")
+
+    total_errors = sum(len(locations) for locations in error_details.values())
+    result = {
+        "status": "success" if total_errors == 0 else "errors_found",
+        "total_errors": total_errors,
+        "error_summary": {},
+    }
+    for err_type, locations in error_details.items():
+        if locations:
+            result["error_summary"][err_type] = {
+                "count": len(locations),
+                "locations": locations[:20],
+            }
+    return result
+
+
+def recalc_file(file_path: str) -> dict:
+    """用原生引擎重算并写回；遇到不支持的公式时抛出 UnsupportedFormula，文件保持不变。"""
+    book = ColumnarWorkbook.from_xlsx(file_path)
+    with WorkbookXml(file_path) as package:
+        parts = {name: package.sheets[name] for name, ws in book.sheets.items() if ws.formulas}
+        xml = {name: package.zf.read(part).decode("utf-8") for name, part in parts.items()}
+    for text in xml.values():
+        _check_formula_kinds(text)
+
+    evaluator = Evaluator(book)
+    evaluator.compile()
+    results = evaluator.evaluate()
+
+    patched_parts = {}
+    for name, text in xml.items():
+        new_text, patched = _patch_sheet(text, name, results)
+        if patched != len(book[name].formulas):
+            raise UnsupportedFormula(f"{name}: 只定位到 {patched}/{len(book[name].formulas)} 个公式单元格")
+        patched_parts[parts[name]] = new_text.encode("utf-8")
+    if patched_parts:
+        _write_parts(file_path, patched_parts)
+
+    result = _error_summary(book, results)
+    result["total_formulas"] = sum(len(ws.formulas) for ws in book.sheets.values())
+    return result
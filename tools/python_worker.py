@@ -0,0 +1,281 @@
+"""run_python 的常驻 Python 进程池 — 省去每次调用的解释器启动与 pandas/openpyxl/numpy 导入
+
+每次 run_python 都启动新的解释器并重新导入 pandas 等库，代码本身还没开始执行就要花费
+0.5–1.5 秒。WorkerPool 维护若干个已预先导入这些库的子进程（本文件以脚本方式运行），
+每次调用由 worker fork 出一个一次性的子进程执行脚本，语义与 `python script.py` 保持一致:
+    - 子进程继承预导入完成时的解释器状态，执行后即退出；脚本导入的模块、对已导入模块的
+      修改（monkeypatch）、工作目录、环境变量与各类库选项都不会留给下一次调用
+    - stdout / stderr 分别写入本次调用的临时文件（重定向文件描述符 1、2，子进程与 C 扩展的
+      输出同样会被捕获），异常打印不含 worker 自身栈帧的 traceback，退出码规则与解释器相同
+      （被信号结束时为负的信号编号，与 subprocess 相同）
+    - 超时后杀死该 worker 的整个进程组，返回与原实现相同的超时信息
+崩溃或超时的 worker 立即丢弃；取走空闲 worker 时若已无空闲且未达上限，会在后台再启动一个
+备用进程，下一次调用无需等待导入。worker 无法启动时 run_python 退回逐次启动解释器的方式。
+
+环境变量: RUN_PYTHON_POOL（1 启用，默认；0 关闭）、RUN_PYTHON_WORKERS（进程数上限，默认 4）、
+RUN_PYTHON_PRELOAD（预先导入的模块，默认 numpy,pandas,openpyxl）。
+"""
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+PRELOAD = os.getenv("RUN_PYTHON_PRELOAD", "numpy,pandas,openpyxl")
+START_TIMEOUT = 120  # 等待 worker 完成预导入的上限（秒），不计入调用方的 timeout
+
+
+class WorkerUnavailable(RuntimeError):
+    """worker 未能启动（预导入失败或启动超时）。"""
+
+
+class _Worker:
+    """父进程一侧的单个 worker：按行收发 JSON 消息。"""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=dict(os.environ, RUN_PYTHON_PRELOAD=PRELOAD),
+            start_new_session=True,  # 超时时连同正在执行脚本的子进程一起杀死
+        )
+        self.ready = False
+        self._buf = b""
+
+    def _readline(self, deadline: float | None) -> dict:
+        """读取一条消息；超时抛出 TimeoutError，worker 退出时抛出 EOFError。"""
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buf:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\n", 1)
+        return json.loads(line)
+
+    def wait_ready(self) -> None:
+        if self.ready:
+            return
+        try:
+            self._readline(time.monotonic() + START_TIMEOUT)
+        except (TimeoutError, EOFError, ValueError) as e:
+            self.kill()
+            raise WorkerUnavailable(f"python worker failed to start: {type(e).__name__}") from e
+        self.ready = True
+
+    def run(self, request: dict, timeout: float) -> tuple[int, bool]:
+        """执行一个脚本，返回 (退出码, worker 是否已退出)；超时抛出 TimeoutError。"""
+        try:
+            self.proc.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            self.proc.stdin.flush()
+            reply = self._readline(time.monotonic() + timeout)
+        except (EOFError, BrokenPipeError):
+            return self.proc.wait(), True
+        return reply["returncode"], False
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.proc.wait()
+        for pipe in (self.proc.stdin, self.proc.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class WorkerPool:
+    def __init__(self, size: int = 4):
+        self.size = max(1, size)
+        self._idle: list[_Worker] = []
+        self._total = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker()
+        self._total += 1
+        return worker
+
+    def warm(self, count: int = 1) -> None:
+        """预先启动 count 个 worker（不等待导入完成），第一次调用也无需等待。"""
+        with self._cond:
+            while self._total < min(count, self.size):
+                self._idle.append(self._spawn())
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while not self._idle and self._total >= self.size:
+                self._cond.wait()
+            worker = self._idle.pop() if self._idle else self._spawn()
+            # 提前启动一个备用 worker，让它在后台完成预导入
+            if not self._idle and self._total < self.size:
+                self._idle.append(self._spawn())
+            return worker
+
+    def _release(self, worker: _Worker) -> None:
+        with self._cond:
+            if self._closed:
+                self._total -= 1
+                worker.kill()
+            else:
+                self._idle.append(worker)
+            self._cond.notify()
+
+    def _discard(self, worker: _Worker) -> None:
+        worker.kill()
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def run(self, script: str, stdout: str, stderr: str, cwd: str, env: dict, timeout: float) -> int:
+        """在 worker 中执行 script，输出写入 stdout / stderr 两个文件，返回退出码。
+
+        超时抛出 TimeoutError（worker 已被杀死）；worker 无法启动时抛出 WorkerUnavailable。
+        """
+        while True:
+            worker = self._acquire()
+            try:
+                worker.wait_ready()
+            except WorkerUnavailable:
+                self._discard(worker)
+                raise
+            if worker.proc.poll() is None:
+                break
+            self._discard(worker)  # 空闲期间被外部信号结束，换一个
+        request = {"script": script, "stdout": stdout, "stderr": stderr, "cwd": cwd, "env": env}
+        try:
+            returncode, crashed = worker.run(request, timeout)
+        except BaseException:
+            self._discard(worker)
+            raise
+        if crashed:
+            self._discard(worker)
+        else:
+            self._release(worker)
+        return returncode
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for worker in idle:
+            worker.kill()
+
+
+# ---------------------------------------------------------------------------
+# worker 进程一侧（python tools/python_worker.py）
+# ---------------------------------------------------------------------------
+
+
+def _exit_code(exc: SystemExit) -> int:
+    """与解释器处理 SystemExit 的规则相同。"""
+    code = exc.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xFF
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _execute(request: dict) -> int:
+    import tempfile
+    import traceback
+
+    script = request["script"]
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    tempfile.tempdir = None  # 按新的 TMPDIR 重新确定
+    sys.argv[:] = [script]
+    sys.path[0:0] = [os.path.dirname(script)]
+    namespace = {"__name__": "__main__", "__file__": script, "__builtins__": __builtins__, "__cached__": None}
+    try:
+        with open(script, "rb") as f:
+            code = compile(f.read(), script, "exec")
+        exec(code, namespace)
+        return 0
+    except SystemExit as e:
+        return _exit_code(e)
+    except BaseException as e:
+        # 跳过本函数的栈帧；compile 抛出的 SyntaxError 没有其余栈帧，只打印错误位置
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+
+
+def _redirect(stdout: str, stderr: str) -> None:
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for target, fd in ((stdout, 1), (stderr, 2)):
+        file_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(file_fd, fd)
+        os.close(file_fd)
+
+
+def _serve() -> None:
+    import atexit
+    import gc
+    import importlib
+
+    # 协议使用原始的 stdin / stdout；脚本看到的 0、1、2 平时指向 /dev/null
+    proto_in = os.fdopen(os.dup(0), "rb")
+    proto_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+    # 以脚本方式运行时 sys.path[0] 为 tools/，不能让其中的模块遮蔽脚本的导入
+    if sys.path and os.path.abspath(sys.path[0] or ".") == os.path.dirname(WORKER_SCRIPT):
+        del sys.path[0]
+    for name in filter(None, (n.strip() for n in os.getenv("RUN_PYTHON_PRELOAD", "").split(","))):
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+    def send(message: dict) -> None:
+        proto_out.write(json.dumps(message).encode("utf-8") + b"\n")
+        proto_out.flush()
+
+    # 预导入的对象之后不再变化，移出 GC 跟踪，避免子进程中的回收触碰这些页面（写时复制）
+    gc.collect()
+    gc.freeze()
+    send({"ready": True})
+    for line in proto_in:
+        request = json.loads(line)
+        pid = os.fork()
+        if pid == 0:
+            # 一次性子进程：执行脚本后直接退出，状态不会带回 worker
+            returncode = 1
+            try:
+                proto_in.close()
+                proto_out.close()
+                _redirect(request["stdout"], request["stderr"])
+                returncode = _execute(request)
+                atexit._run_exitfuncs()
+                for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+                    try:
+                        stream.flush()
+                    except Exception:
+                        pass
+            finally:
+                os._exit(returncode)
+        _, status = os.waitpid(pid, 0)
+        send({"returncode": os.waitstatus_to_exitcode(status)})
+
+
+if __name__ == "__main__":
+    _serve()
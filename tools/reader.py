@@ -5,11 +5,21 @@ from typing import Any
 
 import openpyxl
 import pandas as pd
+from openpyxl.utils.cell import get_column_letter, range_boundaries
 
+from tools import sheet_xml
+from tools.columnar import ColumnarWorkbook
+from tools.formula import UnsupportedFormula, XLError, live
+from tools.session import checkpoint, load_workbook
+from tools.stats import ColumnProfile
 
-def read_excel(file_path: str, sheet_name: str | None = None) -> dict[str, Any]:
+
+def read_excel(file_path: str, sheet_name: str | None = None, backend: str = "openpyxl") -> dict[str, Any]:
     """读取 Excel 文件，返回结构化信息。
 
+    Args:
+        backend: "openpyxl"，或 "xml"（tools.sheet_xml 流式解析，适合大表）
+
     Returns:
         {
             "file": 文件名,
@@ -22,18 +32,19 @@ def read_excel(file_path: str, sheet_name: str | None = None) -> dict[str, Any]:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"文件不存在: {file_path}")
 
-    wb = openpyxl.load_workbook(file_path, data_only=True)
+    if backend == "xml":
+        return _read_excel_xml(file_path, sheet_name)
+
+    # 只解析一次压缩包：所有 sheet 的 DataFrame 都从同一个 Workbook 构建，
+    # 不再对每个 sheet 调用一次 pd.read_excel(file_path)
+    wb = load_workbook(file_path, data_only=True, read_only=True)
     sheets = wb.sheetnames
     active = wb.active.title if wb.active else sheets[0]
 
     target_sheets = [sheet_name] if sheet_name and sheet_name in sheets else sheets
 
-    data = {}
-    shape = {}
-    for name in target_sheets:
-        df = pd.read_excel(file_path, sheet_name=name, engine="openpyxl")
-        data[name] = df
-        shape[name] = df.shape
+    data = pd.ExcelFile(wb, engine="openpyxl").parse(sheet_name=target_sheets)
+    shape = {name: df.shape for name, df in data.items()}
 
     wb.close()
 
@@ -46,13 +57,52 @@ def read_excel(file_path: str, sheet_name: str | None = None) -> dict[str, Any]:
     }
 
 
-def read_excel_formulas(file_path: str, sheet_name: str | None = None) -> dict[str, list]:
+def _read_excel_xml(file_path: str, sheet_name: str | None) -> dict[str, Any]:
+    """read_excel 的 xml 后端，返回结构相同。"""
+    # 直接读磁盘文件，先写回会话中的修改
+    checkpoint(file_path)
+    with sheet_xml.WorkbookXml(file_path) as book:
+        sheets = book.sheetnames
+        target_sheets = [sheet_name] if sheet_name and sheet_name in sheets else sheets
+        data = {name: sheet_xml.read_frame(file_path, name, book) for name in target_sheets}
+        active = book.active_sheet
+
+    return {
+        "file": os.path.basename(file_path),
+        "sheets": sheets,
+        "active_sheet": active,
+        "data": data,
+        "shape": {name: df.shape for name, df in data.items()},
+    }
+
+
+def read_excel_formulas(
+    file_path: str,
+    sheet_name: str | None = None,
+    backend: str = "openpyxl",
+) -> dict[str, list]:
     """读取 Excel 中的公式（非计算值）。
 
+    Args:
+        backend: "openpyxl"，或 "xml"（tools.sheet_xml 流式解析，适合大表）
+
     Returns:
         {sheet_name: [{"cell": "A1", "formula": "=SUM(B1:B10)"}, ...]}
     """
-    wb = openpyxl.load_workbook(file_path, data_only=False)
+    if backend == "xml":
+        checkpoint(file_path)
+        with sheet_xml.WorkbookXml(file_path) as book:
+            sheets = [sheet_name] if sheet_name and sheet_name in book.sheetnames else book.sheetnames
+            return {
+                name: [
+                    {"cell": f"{get_column_letter(col)}{row}", "formula": f"={formula}"}
+                    for row, col, _, formula, _ in book.iter_cells(name)
+                    if formula
+                ]
+                for name in sheets
+            }
+
+    wb = load_workbook(file_path, data_only=False)
     sheets = [sheet_name] if sheet_name and sheet_name in wb.sheetnames else wb.sheetnames
 
     formulas = {}
@@ -72,8 +122,157 @@ def read_excel_formulas(file_path: str, sheet_name: str | None = None) -> dict[s
     return formulas
 
 
-def get_summary(file_path: str) -> str:
-    """生成 Excel 文件的文本摘要，适合发送给 LLM。"""
+def calculate_cells(
+    file_path: str,
+    sheet_name: str,
+    cell_range: str,
+    limit: int = 500,
+) -> dict[str, Any]:
+    """用原生公式引擎计算区域内单元格的值，写入公式后无需 LibreOffice 重算即可查看结果。
+
+    会话内首次调用时建立依赖图，之后只增量重算上次调用以来写入所影响的公式。
+
+    Returns:
+        {"A1": 值, ...}；公式单元格为计算结果，错误为 "#DIV/0!" 等错误码。
+        含原生引擎不支持的公式时返回 {"error": ...}。
+    """
+    try:
+        evaluator = live.calculate(file_path)
+    except UnsupportedFormula as e:
+        return {"error": f"原生公式引擎不支持: {e}；请用 skills/xlsx/scripts/recalc.py 重算后读取"}
+    sheet = evaluator.sheet_name(sheet_name, sheet_name)
+    if sheet not in evaluator.book:
+        raise ValueError(f"sheet 不存在: {sheet_name}")
+
+    ws = evaluator.book[sheet]
+    min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", "").upper())
+    values: dict[str, Any] = {}
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            if len(values) >= limit:
+                values["truncated"] = f"只返回前 {limit} 个单元格"
+                return values
+            key = (sheet, row, col)
+            value = evaluator.values.get(key) if key in evaluator.asts else ws.get(row, col)
+            if isinstance(value, XLError):
+                value = value.code
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            values[f"{get_column_letter(col)}{row}"] = value
+    return values
+
+
+def _open_read_only(file_path: str):
+    """以 openpyxl 只读模式打开（缓存值），不经过会话缓存。
+
+    会话内的 load_workbook 会忽略 read_only 并完整加载、缓存整个工作簿；
+    这里先把会话中未写回的修改刷到磁盘，再直接流式读取文件。
+    """
+    checkpoint(file_path)
+    return openpyxl.load_workbook(file_path, data_only=True, read_only=True)
+
+
+def _read_only_extent(ws) -> tuple[int, int]:
+    """只读工作表的 (数据末行, 末列)。
+
+    openpyxl 只读模式依据 <dimension> 元素给出 max_row / max_column，许多非 Excel 程序
+    写出的文件缺少该元素，此时两者为 None，需要逐行扫描一次。
+    """
+    if ws.max_row and ws.max_column:
+        return ws.max_row, ws.max_column
+    max_row = max_col = 0
+    for row in ws.iter_rows():
+        if row:
+            max_row = row[-1].row
+            max_col = max(max_col, row[-1].column)
+    return max_row, max_col
+
+
+def read_range(
+    file_path: str,
+    sheet_name: str,
+    cell_range: str,
+    limit: int = 2000,
+) -> dict[str, Any]:
+    """按 A1 区域分页读取单元格的值，以只读模式流式读取，大表只取需要的行。
+
+    Args:
+        cell_range: 如 "A2:F101"；整列 "A:F" 读到数据末行
+        limit: 单次最多返回的单元格数，超出时只返回前若干整行
+
+    Returns:
+        {"sheet", "range": 实际返回的区域, "rows": [[值, ...], ...],
+         "next_range": 下一页区域（已读完时不含此项）}；
+        起始行超出数据末行时 rows 为空，并附 "note" 说明
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    wb = _open_read_only(file_path)
+    try:
+        if sheet_name not in wb.sheetnames:
+            raise ValueError(f"sheet 不存在: {sheet_name}，可用: {wb.sheetnames}")
+        ws = wb[sheet_name]
+        min_col, min_row, max_col, max_row = range_boundaries(cell_range.replace("$", "").upper())
+        data_end, data_width = _read_only_extent(ws)
+        min_col, min_row = min_col or 1, min_row or 1
+        max_col = max_col or max(data_width, min_col)
+        requested_end = max_row or min_row
+        max_row = min(max_row or data_end, data_end)
+        first_col, last_col = get_column_letter(min_col), get_column_letter(max_col)
+        if min_row > max_row:
+            return {
+                "sheet": sheet_name,
+                "range": f"{first_col}{min_row}:{last_col}{requested_end}",
+                "rows": [],
+                "note": f"起始行超出数据末行（第 {data_end} 行），该区域没有数据",
+            }
+        width = max_col - min_col + 1
+        last = min(max_row, min_row + max(1, limit // width) - 1)
+
+        rows = [
+            list(row)
+            for row in ws.iter_rows(min_row=min_row, max_row=last, min_col=min_col, max_col=max_col, values_only=True)
+        ]
+    finally:
+        wb.close()
+
+    result: dict[str, Any] = {"sheet": sheet_name, "range": f"{first_col}{min_row}:{last_col}{last}", "rows": rows}
+    if last < max_row:
+        page_end = min(max_row, last + (last - min_row + 1))
+        result["next_range"] = f"{first_col}{last + 1}:{last_col}{page_end}"
+    return result
+
+
+def read_columnar(file_path: str, sheet_name: str | None = None) -> ColumnarWorkbook:
+    """读取为列式模型（缓存值 + 公式 + 样式编号），每个单元格只占十余字节。"""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+    checkpoint(file_path)
+    return ColumnarWorkbook.from_xlsx(file_path, [sheet_name] if sheet_name else None)
+
+
+# 超过该大小的文件默认使用流式摘要
+STREAMING_SIZE_THRESHOLD = 10 * 1024 * 1024
+DEFAULT_ROW_BUDGET = 100_000
+
+
+def get_summary(
+    file_path: str,
+    row_budget: int | None = None,
+    streaming: bool | None = None,
+) -> str:
+    """生成 Excel 文件的文本摘要，适合发送给 LLM。
+
+    Args:
+        row_budget: 流式模式下每个 sheet 最多扫描的数据行数
+        streaming: 是否使用流式模式；None 表示指定了 row_budget
+            或文件超过 STREAMING_SIZE_THRESHOLD 时自动启用
+    """
+    if streaming is None:
+        streaming = row_budget is not None or os.path.getsize(file_path) > STREAMING_SIZE_THRESHOLD
+    if streaming:
+        return _streaming_summary(file_path, row_budget or DEFAULT_ROW_BUDGET)
+
     info = read_excel(file_path)
     lines = [f"文件: {info['file']}", f"工作表: {', '.join(info['sheets'])}"]
 
@@ -92,3 +291,60 @@ def get_summary(file_path: str) -> str:
             lines.append(df[numeric_cols].describe().to_string())
 
     return "\n".join(lines)
+
+
+def _streaming_summary(file_path: str, row_budget: int, head_rows: int = 5) -> str:
+    """逐行扫描生成摘要，内存占用与 sheet 行数无关。
+
+    首行视为表头；只保留前 head_rows 行原始数据，其余行只更新每列的
+    类型计数与流式统计（见 tools.stats）。
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"文件不存在: {file_path}")
+
+    wb = _open_read_only(file_path)
+    lines = [f"文件: {os.path.basename(file_path)}", f"工作表: {', '.join(wb.sheetnames)}"]
+
+    for ws in wb.worksheets:
+        rows = ws.iter_rows(values_only=True)
+        header = list(next(rows, None) or [])
+        profiles = [ColumnProfile() for _ in header]
+        head: list[tuple] = []
+        scanned = 0
+        truncated = False
+
+        for row in rows:
+            if scanned >= row_budget:
+                truncated = True
+                break
+            if all(v is None for v in row):
+                continue
+            scanned += 1
+            if len(row) > len(profiles):
+                header.extend([None] * (len(row) - len(profiles)))
+                profiles.extend(ColumnProfile() for _ in range(len(row) - len(profiles)))
+            for profile, value in zip(profiles, row):
+                profile.add(value)
+            if len(head) < head_rows:
+                head.append(row)
+
+        names = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(header)]
+        total = f"约 {ws.max_row - 1} 行" if ws.max_row else "行数未知"
+        lines.append(f"\n--- {ws.title} ({total} x {len(names)}列，已扫描 {scanned} 行) ---")
+        if truncated:
+            lines.append(f"[已达到行数上限 row_budget={row_budget}，之后的行未统计]")
+        lines.append(f"列名: {', '.join(names)}")
+        lines.append("列类型: " + ", ".join(f"{n}={p.dtype}" for n, p in zip(names, profiles)))
+        if head:
+            lines.append(f"前{len(head)}行数据:")
+            width = len(names)
+            frame = pd.DataFrame([list(r[:width]) + [None] * (width - len(r)) for r in head], columns=names)
+            lines.append(frame.to_string(index=False))
+
+        numeric = {n: p.stats.describe() for n, p in zip(names, profiles) if p.stats.count}
+        if numeric:
+            lines.append(f"\n数值列统计 ({', '.join(numeric)}，分位数为抽样近似值):")
+            lines.append(pd.DataFrame(numeric).to_string())
+
+    wb.close()
+    return "\n".join(lines)
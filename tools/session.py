@@ -0,0 +1,215 @@
+"""工作簿会话缓存 — 在一次智能体运行内复用已加载的 openpyxl Workbook
+
+没有活动会话时，load_workbook / save_workbook 与直接调用 openpyxl 等价；
+在 workbook_session() 内，同一文件只解析一次，修改在内存中进行，
+直到 checkpoint() 或会话结束时才统一写回磁盘。
+
+用法:
+    with workbook_session():
+        write_cells(path, "Sheet1", [...])   # 只修改内存
+        apply_number_format(path, ...)       # 复用同一个 Workbook
+    # 退出时写回一次
+
+调度器在每个写入类工具执行前 checkpoint() 该文件，失败时调用 discard()
+丢弃缓存项：执行了一半的修改不会被写回，此前调用的修改已在磁盘上。
+"""
+
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+import openpyxl
+from openpyxl import Workbook
+
+
+def _stamp(path: str) -> tuple[int, int] | None:
+    """文件的 (mtime_ns, size)，用于判断磁盘内容是否被外部修改。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class _Entry:
+    __slots__ = ("wb", "stamp", "dirty")
+
+    def __init__(self, wb: Workbook, stamp: tuple[int, int] | None, dirty: bool = False):
+        self.wb = wb
+        self.stamp = stamp
+        self.dirty = dirty
+
+
+class WorkbookSession:
+    """按 (绝对路径, data_only) 缓存 Workbook，并记录哪些需要写回。
+
+    缓存项在加载时记录文件的 mtime/size；若磁盘文件被会话外修改
+    （例如 run_python 中的脚本），下一次加载会重新解析。
+    未写回的修改优先于磁盘内容。
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[str, bool], _Entry] = {}
+        # _lock 只保护字典本身；解析与保存这样的耗时操作只持有该文件的锁，
+        # 不同文件可以并发加载（dispatch_many 按文件分组并发执行）
+        self._lock = threading.Lock()
+        self._path_locks: dict[str, threading.RLock] = {}
+
+    def _path_lock(self, path: str) -> threading.RLock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.RLock()
+            return lock
+
+    def load(self, file_path: str, data_only: bool = False) -> Workbook:
+        path = os.path.abspath(file_path)
+        with self._path_lock(path):
+            if data_only:
+                # 值视图来自磁盘，先把同一文件未写回的修改刷出去
+                self._flush(path)
+
+            key = (path, data_only)
+            with self._lock:
+                entry = self._entries.get(key)
+            stamp = _stamp(path)
+            if entry is not None and (entry.dirty or entry.stamp == stamp):
+                return entry.wb
+
+            wb = openpyxl.load_workbook(path, data_only=data_only)
+            with self._lock:
+                self._entries[key] = _Entry(wb, stamp)
+            return wb
+
+    def save(self, wb: Workbook, file_path: str) -> None:
+        path = os.path.abspath(file_path)
+        with self._path_lock(path):
+            with self._lock:
+                entry = self._entries.get((path, False))
+                if entry is None or entry.wb is not wb:
+                    entry = _Entry(wb, None)
+                    self._entries[(path, False)] = entry
+                entry.dirty = True
+                # 值视图已过期
+                self._entries.pop((path, True), None)
+            if not os.path.exists(path):
+                # 新文件立即落盘，保证会话外的存在性检查仍然成立
+                self._flush(path)
+
+    def checkpoint(self, file_path: str | None = None) -> list[str]:
+        """把未写回的修改保存到磁盘，返回实际写入的文件路径。"""
+        if file_path is not None:
+            paths = [os.path.abspath(file_path)]
+        else:
+            with self._lock:
+                paths = [path for (path, data_only) in self._entries if not data_only]
+        flushed = []
+        for path in paths:
+            with self._path_lock(path):
+                if self._flush(path):
+                    flushed.append(path)
+        return flushed
+
+    def discard(self, file_path: str) -> bool:
+        """丢弃文件的缓存项（含未写回的修改），之后的加载重新读取磁盘内容。
+
+        工具执行到一半抛出异常时，缓存的 Workbook 可能只改了一部分；丢弃后这些修改
+        不会在 checkpoint() 或会话结束时被写回。返回是否有此前未写回的修改一并被丢弃。
+        """
+        path = os.path.abspath(file_path)
+        with self._path_lock(path), self._lock:
+            lost = False
+            for data_only in (False, True):
+                entry = self._entries.pop((path, data_only), None)
+                if entry is not None:
+                    lost = lost or entry.dirty
+                    entry.wb.close()
+            return lost
+
+    def close(self) -> list[str]:
+        """写回所有修改并清空缓存。"""
+        flushed = self.checkpoint()
+        with self._lock:
+            for entry in self._entries.values():
+                entry.wb.close()
+            self._entries.clear()
+        return flushed
+
+    def _flush(self, path: str) -> bool:
+        """写回一个文件的修改；调用方须持有该文件的锁。"""
+        with self._lock:
+            entry = self._entries.get((path, False))
+        if entry is None or not entry.dirty:
+            return False
+        entry.wb.save(path)
+        entry.stamp = _stamp(path)
+        entry.dirty = False
+        return True
+
+
+_current: contextvars.ContextVar[WorkbookSession | None] = contextvars.ContextVar(
+    "workbook_session", default=None
+)
+
+
+def current_session() -> WorkbookSession | None:
+    """当前上下文中的活动会话（没有则为 None）。"""
+    return _current.get()
+
+
+@contextmanager
+def workbook_session():
+    """开启工作簿会话；退出时把所有修改写回磁盘。
+
+    已有活动会话时直接复用外层会话，由外层负责写回。
+    """
+    session = _current.get()
+    if session is not None:
+        yield session
+        return
+
+    session = WorkbookSession()
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
+        session.close()
+
+
+def load_workbook(file_path: str, data_only: bool = False, read_only: bool = False) -> Workbook:
+    """加载工作簿；会话内返回缓存的实例。
+
+    read_only 只在没有会话时生效：会话内缓存的 Workbook 要被多次复用，
+    始终以完整模式加载。调用方不得修改 read_only=True 得到的工作簿。
+    """
+    session = _current.get()
+    if session is None:
+        return openpyxl.load_workbook(file_path, data_only=data_only, read_only=read_only)
+    return session.load(file_path, data_only=data_only)
+
+
+def save_workbook(wb: Workbook, file_path: str) -> None:
+    """保存工作簿；会话内只标记为待写回。"""
+    session = _current.get()
+    if session is None:
+        wb.save(file_path)
+    else:
+        session.save(wb, file_path)
+
+
+def checkpoint(file_path: str | None = None) -> list[str]:
+    """立即写回会话中未保存的修改（无会话时什么也不做）。"""
+    session = _current.get()
+    if session is None:
+        return []
+    return session.checkpoint(file_path)
+
+
+def discard(file_path: str) -> bool:
+    """丢弃会话中该文件的缓存项与未写回的修改（无会话时什么也不做）。"""
+    session = _current.get()
+    if session is None:
+        return False
+    return session.discard(file_path)
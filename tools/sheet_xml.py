@@ -0,0 +1,376 @@
+"""流式工作表 XML 读取 — 直接解析 xl/worksheets/sheetN.xml，不创建 openpyxl Cell 对象
+
+对大表而言，openpyxl 为每个单元格创建一个 Cell 对象，是读取阶段的主要开销。
+本模块用 iterparse 逐个 <c> 元素扫描，处理完一行立即清理，内存占用只与
+单行宽度和（按需加载的）共享字符串表有关。
+
+用法:
+    for row, col, value, formula, dtype in iter_cells("data.xlsx", "Sheet1"):
+        ...
+    df = read_frame("data.xlsx", "Sheet1")   # 与 pd.read_excel 结果一致
+
+dtype 与 openpyxl 的 data_type 含义相同: n 数值 / s 文本 / b 布尔 / e 错误 / d 日期。
+value 为缓存的计算结果（相当于 data_only=True），formula 为不带 "=" 的公式文本。
+"""
+
+import posixpath
+import re
+import zipfile
+from typing import Iterator
+
+import pandas as pd
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from pandas.io.parsers import TextParser
+
+try:
+    from lxml import etree
+    _LXML = True
+except ImportError:  # lxml 是可选依赖（office extra），没有时退回标准库
+    import xml.etree.ElementTree as etree
+    _LXML = False
+
+MAIN_NS = ("http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+           "http://purl.oclc.org/ooxml/spreadsheetml/main")
+REL_NS = ("http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+          "http://purl.oclc.org/ooxml/officeDocument/relationships")
+
+CellTuple = tuple[int, int, object, str | None, str]
+
+
+def _tags(local: str) -> set[str]:
+    return {f"{{{ns}}}{local}" for ns in MAIN_NS}
+
+
+_C, _ROW, _V, _F, _IS, _T = (_tags(t) for t in ("c", "row", "v", "f", "is", "t"))
+_SI, _R = _tags("si"), _tags("r")
+
+# <mergeCell ref="A1:B2"/>，可能带命名空间前缀
+_MERGE_REF = re.compile(rb"<(?:[\w.-]+:)?mergeCell\b[^>]*?\bref=\"([^\"]+)\"")
+_MERGE_OVERLAP = 512  # 跨块匹配时保留的尾部字节数，远大于单个 <mergeCell> 元素
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _cast_number(text: str) -> int | float:
+    """与 openpyxl 一致：含小数点或指数时为 float，否则为 int。"""
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+
+def _release(elem) -> None:
+    """清理已处理的元素，避免整棵树驻留内存。"""
+    elem.clear()
+    if _LXML:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def _string_text(elem) -> str:
+    """<si> / <is> 元素的纯文本（openpyxl Text.content）。
+
+    富文本由多个 <r><t> 组成；<rPh> 中的注音文本不计入。
+    """
+    parts = []
+    for child in elem:
+        if child.tag in _T:
+            parts.append(child.text or "")
+        elif child.tag in _R:
+            parts.extend(t.text or "" for t in child if t.tag in _T)
+    return "".join(parts)
+
+
+class _SharedStrings:
+    """按需增量解析的共享字符串表：只解析到被引用的最大下标为止。"""
+
+    def __init__(self, zf: zipfile.ZipFile, part: str | None):
+        self._items: list[str] = []
+        self._iter = self._parse(zf, part) if part else iter(())
+
+    @staticmethod
+    def _parse(zf: zipfile.ZipFile, part: str) -> Iterator[str]:
+        with zf.open(part) as f:
+            for _, elem in etree.iterparse(f, events=("end",)):
+                if elem.tag not in _SI:
+                    continue
+                # 与 openpyxl 的 read_string_table 相同：去掉 _x005F_ 转义中的 "x005F_"
+                yield _string_text(elem).replace("x005F_", "")
+                _release(elem)
+
+    def __getitem__(self, index: int) -> str:
+        while len(self._items) <= index:
+            self._items.append(next(self._iter))
+        return self._items[index]
+
+
+class WorkbookXml:
+    """xlsx 包的轻量视图：sheet 名称、部件路径、共享字符串与日期样式。"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.zf = zipfile.ZipFile(file_path)
+        self.sheets: dict[str, str] = {}
+        self.active = 0
+        self.epoch = CALENDAR_WINDOWS_1900
+        self._read_workbook()
+        self._shared: _SharedStrings | None = None
+        self._date_styles: tuple[set[int], set[int]] | None = None
+        self._stylesheet: Stylesheet | None = None
+
+    def close(self) -> None:
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def sheetnames(self) -> list[str]:
+        return list(self.sheets)
+
+    @property
+    def active_sheet(self) -> str:
+        names = self.sheetnames
+        return names[self.active] if 0 <= self.active < len(names) else names[0]
+
+    def _rels(self, part: str) -> dict[str, str]:
+        folder, name = posixpath.split(part)
+        rels_part = posixpath.join(folder, "_rels", f"{name}.rels")
+        if rels_part not in self.zf.namelist():
+            return {}
+        rels = {}
+        root = etree.fromstring(self.zf.read(rels_part))
+        for rel in root:
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            rels[rel.get("Id")] = target
+        return rels
+
+    def _workbook_part(self) -> str:
+        root = etree.fromstring(self.zf.read("_rels/.rels"))
+        for rel in root:
+            if rel.get("Type", "").endswith("/officeDocument"):
+                return rel.get("Target").lstrip("/")
+        return "xl/workbook.xml"
+
+    def _read_workbook(self) -> None:
+        part = self._workbook_part()
+        rels = self._rels(part)
+        root = etree.fromstring(self.zf.read(part))
+        for elem in root.iter():
+            name = _local(elem.tag) if isinstance(elem.tag, str) else ""
+            if name == "sheet":
+                rid = next((elem.get(f"{{{ns}}}id") for ns in REL_NS if elem.get(f"{{{ns}}}id")), None)
+                if rid in rels:
+                    self.sheets[elem.get("name")] = rels[rid]
+            elif name == "workbookView":
+                self.active = int(elem.get("activeTab", 0))
+            elif name == "workbookPr" and elem.get("date1904") in ("1", "true"):
+                self.epoch = CALENDAR_MAC_1904
+        self._workbook_rels = rels
+
+    def _find_part(self, suffix: str) -> str | None:
+        for target in self._workbook_rels.values():
+            if target.endswith(suffix):
+                return target
+        return None
+
+    @property
+    def shared_strings(self) -> _SharedStrings:
+        if self._shared is None:
+            self._shared = _SharedStrings(self.zf, self._find_part("sharedStrings.xml"))
+        return self._shared
+
+    @property
+    def date_styles(self) -> tuple[set[int], set[int]]:
+        """(日期样式下标集合, 时长样式下标集合)，按 openpyxl 的规则判定。"""
+        if self._date_styles is None:
+            dates, deltas = set(), set()
+            part = self._find_part("styles.xml")
+            if part:
+                root = etree.fromstring(self.zf.read(part))
+                custom = {}
+                xfs = []
+                for elem in root:
+                    name = _local(elem.tag) if isinstance(elem.tag, str) else ""
+                    if name == "numFmts":
+                        custom = {int(n.get("numFmtId")): n.get("formatCode") for n in elem}
+                    elif name == "cellXfs":
+                        xfs = [int(xf.get("numFmtId", 0)) for xf in elem]
+                for idx, fmt_id in enumerate(xfs):
+                    fmt = custom.get(fmt_id) or builtin_format_code(fmt_id)
+                    if fmt and is_date_format(fmt):
+                        dates.add(idx)
+                    if fmt and is_timedelta_format(fmt):
+                        deltas.add(idx)
+            self._date_styles = (dates, deltas)
+        return self._date_styles
+
+    @property
+    def stylesheet(self) -> Stylesheet | None:
+        """openpyxl 解析的样式表（fonts / fills / cell_styles 等），没有 styles.xml 时为 None。"""
+        if self._stylesheet is None:
+            part = self._find_part("styles.xml")
+            if part:
+                self._stylesheet = Stylesheet.from_tree(etree.fromstring(self.zf.read(part)))
+        return self._stylesheet
+
+    def merged_cells(self, sheet_name: str) -> list[str]:
+        """sheet 的合并区域（如 "A1:B2"）。
+
+        <mergeCells> 位于 <sheetData> 之后，需要把整个部件解压一遍，但只做字节匹配、不解析 XML。
+        """
+        refs = []
+        tail = b""
+        with self.zf.open(self.sheets[sheet_name]) as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                data = tail + block
+                cut = max(0, len(data) - _MERGE_OVERLAP)
+                # 起点落在保留尾部中的匹配留到下一块（可能不完整）
+                refs.extend(m.group(1).decode() for m in _MERGE_REF.finditer(data) if m.start() < cut)
+                tail = data[cut:]
+        refs.extend(m.group(1).decode() for m in _MERGE_REF.finditer(tail))
+        return refs
+
+    def iter_cells(self, sheet_name: str) -> Iterator[CellTuple]:
+        """逐个产出 (row, col, value, formula, dtype)，行列从 1 开始。"""
+        for cell in self.iter_styled_cells(sheet_name):
+            yield cell[:5]
+
+    def iter_styled_cells(
+        self, sheet_name: str, keep_styled: bool = False
+    ) -> Iterator[tuple[int, int, object, str | None, str, int]]:
+        """同 iter_cells，额外产出样式下标（styles.xml 中 cellXfs 的序号）。
+
+        keep_styled 为 True 时也产出没有值、但带非默认样式的单元格（如只有填充色的空单元格）。
+        """
+        part = self.sheets[sheet_name]
+        shared = self.shared_strings
+        dates, deltas = self.date_styles
+        masters: dict[str, tuple[str, str]] = {}
+        row_idx = 0
+        col_idx = 0
+
+        with self.zf.open(part) as f:
+            for event, elem in etree.iterparse(f, events=("start", "end")):
+                tag = elem.tag
+                if tag in _ROW:
+                    if event == "start":
+                        # r 属性可省略，此时行号依次递增
+                        row_idx = int(elem.get("r") or row_idx + 1)
+                        col_idx = 0
+                    else:
+                        _release(elem)
+                    continue
+                if event == "start" or tag not in _C:
+                    continue
+
+                ref = elem.get("r")
+                if ref:
+                    row_idx, col_idx = coordinate_to_tuple(ref)
+                else:
+                    col_idx += 1
+                    ref = f"{get_column_letter(col_idx)}{row_idx}"
+
+                dtype = elem.get("t", "n")
+                style = int(elem.get("s", 0))
+                text = None
+                formula = None
+                f_elem = None
+                for child in elem:
+                    if child.tag in _V:
+                        text = child.text
+                    elif child.tag in _F:
+                        f_elem = child
+                    elif child.tag in _IS:
+                        text = _string_text(child)
+
+                if f_elem is not None:
+                    formula = f_elem.text
+                    si = f_elem.get("si")
+                    if f_elem.get("t") == "shared" and si is not None:
+                        if formula:
+                            masters[si] = (formula, ref)
+                        elif si in masters:
+                            origin_formula, origin = masters[si]
+                            formula = Translator(f"={origin_formula}", origin).translate_formula(ref)[1:]
+
+                value = None
+                if text is not None and (text != "" or dtype in ("s", "str", "inlineStr")):
+                    if dtype == "n":
+                        value = _cast_number(text)
+                        if style in dates:
+                            dtype = "d"
+                            try:
+                                value = from_excel(value, self.epoch, timedelta=style in deltas)
+                            except (OverflowError, ValueError):
+                                dtype, value = "e", "#VALUE!"
+                    elif dtype == "s":
+                        value = shared[int(text)]
+                    elif dtype == "b":
+                        value = bool(int(text))
+                    elif dtype in ("str", "inlineStr"):
+                        dtype, value = "s", text
+                    elif dtype == "d":
+                        value = from_ISO8601(text)
+                    else:
+                        value = text
+                elif dtype in ("str", "inlineStr"):
+                    dtype = "s"
+
+                if value is not None or formula or (keep_styled and style):
+                    yield row_idx, col_idx, value, formula, dtype, style
+
+
+def iter_cells(file_path: str, sheet_name: str | None = None) -> Iterator[CellTuple]:
+    """流式产出某个 sheet（默认活动 sheet）的非空单元格。"""
+    with WorkbookXml(file_path) as book:
+        yield from book.iter_cells(sheet_name or book.active_sheet)
+
+
+def _sheet_grid(book: WorkbookXml, sheet_name: str) -> list[list]:
+    """按 pandas openpyxl 引擎的规则生成二维数据（空单元格为 ""）。"""
+    data: list[list] = []
+    for row, col, value, _, dtype in book.iter_cells(sheet_name):
+        if value is None or value == "":
+            continue
+        if dtype == "e":
+            value = float("nan")
+        elif dtype == "n" and value == int(value):
+            value = int(value)
+        while len(data) < row:
+            data.append([])
+        cells = data[row - 1]
+        if len(cells) < col:
+            cells.extend([""] * (col - len(cells)))
+        cells[col - 1] = value
+
+    if data:
+        width = max(len(r) for r in data)
+        for r in data:
+            if len(r) < width:
+                r.extend([""] * (width - len(r)))
+    return data
+
+
+def read_frame(file_path: str, sheet_name: str | None = None, book: WorkbookXml | None = None) -> pd.DataFrame:
+    """读取单个 sheet 为 DataFrame，结果与 pd.read_excel(header=0) 一致。"""
+    if book is None:
+        with WorkbookXml(file_path) as own:
+            return read_frame(file_path, sheet_name, own)
+    data = _sheet_grid(book, sheet_name or book.active_sheet)
+    if not data:
+        return pd.DataFrame()
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
@@ -0,0 +1,118 @@
+"""有界内存的流式统计 — 供大表摘要使用"""
+
+import math
+import random
+from datetime import date, datetime, time
+
+
+class RunningStats:
+    """单列数值的流式统计。
+
+    count/mean/std/min/max 使用 Welford 算法精确计算；
+    分位数来自固定大小的水塘抽样，内存占用与行数无关。
+    """
+
+    __slots__ = ("count", "mean", "_m2", "min", "max", "_sample", "_size", "_rng")
+
+    def __init__(self, sample_size: int = 2048, seed: int = 0):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._sample: list[float] = []
+        self._size = sample_size
+        self._rng = random.Random(seed)
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+        if len(self._sample) < self._size:
+            self._sample.append(x)
+        else:
+            j = self._rng.randrange(self.count)
+            if j < self._size:
+                self._sample[j] = x
+
+    @property
+    def std(self) -> float:
+        """样本标准差（与 pandas 一致，ddof=1）。"""
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(self._m2 / (self.count - 1))
+
+    def quantile(self, q: float) -> float:
+        """近似分位数（线性插值，样本未满时为精确值）。"""
+        if not self._sample:
+            return math.nan
+        data = sorted(self._sample)
+        pos = (len(data) - 1) * q
+        lo = math.floor(pos)
+        hi = min(lo + 1, len(data) - 1)
+        return data[lo] + (data[hi] - data[lo]) * (pos - lo)
+
+    def describe(self) -> dict[str, float]:
+        """与 DataFrame.describe() 相同的统计项。"""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "25%": self.quantile(0.25),
+            "50%": self.quantile(0.5),
+            "75%": self.quantile(0.75),
+            "max": self.max,
+        }
+
+
+def value_kind(value) -> str | None:
+    """单元格值的类别：number / text / datetime / bool，空值返回 None。"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, (datetime, date, time)):
+        return "datetime"
+    return "text"
+
+
+class ColumnProfile:
+    """单列的类型计数与数值统计。"""
+
+    __slots__ = ("kinds", "stats")
+
+    def __init__(self):
+        self.kinds: dict[str, int] = {}
+        self.stats = RunningStats()
+
+    def add(self, value) -> None:
+        kind = value_kind(value)
+        if kind is None:
+            return
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        if kind == "number" and not (isinstance(value, float) and math.isnan(value)):
+            self.stats.add(value)
+
+    @property
+    def dtype(self) -> str:
+        """主类型；不同类别混杂时为 mixed，没有值时为 empty。"""
+        if not self.kinds:
+            return "empty"
+        if len(self.kinds) == 1:
+            return next(iter(self.kinds))
+        return "mixed"
+
+    @property
+    def non_null(self) -> int:
+        return sum(self.kinds.values())
@@ -3,7 +3,13 @@
 import os
 
 import openpyxl
+from openpyxl.formula.translate import Translator, TranslatorError
 from openpyxl.styles import Alignment, Font, PatternFill, numbers
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple, get_column_letter, range_boundaries
+
+from tools.columnar import ColumnarSheet
+from tools.formula import live
+from tools.session import load_workbook, save_workbook
 
 
 # 金融模型色彩规范
@@ -38,38 +44,243 @@ def create_workbook(file_path: str, sheets: dict[str, list[list]]) -> str:
         for row_data in rows:
             ws.append(row_data)
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
 
 
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+
+class FillTranslator(Translator):
+    """Excel 填充柄语义的公式平移。
+
+    与 openpyxl Translator 相同：相对引用随目标单元格平移，带 $ 的部分保持不变，
+    跨 sheet 引用、区域、整行/整列引用都按同样规则处理。不同之处在于平移后
+    超出工作表边界的引用会像 Excel 一样变为 #REF!，而不是抛出异常。
+    """
+
+    @classmethod
+    def translate_range(cls, range_str, rdelta, cdelta):
+        try:
+            shifted = super().translate_range(range_str, rdelta, cdelta)
+        except TranslatorError:
+            return "#REF!"
+        if "#REF!" in shifted or cls._out_of_bounds(shifted):
+            return "#REF!"
+        return shifted
+
+    @classmethod
+    def _out_of_bounds(cls, ref: str) -> bool:
+        _, ref = cls.strip_ws_name(ref)
+        for piece in ref.split(":"):
+            piece = piece.replace("$", "")
+            match = cls.CELL_REF_RE.match(piece)
+            if match is not None:
+                col, row = match.group(1), match.group(2)
+            elif piece.isdigit():
+                col, row = None, piece
+            elif piece.isalpha() and len(piece) <= 3:
+                col, row = piece, None
+            else:
+                continue  # 命名区域
+            if row is not None and int(row) > MAX_ROW:
+                return True
+            if col is not None and column_index_from_string(col.upper()) > MAX_COLUMN:
+                return True
+        return False
+
+
+def _fill_rows(formula: str, anchor: str, min_row: int, min_col: int, max_row: int, max_col: int) -> list[list[str]]:
+    """把 anchor 处的公式平移到区域内每个单元格，返回二维公式数组。"""
+    translator = FillTranslator(formula, anchor)
+    anchor_row, anchor_col = coordinate_to_tuple(anchor)
+    return [
+        [translator.translate_formula(row_delta=r - anchor_row, col_delta=c - anchor_col)
+         for c in range(min_col, max_col + 1)]
+        for r in range(min_row, max_row + 1)
+    ]
+
+
+def _apply_style(cell, style: str) -> None:
+    if style == "input":
+        cell.font = STYLE_INPUT
+    elif style == "formula":
+        cell.font = STYLE_FORMULA
+    elif style == "assumption":
+        cell.font = STYLE_INPUT
+        cell.fill = FILL_ASSUMPTION
+
+
+def _bounds(ref: str) -> tuple[int, int, int, int]:
+    """区域的 (min_col, min_row, max_col, max_row)；无效地址或整行/整列这样的开放区域抛出 ValueError。"""
+    try:
+        bounds = range_boundaries(ref.replace("$", "").upper())
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError(f"无效的单元格区域: {ref!r}") from None
+    if None in bounds:
+        raise ValueError(f"区域 {ref} 不是有界区域，写入时须写明起止行列（如 A1:A100），不支持 A:A、1:1")
+    min_col, min_row, max_col, max_row = bounds
+    if max_row > MAX_ROW or max_col > MAX_COLUMN:
+        raise ValueError(f"区域 {ref} 超出工作表范围")
+    return bounds
+
+
+def _block_values(item: dict) -> tuple[int, int, list[list]]:
+    """把一个区域写入项展开为 (起始行, 起始列, 二维值数组)，形状不符时抛出 ValueError。
+
+    支持:
+        {"range": "B2:F100", "values": [[...], ...]}  二维数组，行列数须与区域一致
+        {"range": "B2", "values": [[...], ...]}       只给左上角，区域大小由数组决定
+        {"range": "B2:B100", "values": [...]}         一维数组：单行区域横向写，否则纵向写
+        {"range": "D2:D100", "formula": "=B2*C2"}     公式模板，按 Excel 填充规则平移相对引用
+    """
+    ref = item["range"]
+    min_col, min_row, max_col, max_row = _bounds(ref)
+
+    if "formula" in item:
+        template = item["formula"]
+        if not (isinstance(template, str) and template.startswith("=")):
+            # 非公式模板：整个区域填同一个值
+            return min_row, min_col, [[template] * (max_col - min_col + 1)] * (max_row - min_row + 1)
+        anchor = f"{get_column_letter(min_col)}{min_row}"
+        return min_row, min_col, _fill_rows(template, anchor, min_row, min_col, max_row, max_col)
+
+    if "values" not in item:
+        raise ValueError(f"区域 {ref} 的写入项缺少 values 或 formula")
+    values = item["values"]
+    if not isinstance(values, (list, tuple)):
+        raise ValueError(f"区域 {ref} 的 values 须为数组")
+    if values and not isinstance(values[0], (list, tuple)):
+        if ":" in ref and min_row == max_row and max_col > min_col:
+            values = [list(values)]
+        else:
+            values = [[v] for v in values]
+
+    widths = {len(r) if isinstance(r, (list, tuple)) else -1 for r in values}
+    if len(widths) > 1 or -1 in widths:
+        raise ValueError(f"区域 {ref} 的 values 每一行须为长度相同的数组")
+    actual = (len(values), widths.pop() if widths else 0)
+    if ":" in ref:
+        expected = (max_row - min_row + 1, max_col - min_col + 1)
+        if actual != expected:
+            raise ValueError(f"区域 {ref} 为 {expected[0]}x{expected[1]}，但 values 为 {actual[0]}x{actual[1]}")
+    elif min_row + actual[0] - 1 > MAX_ROW or min_col + actual[1] - 1 > MAX_COLUMN:
+        raise ValueError(f"从 {ref} 开始的 {actual[0]}x{actual[1]} 区域超出工作表范围")
+    return min_row, min_col, values
+
+
+def _resolve_items(cells: list[dict]) -> list[tuple[int, int, list[list], str]]:
+    """校验并展开全部写入项为 [(起始行, 起始列, 二维值数组, 样式)]；任一项无效时抛出 ValueError。"""
+    blocks = []
+    for i, item in enumerate(cells, start=1):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("写入项须为对象")
+            if "range" in item:
+                min_row, min_col, rows = _block_values(item)
+            elif "cell" in item:
+                if "value" not in item:
+                    raise ValueError(f"单元格 {item['cell']} 的写入项缺少 value")
+                min_col, min_row, max_col, max_row = _bounds(str(item["cell"]))
+                if (min_col, min_row) != (max_col, max_row):
+                    raise ValueError(f"{item['cell']} 不是单个单元格，区域请使用 range")
+                rows = [[item["value"]]]
+            else:
+                raise ValueError("写入项须包含 cell 或 range")
+        except ValueError as e:
+            raise ValueError(f"第 {i} 个写入项无效，未写入任何单元格: {e}") from None
+        blocks.append((min_row, min_col, rows, item.get("style", "")))
+    return blocks
+
+
 def write_cells(file_path: str, sheet_name: str, cells: list[dict]) -> str:
-    """写入单元格数据。
+    """写入单元格数据，所有写入项一次完成并只保存一次。
+
+    先校验并展开全部写入项（地址、区域形状），任一项无效时抛出 ValueError，不写入任何单元格。
 
     Args:
-        cells: [{"cell": "A1", "value": xxx, "style": "input|formula|assumption"}, ...]
+        cells: 写入项列表，每项为以下形式之一（均可带 "style": "input|formula|assumption"）:
+            {"cell": "A1", "value": xxx}
+            {"range": "B2:F100", "values": [[...], ...]}   矩形区域（二维数组）
+            {"range": "B2:B100", "values": [...]}          列向量（单行区域时为行向量）
+            {"range": "D2:D100", "formula": "=B2*C2"}      公式向下/向右填充，相对引用自动平移
     """
+    blocks = _resolve_items(cells)
+
     if os.path.exists(file_path):
-        wb = openpyxl.load_workbook(file_path)
+        wb = load_workbook(file_path)
     else:
         wb = openpyxl.Workbook()
 
     ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.create_sheet(title=sheet_name)
 
-    for item in cells:
-        cell = ws[item["cell"]]
-        cell.value = item["value"]
+    changes = {}
+    try:
+        for min_row, min_col, rows, style in blocks:
+            for r, row_values in enumerate(rows, start=min_row):
+                for c, value in enumerate(row_values, start=min_col):
+                    cell = ws.cell(row=r, column=c)
+                    cell.value = value
+                    changes[(r, c)] = cell.value
+                    if style:
+                        _apply_style(cell, style)
+    finally:
+        # 即使中途失败（如非法字符），已改动的单元格也要同步给增量计算模型
+        live.notify(file_path, ws.title, changes)
+    save_workbook(wb, file_path)
+    wb.close()
+    return file_path
+
+
+def fill_formula(
+    file_path: str,
+    sheet_name: str,
+    target_range: str,
+    formula: str | None = None,
+    anchor: str | None = None,
+    style: str = "formula",
+) -> str:
+    """像 Excel 填充柄一样把一个公式填充到整个区域。
 
-        style = item.get("style", "")
-        if style == "input":
-            cell.font = STYLE_INPUT
-        elif style == "formula":
-            cell.font = STYLE_FORMULA
-        elif style == "assumption":
-            cell.font = STYLE_INPUT
-            cell.fill = FILL_ASSUMPTION
+    Args:
+        target_range: 目标区域，如 "D2:D500"（向下填充）或 "D2:H2"（向右填充）
+        formula: 锚点公式，如 "=B2*C2"；省略时使用 anchor 单元格中已有的公式
+        anchor: 公式所在（或视为所在）的单元格，默认为 target_range 左上角
+        style: input|formula|assumption，空字符串表示不改样式
+
+    示例:
+        fill_formula(path, "Sheet1", "D2:D500", "=B2*C2")
+        → D3 为 =B3*C3，D500 为 =B500*C500；$A$1 这样的绝对引用保持不变
+    """
+    # 与 write_cells 使用同一套区域校验，先于加载工作簿
+    min_col, min_row, max_col, max_row = _bounds(target_range)
+    anchor = (anchor or f"{get_column_letter(min_col)}{min_row}").replace("$", "").upper()
+    anchor_col, anchor_row, anchor_max_col, anchor_max_row = _bounds(anchor)
+    if (anchor_col, anchor_row) != (anchor_max_col, anchor_max_row):
+        raise ValueError(f"anchor 须为单个单元格: {anchor}")
 
-    wb.save(file_path)
+    wb = load_workbook(file_path)
+    ws = wb[sheet_name]
+    if formula is None:
+        formula = ws[anchor].value
+    if not (isinstance(formula, str) and formula.startswith("=")):
+        raise ValueError(f"{anchor} 处没有可填充的公式: {formula!r}")
+
+    rows = _fill_rows(formula, anchor, min_row, min_col, max_row, max_col)
+    changes = {}
+    try:
+        for r, row_formulas in enumerate(rows, start=min_row):
+            for c, value in enumerate(row_formulas, start=min_col):
+                cell = ws.cell(row=r, column=c)
+                cell.value = value
+                changes[(r, c)] = value
+                if style:
+                    _apply_style(cell, style)
+    finally:
+        live.notify(file_path, ws.title, changes)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
 
@@ -80,13 +291,13 @@ def set_column_widths(file_path: str, sheet_name: str, widths: dict[str, int]) -
     Args:
         widths: {"A": 15, "B": 20, ...}
     """
-    wb = openpyxl.load_workbook(file_path)
+    wb = load_workbook(file_path)
     ws = wb[sheet_name]
 
     for col, width in widths.items():
         ws.column_dimensions[col].width = width
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path
 
@@ -103,7 +314,7 @@ def apply_number_format(file_path: str, sheet_name: str, formats: list[dict]) ->
         - 负数括号: '#,##0.00;(#,##0.00)'
         - 零显示为横线: '#,##0.00;(#,##0.00);"-"'
     """
-    wb = openpyxl.load_workbook(file_path)
+    wb = load_workbook(file_path)
     ws = wb[sheet_name]
 
     for fmt in formats:
@@ -111,6 +322,36 @@ def apply_number_format(file_path: str, sheet_name: str, formats: list[dict]) ->
             for cell in row:
                 cell.number_format = fmt["format"]
 
-    wb.save(file_path)
+    save_workbook(wb, file_path)
+    wb.close()
+    return file_path
+
+
+def write_columnar(file_path: str, sheet: ColumnarSheet, sheet_name: str | None = None) -> str:
+    """把列式 sheet 的值与公式写入 Excel（公式优先于缓存值）。
+
+    Args:
+        sheet: tools.columnar.ColumnarSheet
+        sheet_name: 目标 sheet，默认与 sheet.title 相同，不存在时新建
+    """
+    if os.path.exists(file_path):
+        wb = load_workbook(file_path)
+    else:
+        wb = openpyxl.Workbook()
+        wb.active.title = sheet_name or sheet.title
+
+    name = sheet_name or sheet.title
+    ws = wb[name] if name in wb.sheetnames else wb.create_sheet(title=name)
+
+    changes = {}
+    for col in range(1, sheet.max_column + 1):
+        for row, value in enumerate(sheet.column_values(col), start=1):
+            if value is not None:
+                changes[(row, col)] = ws.cell(row=row, column=col, value=value).value
+    for row, col in sheet.formulas:
+        changes[(row, col)] = ws.cell(row=row, column=col, value=sheet.formula(row, col)).value
+
+    live.notify(file_path, name, changes)
+    save_workbook(wb, file_path)
     wb.close()
     return file_path